@@ -15,7 +15,9 @@ class Args:
     def __init__(self, description):
         self.parser = argparse.ArgumentParser(description=description)
         self.parser.add_argument(
-            "--input", default="0", help="Manually set the input device."
+            "--input",
+            default="0",
+            help="Manually set the input device - use screen or screen:<monitor> to capture the screen or a directory for a sequence of still images",
         )
         self.parser.add_argument(
             "--autowarp",
@@ -23,14 +25,56 @@ class Args:
             help="automatically find and warp chessboard",
         )
 
+        self.parser.add_argument(
+            "--autospeedup",
+            action="store_true",
+            help="adapt the detection speedup to the processing time per frame and the frames per second of the video",
+        )
+
         self.parser.add_argument("--black", default=None, help="PGN Black header")
 
+        self.parser.add_argument(
+            "--bufferpolicy",
+            default=None,
+            choices=["drop", "block"],
+            help="policy for a full capture ring buffer - default: drop oldest frames for cameras, block for files",
+        )
+
+        self.parser.add_argument(
+            "--buffersize",
+            type=int,
+            default=4,
+            help="number of frames in the ring buffer of the threaded capture",
+        )
+
+        self.parser.add_argument(
+            "--codec",
+            default="XVID",
+            help="four character code of the codec for recording videos",
+        )
+
+        self.parser.add_argument(
+            "--container",
+            default="avi",
+            help="container format (file extension) for recording videos",
+        )
+
+        self.parser.add_argument(
+            "--crop",
+            type=int,
+            nargs="?",
+            const=16,
+            default=None,
+            help="only process the bounding rectangle of the warp points plus the given margin in pixels",
+        )
         self.parser.add_argument(
             "--debug", action="store_true", help="show debug output"
         )
 
         self.parser.add_argument(
-            "--detector", default="simple8x8", help="move detector to be used"
+            "--detector",
+            default="simple8x8",
+            help="move detector to be used: simple8x8, luminance or trapezoid",
         )
 
         self.parser.add_argument("--event", default=None, help="PGN Event header")
@@ -39,6 +83,20 @@ class Args:
             "--fen", default=None, help="Forsyth–Edwards Notation to start with"
         )
 
+        self.parser.add_argument(
+            "--framecache",
+            nargs="?",
+            const="",
+            default=None,
+            help="read the frames of a video file from a decode once cache in the given directory - warped and rotated if warp points are given",
+        )
+        self.parser.add_argument(
+            "--framepool",
+            type=int,
+            default=0,
+            help="number of preallocated frame buffers to recycle while capturing - 0 disables the frame pool",
+        )
+
         self.parser.add_argument("--game", default=None, help="game to initialize with")
 
         self.parser.add_argument(
@@ -55,8 +113,33 @@ class Args:
             help="chessboard vision is already squared e.g. recorded that way",
         )
 
+        self.parser.add_argument(
+            "--prefetch",
+            type=int,
+            default=8,
+            help="number of still images to decode ahead when the input is a directory",
+        )
+        self.parser.add_argument(
+            "--pyramid",
+            action="store_true",
+            help="find the chessboard in the downscaled image only and refine its corners in the full size image",
+        )
+        self.parser.add_argument(
+            "--recordpolicy",
+            default=None,
+            choices=["drop", "block"],
+            help="policy for a full recording queue - default: drop frames for cameras, block for files",
+        )
+
         self.parser.add_argument("--round", default=None, help="PGN Round header")
 
+        self.parser.add_argument(
+            "--reduce",
+            type=int,
+            default=1,
+            choices=[1, 2, 4, 8],
+            help="downscale still images by the given factor while decoding",
+        )
         self.parser.add_argument(
             "--rotation",
             type=int,
@@ -64,6 +147,12 @@ class Args:
             help="rotation of chessboard 0,90,180 or 270",
         )
 
+        self.parser.add_argument(
+            "--screenfps",
+            type=float,
+            default=30,
+            help="maximum frames per second when capturing the screen",
+        )
         self.parser.add_argument("--site", default=None, help="PGN Site header")
 
         self.parser.add_argument(
@@ -73,15 +162,39 @@ class Args:
             help="video frame at which to start detection",
         )
 
+        self.parser.add_argument(
+            "--starttime",
+            type=float,
+            default=0,
+            help="video time in seconds at which to start detection",
+        )
+
         self.parser.add_argument(
             "--speedup",
             type=int,
             default=1,
-            help="detection speedup - higher speedup means less precision",
+            help="detection speedup - higher speedup means less precision - skipped frames are not decoded",
+        )
+
+        self.parser.add_argument(
+            "--threaded",
+            action="store_true",
+            help="capture frames in a separate thread",
+        )
+
+        self.parser.add_argument(
+            "--track",
+            action="store_true",
+            help="track the chessboard with optical flow from frame to frame and only search it again if it has been lost",
         )
 
         self.parser.add_argument("--white", default=None, help="PGN White header")
 
+        self.parser.add_argument(
+            "--undistort",
+            action="store_true",
+            help="correct the lens distortion while warping using the calibration of the input device - see pcwawc.calibration",
+        )
         self.parser.add_argument("--warp", default="[]", help="warp points")
 
         self.parser.add_argument(
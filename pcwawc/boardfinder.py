@@ -5,6 +5,9 @@
 # </uml>
 
 import math
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from timeit import default_timer as timer
 
 import chess
@@ -60,13 +63,19 @@ class Corners(object):
         #    self.corners[i]=val
         pass
 
-    def findPattern(self, image):
-        """try finding the chess board corners in the given image with the given pattern"""
+    def findPattern(self, image, flags=None):
+        """try finding the chess board corners in the given image with the given pattern and optional OpenCV flags"""
         self.h, self.w = image.shape[:2]
 
         start = timer()
-        ret, self.corners = cv2.findChessboardCorners(image, self.pattern, None)
+        if flags is None:
+            ret, self.corners = cv2.findChessboardCorners(image, self.pattern, None)
+        else:
+            ret, self.corners = cv2.findChessboardCorners(
+                image, self.pattern, None, flags
+            )
         end = timer()
+        self.time = end - start
         if Corners.debug:
             print(
                 "%dx%d in %dx%d after %.3f s: %s"
@@ -81,6 +90,26 @@ class Corners(object):
             )
         return ret
 
+    def refine(self, image, criteria, scale=(1.0, 1.0)):
+        """refine my corners found in an image scaled by the given x and y factors to sub pixel accuracy in the given full size image"""
+        start = timer()
+        self.h, self.w = image.shape[:2]
+        scale = np.asarray(scale, np.float32)
+        corners = self.corners * scale
+        # the window has to cover the uncertainty of the scaled corners but must not reach the neighbouring corners
+        spacing = np.median(
+            np.linalg.norm(np.diff(corners.reshape(-1, 2), axis=0), axis=1)
+        )
+        win = int(max(3, min(math.ceil(2 * scale.max()), spacing / 4)))
+        self.corners = cv2.cornerSubPix(image, corners, (win, win), (-1, -1), criteria)
+        end = timer()
+        self.time = end - start
+        if Corners.debug:
+            print(
+                "%dx%d refined in %dx%d with %dx%d window after %.3f s"
+                % (self.rows, self.cols, self.w, self.h, win, win, (end - start))
+            )
+
     def safeXY(self, x, y, dx, dy):
         """return the given x,y tuple shifted by dx,dy making sure the result is not out of my width and height bounds"""
         x = x + dx
@@ -209,16 +238,27 @@ class BoardFinder(object):
     white = (255, 255, 255)
     darkGrey = (256 // 3, 256 // 3, 256 / 3)
     lightGrey = (256 * 2 // 3, 256 * 2 // 3, 256 * 2 // 3)
-
-    def __init__(self, image, video=None):
-        """construct me from the given input image"""
+    # number of threads to search the patterns with - None for one per pattern up to the number of cpus
+    maxWorkers = None
+    # find the patterns in the downscaled image only and refine the corners in the full size image
+    # instead of searching the full size image again
+    pyramid = False
+    subPixCriteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.01)
+    # range of the color histograms - black pixels are not counted just like the zeroed pixels of a masked image
+    histRange = (1, 256)
+
+    def __init__(self, image, video=None, pyramid=None):
+        """construct me from the given input image - the pyramid mode defaults to BoardFinder.pyramid"""
         if video is None:
             video = Video()
         self.video = video
+        self.pyramid = BoardFinder.pyramid if pyramid is None else pyramid
         self.image = image
         # guess the topleft color
         self.topleft = chess.WHITE
         self.height, self.width = self.image.shape[:2]
+        # thread pool of the running findCorners call
+        self.executor = None
 
     @staticmethod
     def centerXY(xylist):
@@ -263,22 +303,110 @@ class BoardFinder(object):
         return gray, fullSizeGray
 
     def findCorners(self, image, limit=1, searchWidth=640):
-        """start finding the chessboard with the given limit and the given maximum width of the search image"""
+        """start finding the chessboard with the given limit and the given maximum width of the search image
+
+        the patterns are checked with the fast check of OpenCV and searched concurrently - OpenCV releases the GIL - the
+        patterns passing the fast check are started first but the patterns found are picked in the order of
+        Corners.genChessPatterns so the result is the same as searching one pattern after another
+        """
         startt = timer()
         gray, fullSizeGray = self.preparefindCorners(image, searchWidth)
         self.found = {}
-        for chesspattern in Corners.genChessPatterns():
-            corners = Corners(chesspattern, self.video)
-            if corners.findPattern(gray) and corners.findPattern(fullSizeGray):
-                corners.sort()
-                self.found[chesspattern] = corners
-            if len(self.found) >= limit:
-                break
+        self.timings = {}
+        patterns = list(Corners.genChessPatterns())
+        maxWorkers = BoardFinder.maxWorkers
+        if maxWorkers is None:
+            maxWorkers = min(len(patterns), os.cpu_count() or 1)
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(1, maxWorkers), thread_name_prefix="BoardFinder"
+        )
+        try:
+            candidates = self.checkPatterns(gray, patterns)
+            self.searchPatterns(patterns, candidates, gray, fullSizeGray, limit)
+        finally:
+            # wait for the searches still running so that no worker outlives this call
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
         endt = timer()
         if BoardFinder.debug:
+            for pattern, timings in self.timings.items():
+                print(
+                    "%dx%d: %s"
+                    % (
+                        pattern[0],
+                        pattern[1],
+                        " + ".join("%.3f s" % time for time in timings),
+                    )
+                )
             print("found %d patterns in %.1f s" % (len(self.found), (endt - startt)))
         return self.found
 
+    def checkPatterns(self, gray, patterns):
+        """get the given patterns that are not rejected by the fast check of OpenCV in the given downscaled gray image"""
+        checks = [
+            self.executor.submit(self.checkPattern, pattern, gray)
+            for pattern in patterns
+        ]
+        return [pattern for pattern, check in zip(patterns, checks) if check.result()]
+
+    def checkPattern(self, pattern, gray):
+        """check the given pattern with the fast check of OpenCV"""
+        start = timer()
+        passed = cv2.checkChessboard(gray, pattern)
+        self.timings[pattern] = [timer() - start]
+        return passed
+
+    def searchPatterns(self, patterns, candidates, gray, fullSizeGray, limit):
+        """search the given patterns until the limit of patterns found is reached
+
+        the given candidates are started first - the patterns found are picked in the given order of the patterns
+        """
+        cancelled = threading.Event()
+        rejected = [pattern for pattern in patterns if pattern not in candidates]
+        futures = {
+            pattern: self.executor.submit(
+                self.searchPattern, pattern, gray, fullSizeGray, cancelled
+            )
+            for pattern in candidates + rejected
+        }
+        try:
+            for pattern in patterns:
+                if len(self.found) >= limit:
+                    break
+                corners = futures[pattern].result()
+                if corners is not None:
+                    corners.sort()
+                    self.found[pattern] = corners
+        finally:
+            # the patterns not needed any more are not started or at least not searched in the full size image
+            cancelled.set()
+
+    def searchPattern(self, pattern, gray, fullSizeGray, cancelled):
+        """search the given pattern in the downscaled gray image first and then in the full size gray image - returns the corners or None
+
+        in pyramid mode the corners found in the downscaled image are refined in the full size image instead
+        """
+        if cancelled.is_set():
+            return None
+        corners = Corners(pattern, self.video)
+        found = corners.findPattern(gray)
+        timings = [corners.time]
+        if found:
+            if cancelled.is_set():
+                found = False
+            elif self.pyramid:
+                scale = (
+                    fullSizeGray.shape[1] / gray.shape[1],
+                    fullSizeGray.shape[0] / gray.shape[0],
+                )
+                corners.refine(fullSizeGray, BoardFinder.subPixCriteria, scale)
+                timings.append(corners.time)
+            else:
+                found = corners.findPattern(fullSizeGray)
+                timings.append(corners.time)
+        self.timings[pattern] = self.timings.get(pattern, []) + timings
+        return corners if found else None
+
     def findChessBoard(self, image, title):
         """find a chess board in the given image and return the trapez polygon for it"""
         corners = self.findOuterCorners()
@@ -302,32 +430,66 @@ class BoardFinder(object):
         masked = self.video.maskImage(image, mask)
         return masked
 
-    def maskCornerPolygons(self, image, corners, filterColor):
-        """mask the polygons derived from the given corner points"""
-        mask = self.video.getEmptyImage(image)
+    def boardRect(self, polygon):
+        """get the bounding rectangle x,y,w,h of the given polygon clipped to my image"""
+        x, y, w, h = cv2.boundingRect(np.asarray(polygon, np.int32).reshape(-1, 2))
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, self.width), min(y + h, self.height)
+        return x1, y1, max(x2 - x1, 0), max(y2 - y1, 0)
+
+    def cornerPolygonsMask(self, corners, filterColor, rect):
+        """get a mask of the polygons derived from the given corner points that do not have the given filter color within the given rectangle"""
+        x, y, w, h = rect
+        mask = np.zeros((h, w), np.uint8)
+        offset = np.array([x, y], np.int32)
         polygons = corners.polygons[Corners.safetyMargin]
         for pos, polygon in polygons.items():
             posColor = self.fieldColor(pos)
             if not posColor == filterColor:
                 self.drawPolygon(
-                    mask, pos, polygon, BoardFinder.white, BoardFinder.white
+                    mask, pos, polygon - offset, BoardFinder.white, BoardFinder.white
                 )
-        # if BoardFinder.debug:
-        #    cv2.imshow("mask",mask)
-        #    cv2.waitKey(1000)
+        return mask
+
+    def fullSize(self, image, rect, mask=None):
+        """get a full size version of the given image of the given rectangle e.g. for debug output - optionally masked"""
+        x, y, w, h = rect
+        full = np.zeros((self.height, self.width) + image.shape[2:], np.uint8)
+        if mask is not None:
+            image = self.video.maskImage(image, mask)
+        full[y : y + h, x : x + w] = image
+        return full
+
+    def maskCornerPolygons(self, image, corners, filterColor):
+        """mask the polygons derived from the given corner points"""
+        rect = (0, 0, self.width, self.height)
+        mask = self.cornerPolygonsMask(corners, filterColor, rect)
         masked = self.video.maskImage(image, mask)
         return masked
 
     def getHistograms(self, image, title, corners):
-        """get the two histograms for the given corners we don't no what the color of the topleft corner is so we start with a guess"""
+        """get the two histograms for the given corners we don't no what the color of the topleft corner is so we start with a guess
+
+        the histograms are calculated with masks restricted to the bounding rectangle of the corner polygons
+        """
         histograms = {}
-        for filterColor in (True, False):
-            imageCopy = image.copy()
-            masked = self.maskCornerPolygons(imageCopy, corners, filterColor)
+        polygons = corners.polygons[Corners.safetyMargin]
+        rect = self.boardRect(np.concatenate(list(polygons.values())))
+        x, y, w, h = rect
+        roi = image[y : y + h, x : x + w]
+        filterColors = (True, False)
+        masks = []
+        for filterColor in filterColors:
+            mask = self.cornerPolygonsMask(corners, filterColor, rect)
             if BoardFinder.debug:
                 prefix = "masked-O-" if filterColor else "masked-X-"
+                masked = self.fullSize(roi, rect, mask)
                 corners.writeDebug(masked, title, prefix)
-            histograms[filterColor] = Histogram(masked, histRange=(1, 256))
+            masks.append(mask)
+        # the statistics of both histograms are calculated in one batch
+        byMask = Histogram.forMasks(roi, masks, histRange=BoardFinder.histRange)
+        for filterColor, histogram in zip(filterColors, byMask):
+            histograms[filterColor] = histogram
 
         # do we need to fix our guess?
         # is the mean color of black (being filtered) higher then when white is filtered?
@@ -340,12 +502,19 @@ class BoardFinder(object):
         return histograms
 
     def getColorFiltered(self, image, histograms, title, corners):
-        """get color filtered images based on the given histograms"""
+        """get color filtered images of the 8x8 board based on the given histograms
+
+        the color masks are only calculated within the bounding rectangle of the board and the filtered images are only created for debugging
+        """
         colorFiltered = {}
         colorMask = {}
+        rect = self.boardRect(corners.trapez8x8)
+        x, y, w, h = rect
+        roi = image[y : y + h, x : x + w]
+        mask8x8 = np.zeros((h, w), np.uint8)
+        cv2.fillConvexPoly(mask8x8, corners.trapez8x8 - np.array([x, y], np.int32), 255)
         for filterColor in (chess.WHITE, chess.BLACK):
             histogram = histograms[filterColor]
-            imageCopy = image.copy()
             lowerColor, upperColor = histogram.range(1.0)
             # make sure the colors are numpy arrays
             lowerColor = np.array(lowerColor, dtype=np.uint8)
@@ -356,12 +525,14 @@ class BoardFinder(object):
             # else:
             #    lowerColor=(0,0,0)
             # lower,upper=histogram.mincolor, histogram.maxcolor
-            colorMask[filterColor] = cv2.inRange(imageCopy, lowerColor, upperColor)
-            # colorMask[filterColor]=histogram.colorMask(imageCopy, 1.5)
-            colorFiltered[filterColor] = self.video.maskImage(
-                imageCopy, colorMask[filterColor]
+            colorMask[filterColor] = cv2.bitwise_and(
+                cv2.inRange(roi, lowerColor, upperColor), mask8x8
             )
+            # colorMask[filterColor]=histogram.colorMask(imageCopy, 1.5)
             if BoardFinder.debug:
+                colorFiltered[filterColor] = self.fullSize(
+                    roi, rect, colorMask[filterColor]
+                )
                 colorName = "white" if filterColor == chess.WHITE else "black"
                 bl, gl, rl = lowerColor
                 bu, gu, ru = upperColor
@@ -371,18 +542,20 @@ class BoardFinder(object):
                 )
                 prefix = "colorFiltered-%s-" % (colorName)
                 corners.writeDebug(colorFiltered[filterColor], title, prefix)
-        backGroundFilter = cv2.bitwise_not(
-            cv2.bitwise_or(colorMask[chess.WHITE], colorMask[chess.BLACK])
+        backGroundFilter = cv2.bitwise_and(
+            cv2.bitwise_not(
+                cv2.bitwise_or(colorMask[chess.WHITE], colorMask[chess.BLACK])
+            ),
+            mask8x8,
         )
-        imageCopy = image.copy()
-        colorFiltered["background"] = self.video.maskImage(imageCopy, backGroundFilter)
         if BoardFinder.debug:
+            colorFiltered["background"] = self.fullSize(roi, rect, backGroundFilter)
             corners.writeDebug(
                 colorFiltered["background"], title, "colorFiltered-background-"
             )
         # side effect - add background histogram
         histograms["background"] = Histogram(
-            colorFiltered["background"], histRange=(1, 256)
+            roi, histRange=BoardFinder.histRange, mask=backGroundFilter
         )
         return colorFiltered
 
@@ -390,16 +563,14 @@ class BoardFinder(object):
         """expand the image finding to 8x8 with the given histograms and corners that are e.g. 7x7,7x5,5x5, ..."""
         if BoardFinder.debug:
             corners.showTrapezDebug(image, title, corners)
-        # create a mask for the
-        masked8x8 = self.maskPolygon(image, corners.trapez8x8)
-        if BoardFinder.debug:
+            # create a mask for the
+            masked8x8 = self.maskPolygon(image, corners.trapez8x8)
             corners.writeDebug(masked8x8, title, "trapez-masked")
-        # draw a 10x10 sized white trapez
-        white10x10 = self.video.getEmptyImage(image)
-        cv2.fillConvexPoly(white10x10, corners.trapez10x10, BoardFinder.white)
-        cv2.fillConvexPoly(white10x10, corners.trapez8x8, BoardFinder.black)
-        masked10x10 = white10x10 + masked8x8
-        if BoardFinder.debug:
+            # draw a 10x10 sized white trapez
+            white10x10 = self.video.getEmptyImage(image)
+            cv2.fillConvexPoly(white10x10, corners.trapez10x10, BoardFinder.white)
+            cv2.fillConvexPoly(white10x10, corners.trapez8x8, BoardFinder.black)
+            masked10x10 = white10x10 + masked8x8
             corners.writeDebug(masked10x10, title, "trapez-white")
         # 9x9 test fails due to a few pixels which are in the way
         # commented out to speed up
@@ -408,9 +579,7 @@ class BoardFinder(object):
         # if corners8x8.findPattern(fullSizeGray8x8):
         #    if BoardFinder.debug:
         #        print("Successfully found 8x8 for %s"+title)
-        self.colorFiltered = self.getColorFiltered(
-            masked8x8, histograms, title, corners
-        )
+        self.colorFiltered = self.getColorFiltered(image, histograms, title, corners)
 
     def drawPolygon(self, image, pos, polygon, whiteColor, blackColor):
         posColor = self.fieldColor(pos)
@@ -0,0 +1,161 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import cv2
+import numpy as np
+
+from pcwawc.chesstrapezoid import Trapez2Square
+
+
+class BoardTracker:
+    """track the chessboard from frame to frame with pyramidal Lucas-Kanade optical flow
+
+    the outer trapezoid and a sparse set of inner intersections are tracked and the homography between
+    two frames is estimated from the points tracked consistently - the warp is only updated if the board
+    has drifted far enough and the tracking is lost if too few points could be tracked
+    """
+
+    debug = False
+    # Lucas-Kanade parameters
+    winSize = (21, 21)
+    maxLevel = 3
+    criteria = (cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 30, 0.01)
+    # maximum forward-backward error in pixels of a tracked point
+    fbTreshold = 1.0
+    # maximum reprojection error in pixels of an inlier of the homography
+    ransacTreshold = 3.0
+    # minimum ratio of the points that need to be inliers to keep on tracking
+    minConfidence = 0.5
+    # drift in pixels of the outer corners after which the warp points are updated
+    driftTreshold = 2.0
+    # maximum number of inner intersections to track
+    maxInnerPoints = 16
+
+    def __init__(self, warp):
+        """construct me for the given warp"""
+        self.warp = warp
+        self.points = None
+        self.prevGray = None
+        self.prevOffset = None
+        self.confidence = 0.0
+        self.frames = 0
+        self.warpUpdates = 0
+
+    @staticmethod
+    def toGray(image):
+        """get a grayscale version of the given image"""
+        if image.ndim == 3:
+            return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return image
+
+    def seed(self, image, corners=None, offset=(0, 0)):
+        """start tracking in the given image from the given chessboard corners or my warp points if no corners are given
+
+        the points are kept in the coordinates of the warp - the given offset is the position of the image within these coordinates
+        """
+        offset = np.array(offset, np.float32)
+        if corners is not None:
+            outer = np.array(corners.trapez8x8, np.float32).reshape(-1, 2) + offset
+            inner = np.array(corners.corners, np.float32).reshape(-1, 2) + offset
+        else:
+            if not self.warp.warping:
+                raise Exception("no warp points to track")
+            outer = np.array(self.warp.points, np.float32).reshape(-1, 2)
+            tl, tr, br, bl = outer
+            trapez = Trapez2Square(tl, tr, br, bl)
+            rxys = [
+                (col / 8, row / 8) for row in range(1, 8, 2) for col in range(1, 8, 2)
+            ]
+            inner = trapez.relativeToTrapezXYs(rxys)
+        step = max(1, int(np.ceil(len(inner) / BoardTracker.maxInnerPoints)))
+        points = np.concatenate((outer, inner[::step]))
+        self.points = points.reshape(-1, 1, 2).astype(np.float32)
+        self.prevGray = BoardTracker.toGray(image)
+        self.prevOffset = offset
+        self.confidence = 1.0
+        self.warp.pointList = np.round(outer).astype(int).tolist()
+        self.warp.updatePoints()
+
+    @property
+    def tracking(self):
+        """True if i have been seeded and have not lost the board since"""
+        return self.points is not None
+
+    def lose(self):
+        """lose track of the board - returns False"""
+        if BoardTracker.debug:
+            print(
+                "frame %d: lost the board with confidence %.2f"
+                % (self.frames, self.confidence)
+            )
+        self.points = None
+        self.prevGray = None
+        self.confidence = 0.0
+        return False
+
+    def track(self, image, offset=(0, 0)):
+        """track the board in the given image at the given offset - returns True if the board could be tracked"""
+        if not self.tracking:
+            return False
+        self.frames += 1
+        gray = BoardTracker.toGray(image)
+        offset = np.array(offset, np.float32)
+        prevPoints = self.points - self.prevOffset
+        lkParams = dict(
+            winSize=BoardTracker.winSize,
+            maxLevel=BoardTracker.maxLevel,
+            criteria=BoardTracker.criteria,
+            flags=cv2.OPTFLOW_USE_INITIAL_FLOW,
+        )
+        nextPoints, status, err = cv2.calcOpticalFlowPyrLK(
+            self.prevGray, gray, prevPoints, self.points - offset, **lkParams
+        )
+        backPoints, backStatus, err = cv2.calcOpticalFlowPyrLK(
+            gray, self.prevGray, nextPoints, prevPoints.copy(), **lkParams
+        )
+        fbError = np.linalg.norm((backPoints - prevPoints).reshape(-1, 2), axis=1)
+        good = (
+            (status.ravel() == 1)
+            & (backStatus.ravel() == 1)
+            & (fbError < BoardTracker.fbTreshold)
+        )
+        if good.sum() < 4:
+            self.confidence = good.sum() / len(good)
+            return self.lose()
+        homography, inliers = cv2.findHomography(
+            self.points[good],
+            nextPoints[good] + offset,
+            cv2.RANSAC,
+            BoardTracker.ransacTreshold,
+        )
+        if homography is None:
+            self.confidence = 0.0
+            return self.lose()
+        self.confidence = inliers.sum() / len(good)
+        if self.confidence < BoardTracker.minConfidence:
+            return self.lose()
+        # the outer corners and the points that could not be tracked follow the board
+        points = cv2.perspectiveTransform(self.points, homography)
+        tracked = np.flatnonzero(good)[inliers.ravel() == 1]
+        tracked = tracked[tracked >= 4]
+        points[tracked] = nextPoints[tracked] + offset
+        self.points = points
+        self.prevGray = gray
+        self.prevOffset = offset
+        outer = points[:4].reshape(-1, 2)
+        drift = np.linalg.norm(outer - np.array(self.warp.points), axis=1).max()
+        if drift > BoardTracker.driftTreshold:
+            self.warp.pointList = np.round(outer).astype(int).tolist()
+            self.warp.updatePoints()
+            self.warpUpdates += 1
+            if BoardTracker.debug:
+                print(
+                    "frame %d: board drifted %.1f pixels with confidence %.2f"
+                    % (self.frames, drift, self.confidence)
+                )
+        return True
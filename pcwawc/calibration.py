@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import os
+import sys
+
+import cv2
+import numpy as np
+
+from pcwawc.args import Args
+from pcwawc.environment import Environment
+from pcwawc.jsonablemixin import JsonAbleMixin
+from pcwawc.video import Video
+
+
+class CameraCalibration(JsonAbleMixin):
+    """intrinsic camera parameters to correct the lens distortion of a camera
+
+    found from the chessboard corners detected with Corners.findPattern in several frames
+    """
+
+    debug = False
+    # refinement of the detected corners
+    subPixCriteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 0.001)
+
+    def __init__(self, device=None, width=0, height=0):
+        """construct me for the given device and frame size"""
+        self.device = device
+        self.width = width
+        self.height = height
+        self.cameraMatrix = None
+        self.distCoeffs = None
+        self.rms = None
+        self.frames = 0
+        # object and image points of the frames used for the calibration
+        self.objectPoints = []
+        self.imagePoints = []
+
+    @staticmethod
+    def deviceKey(device):
+        """get a file name for the calibration of the given device"""
+        if Video.is_int(device):
+            return "camera%s" % (device)
+        return os.path.basename(str(device))
+
+    @staticmethod
+    def defaultPath():
+        env = Environment()
+        return str(env.projectPath) + "/games/calibration"
+
+    @staticmethod
+    def load(device, path=None):
+        """load the calibration of the given device - None if the device has not been calibrated"""
+        if path is None:
+            path = CameraCalibration.defaultPath()
+        jsonFile = path + "/" + CameraCalibration.deviceKey(device)
+        calibration = JsonAbleMixin.readJson(jsonFile)
+        return calibration
+
+    def save(self, path=None):
+        """save me for my device"""
+        if path is None:
+            path = CameraCalibration.defaultPath()
+        os.makedirs(path, exist_ok=True)
+        self.writeJson(path + "/" + CameraCalibration.deviceKey(self.device))
+
+    def __getstate__(self):
+        # the points of the individual frames are not persisted
+        state = self.__dict__.copy()
+        state["objectPoints"] = []
+        state["imagePoints"] = []
+        return state
+
+    def addFrame(self, image, video=None):
+        """try to find a chessboard corner pattern in the given image and use it for the calibration - returns the pattern found or None"""
+        # imported here since the board finder depends on the chess image module which uses the calibration
+        from pcwawc.boardfinder import Corners
+
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        self.height, self.width = gray.shape[:2]
+        for pattern in Corners.genChessPatterns():
+            corners = Corners(pattern, video)
+            if corners.findPattern(image):
+                imagePoints = cv2.cornerSubPix(
+                    gray,
+                    corners.corners,
+                    (5, 5),
+                    (-1, -1),
+                    CameraCalibration.subPixCriteria,
+                )
+                rows, cols = pattern
+                objectPoints = np.zeros((rows * cols, 3), np.float32)
+                objectPoints[:, :2] = np.mgrid[0:rows, 0:cols].T.reshape(-1, 2)
+                self.objectPoints.append(objectPoints)
+                self.imagePoints.append(imagePoints)
+                self.frames += 1
+                if CameraCalibration.debug:
+                    print("frame %d: %dx%d pattern" % (self.frames, rows, cols))
+                return pattern
+        return None
+
+    def calibrate(self):
+        """calculate the camera matrix and distortion coefficients from the frames added - returns the rms reprojection error"""
+        if self.frames == 0:
+            raise Exception("no chessboard pattern found for calibration")
+        rms, cameraMatrix, distCoeffs, rvecs, tvecs = cv2.calibrateCamera(
+            self.objectPoints,
+            self.imagePoints,
+            (self.width, self.height),
+            None,
+            None,
+        )
+        self.rms = rms
+        self.cameraMatrix = cameraMatrix.tolist()
+        self.distCoeffs = distCoeffs.ravel().tolist()
+        return rms
+
+    def intrinsics(self):
+        """get my camera matrix and distortion coefficients as numpy arrays"""
+        return np.array(self.cameraMatrix, np.float64), np.array(
+            self.distCoeffs, np.float64
+        )
+
+    def undistortPoints(self, points):
+        """get the given pixel coordinates as they are in the undistorted image"""
+        cameraMatrix, distCoeffs = self.intrinsics()
+        points = np.asarray(points, np.float32).reshape(-1, 1, 2)
+        undistorted = cv2.undistortPoints(
+            points, cameraMatrix, distCoeffs, P=cameraMatrix
+        )
+        return undistorted.reshape(-1, 2)
+
+    def distortPoints(self, points):
+        """get the pixel coordinates in the original image for the given pixel coordinates of the undistorted image"""
+        cameraMatrix, distCoeffs = self.intrinsics()
+        points = np.asarray(points, np.float64).reshape(-1, 2)
+        # back to normalized camera coordinates on the z=1 plane
+        normalized = (points - cameraMatrix[:2, 2]) / np.diag(cameraMatrix)[:2]
+        objectPoints = np.hstack((normalized, np.ones((len(normalized), 1))))
+        distorted, _jacobian = cv2.projectPoints(
+            objectPoints, np.zeros(3), np.zeros(3), cameraMatrix, distCoeffs
+        )
+        return distorted.reshape(-1, 2)
+
+    def calibrateVideo(self, video, maxFrames=20, every=10):
+        """calibrate from every n-th frame of the given video until the given number of frames with a pattern has been found"""
+        for videoFrame in video.genFrames(skip=every - 1):
+            self.addFrame(videoFrame.image, video)
+            if self.frames >= maxFrames:
+                break
+        return self.calibrate()
+
+
+class CalibrationArgs(Args):
+    """command line arguments for the camera calibration"""
+
+    def __init__(self, description):
+        super().__init__(description)
+        self.parser.add_argument(
+            "--calibrationframes",
+            type=int,
+            default=20,
+            help="number of frames with a chessboard pattern to use for the calibration",
+        )
+        self.parser.add_argument(
+            "--every",
+            type=int,
+            default=10,
+            help="only look for chessboard patterns in every n-th frame",
+        )
+
+
+if __name__ == "__main__":
+    cmdLineArgs = CalibrationArgs("Camera calibration")
+    args = cmdLineArgs.parse(sys.argv[1:])
+    video = Video()
+    video.capture(args.input)
+    calibration = CameraCalibration(args.input)
+    rms = calibration.calibrateVideo(video, args.calibrationframes, args.every)
+    video.close()
+    calibration.save()
+    print(
+        "calibrated %s from %d frames with rms reprojection error %.3f"
+        % (args.input, calibration.frames, rms)
+    )
@@ -0,0 +1,190 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+# <uml>
+# CaptureManager "1" -- "n" BoardCapture
+# BoardCapture "1" -- "1" VideoAnalyzer
+# </uml>
+import copy
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from timeit import default_timer as timer
+
+from pcwawc.args import Args
+from pcwawc.fpscheck import FPSCheck
+from pcwawc.runningstats import MinMaxStats
+from pcwawc.video import Video
+from pcwawc.videoanalyze import VideoAnalyzer
+
+
+class BoardCapture(object):
+    """capture and analysis of a single board - the frames are captured and read in the board's own threads"""
+
+    def __init__(self, index, args):
+        """construct me with the given index and arguments - the input of the arguments selects the device or file"""
+        self.index = index
+        self.args = args
+        self.title = Video.title(args.input)
+        self.analyzer = VideoAnalyzer(args)
+        # each board captures in its own thread
+        self.analyzer.vision.threaded = True
+        self.analyzer.setUpDetector()
+        self.analyzer.setDebug(args.debug)
+        self.fpsCheck = FPSCheck()
+        self.latency = MinMaxStats()
+        self.frames = 0
+        self.opened = False
+        self.finished = False
+        self.error = None
+        self.readTime = None
+
+    def open(self):
+        self.analyzer.open()
+        self.opened = True
+        self.fpsCheck.start()
+        if self.args.autowarp:
+            self.analyzer.autoWarp()
+
+    def read(self):
+        """read the next image set of my board - returns None when my video has ended"""
+        self.readTime = timer()
+        return self.analyzer.readImageSet()
+
+    def detect(self, cbImageSet):
+        """analyze the given image set of my board"""
+        self.analyzer.processImageSet(cbImageSet)
+        self.latency.push(timer() - self.readTime)
+        self.fpsCheck.update()
+        self.frames += 1
+
+    def close(self):
+        if self.opened:
+            self.analyzer.close()
+            self.opened = False
+
+    def pgn(self):
+        return self.analyzer.vision.board.game.pgn
+
+    def __str__(self):
+        fps = self.fpsCheck.fps() if self.frames > 0 else 0
+        text = "%2d %s: %5d frames %5.1f fps latency %s" % (
+            self.index,
+            self.title,
+            self.frames,
+            fps,
+            self.latency.formatMinMax(
+                formatR="%d: %.3f ± %.3f s", formatM=" %.3f - %.3f s"
+            ),
+        )
+        if self.error is not None:
+            text += " failed: %s" % (self.error)
+        return text
+
+
+class CaptureManager(object):
+    """capture and analyze multiple boards in parallel e.g. for a tournament hall - the detector stage runs in a shared size-limited worker pool"""
+
+    # number of processed frames after which the board status is logged in debug mode
+    statusInterval = 100
+
+    def __init__(self, args, inputs, maxWorkers=None):
+        """construct me from the given arguments and the list of inputs (devices or files) - one board per input"""
+        self.args = args
+        self.debug = args.debug
+        self.boards = []
+        for index, device in enumerate(inputs):
+            boardArgs = copy.copy(args)
+            boardArgs.input = device
+            # each board has its own warp points that are modified in place
+            boardArgs.warpPointList = copy.deepcopy(args.warpPointList)
+            self.boards.append(BoardCapture(index, boardArgs))
+        if maxWorkers is None:
+            maxWorkers = min(len(self.boards), os.cpu_count() or 1)
+        self.maxWorkers = max(1, maxWorkers)
+        self.stopped = False
+
+    def run(self):
+        """analyze all boards until all videos have ended or stop is called - returns the list of pgns in the order of the inputs
+
+        each board is opened and read in its own thread - only the detection is done in the shared worker pool
+        """
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.maxWorkers, thread_name_prefix="CaptureManager"
+        )
+        threads = [
+            threading.Thread(
+                target=self.capture, args=(board,), name="BoardCapture%d" % board.index
+            )
+            for board in self.boards
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.executor.shutdown()
+        pgns = []
+        for board in self.boards:
+            board.close()
+            pgns.append(board.pgn())
+            if self.debug:
+                print(board)
+        return pgns
+
+    def capture(self, board):
+        """open the given board and hand its image sets to the shared detector pool until its video has ended - a failing board does not affect the others"""
+        try:
+            board.open()
+            while not self.stopped:
+                cbImageSet = board.read()
+                if cbImageSet is None:
+                    break
+                # one image set per board in the pool so that each board's frames are detected in order
+                self.executor.submit(board.detect, cbImageSet).result()
+                if self.debug and board.frames % CaptureManager.statusInterval == 0:
+                    print(board)
+        except Exception as error:
+            board.error = error
+            if self.debug:
+                print("board %s failed: %s" % (board.title, error))
+        finally:
+            board.finished = True
+
+    def stop(self):
+        """stop processing - the frames in progress are finished"""
+        self.stopped = True
+
+    def showStatus(self):
+        for board in self.boards:
+            print(board)
+
+
+class CaptureManagerArgs(Args):
+    """command line arguments for analyzing multiple boards"""
+
+    def __init__(self):
+        super().__init__(description="Multi board capture manager")
+        self.parser.add_argument(
+            "--inputs", nargs="+", required=True, help="input devices or files"
+        )
+        self.parser.add_argument(
+            "--workers",
+            type=int,
+            default=None,
+            help="maximum number of worker threads for the detector stage",
+        )
+
+
+if __name__ == "__main__":
+    args = CaptureManagerArgs().parse(sys.argv[1:])
+    captureManager = CaptureManager(args, args.inputs, maxWorkers=args.workers)
+    pgns = captureManager.run()
+    for board, pgn in zip(captureManager.boards, pgns):
+        print(board.title)
+        print(pgn)
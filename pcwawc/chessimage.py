@@ -4,6 +4,7 @@ Created on 2019-12-10
 @author: wf
 """
 
+import math
 import os
 from timeit import default_timer as timer
 
@@ -12,6 +13,7 @@ import numpy as np
 from zope.interface import implementer
 
 from pcwawc.board import Board
+from pcwawc.calibration import CameraCalibration
 from pcwawc.chessvision import (
     IChessBoardImage,
     IChessBoardImageSet,
@@ -19,8 +21,11 @@ from pcwawc.chessvision import (
     IWarp,
 )
 from pcwawc.environment import Environment
+from pcwawc.framecache import FrameCache
 from pcwawc.jsonablemixin import JsonAbleMixin
-from pcwawc.video import Video
+from pcwawc.runningstats import MovingAverage
+from pcwawc.screencapture import ScreenCapture
+from pcwawc.video import BufferPolicy, FramePipeline, Video, VideoStream
 from pcwawc.yamlablemixin import YamlAbleMixin
 
 
@@ -28,11 +33,21 @@ from pcwawc.yamlablemixin import YamlAbleMixin
 class ChessBoardVision(JsonAbleMixin):
     """implements access to chessboard images"""
 
+    # number of frames to average the processing latency for the auto speedup
+    latencyWindow = 10
+
     def __init__(self, args, board=None):
         self.device = args.input
         self.title = Video.title(self.device)
         self.video = Video(self.title)
         self.video.headless = Environment.inContinuousIntegration()
+        self.video.framePoolSize = args.framepool
+        self.video.prefetch = args.prefetch
+        self.video.imageReduction = args.reduce
+        if args.undistort:
+            self.video.calibration = CameraCalibration.load(self.device)
+            if self.video.calibration is None:
+                raise Exception("%s has not been calibrated" % (self.device))
         self.args = args
         self.showDebug = args.debug
         self.start = None
@@ -51,30 +66,165 @@ class ChessBoardVision(JsonAbleMixin):
             self.warp.warping = True
         self.firstFrame = True
         self.speedup = args.speedup
+        self.autoSpeedup = args.autospeedup
+        self.latency = MovingAverage(ChessBoardVision.latencyWindow)
+        self.lastReadTime = None
+        # threaded capture
+        self.threaded = args.threaded
+        self.bufferSize = args.buffersize
+        self.bufferPolicy = BufferPolicy.fromName(args.bufferpolicy)
+        self.videoStream = None
+        # the frames are already warped and rotated e.g. when read from the frame cache
+        self.prewarped = False
+        # margin around the board region to crop the captured images to - None for no cropping
+        self.cropMargin = args.crop
+        # frame pipeline of the opened video - built on the first read
+        self.pipeline = None
+        self.pipelineShowDebug = self.showDebug
         pass
 
     def open(self, device):
-        self.video.capture(device)
+        self.stopVideoStream()
+        self.pipeline = None
+        self.prewarped = False
+        if ScreenCapture.isScreenDevice(device):
+            monitor = ScreenCapture.monitorOf(device)
+            self.video.setup(ScreenCapture(self.warp, monitor, self.args.screenfps))
+        elif self.args.framecache is not None and os.path.isfile(device):
+            self.openFrameCache(device)
+        else:
+            self.video.capture(device)
         self.device = device
         self.firstFrame = True
 
+    def openFrameCache(self, device):
+        """read the frames of the given video file from the frame cache - warped, rotated and undistorted if the warp points are known"""
+        points, rotation = None, 0
+        if self.warp.warping and self.warp.points is not None and not self.args.nowarp:
+            points, rotation = self.warp.points, self.warp.rotation
+        cache = FrameCache(self.args.framecache)
+        self.video.device = device
+        self.video.setup(cache.open(device, points, rotation, self.video.calibration))
+        self.prewarped = points is not None
+
+    def startVideoStream(self, skip=0):
+        """start capturing my video in a separate thread skipping the given number of frames before each captured frame"""
+        self.videoStream = VideoStream(
+            self.video, bufferSize=self.bufferSize, policy=self.bufferPolicy
+        )
+        self.videoStream.skip = skip
+        self.videoStream.start()
+
+    def stopVideoStream(self):
+        if self.videoStream is not None:
+            self.videoStream.stop()
+            self.videoStream = None
+
     def readChessBoardImage(self):
-        for i in range(self.speedup):
-            self.hasImage, image, self.quitWanted = self.video.readFrame(self.showDebug)
-            if self.quitWanted:
-                return self.previous
-        frames = self.video.frames
+        self.measureLatency()
+        speedup = self.currentSpeedup()
+        if self.threaded:
+            cbImageSet = self.readStreamedChessBoardImage(speedup)
+        else:
+            cbImageSet = self.readCapturedChessBoardImage(speedup)
+        self.lastReadTime = timer()
+        return cbImageSet
+
+    def measureLatency(self):
+        """measure the time spent on processing since the last chessboard image was read"""
+        if self.lastReadTime is not None:
+            self.latency.push(timer() - self.lastReadTime)
+
+    def currentSpeedup(self):
+        """get the number of frames to advance for the next chessboard image - in auto speedup mode enough frames are skipped to keep pace with the frames per second of the video"""
+        speedup = self.speedup
+        fps = self.video.fps
+        if self.autoSpeedup and self.latency.n > 0 and fps > 0:
+            neededSpeedup = math.ceil(self.latency.mean() * fps)
+            speedup = max(speedup, min(neededSpeedup, fps))
+        return speedup
+
+    def readCapturedChessBoardImage(self, speedup):
+        """read a chessboard image skipping the frames not needed for the given speedup without decoding them"""
+        if speedup > 1 and not self.video.paused():
+            self.video.skipFrames(speedup - 1)
+        if self.pipeline is None or self.pipelineShowDebug != self.showDebug:
+            self.pipeline = self.framePipeline()
+        videoFrame = next(self.pipeline, None)
+        self.hasImage = videoFrame is not None
+        if not self.hasImage:
+            # an exhausted pipeline is rebuilt on the next read
+            self.pipeline = None
+            return None
         if self.firstFrame:
             self.start = timer()
         timestamp = timer() - self.start
-        self.chessBoardImageSet = ChessBoardImageSet(
-            self, image, frames // self.speedup, timestamp
-        )
+        self.chessBoardImageSet = self.imageSet(videoFrame, timestamp)
+        self.firstFrame = False
+        self.timestamps.append(timestamp)
+        return self.chessBoardImageSet
+
+    def framePipeline(self):
+        """get the frame pipeline for my opened video - it is rebuilt when the debug display is switched"""
+        self.pipelineShowDebug = self.showDebug
+        # crop right after the capture so that all further stages work on the board region
+        frames = FramePipeline.genCrop(self.video.genFrames(), self.cropRect)
+        if self.showDebug:
+            frames = FramePipeline.genShow(frames, self.video, onQuit=self.onQuit)
+        return frames
+
+    def onQuit(self):
+        """the user wants to quit"""
+        self.quitWanted = True
+
+    def readStreamedChessBoardImage(self, speedup):
+        """read a chessboard image from the capture thread using the capture's frame index and time stamp"""
+        # let the capture thread skip the frames not needed
+        if self.videoStream is None:
+            self.startVideoStream(speedup - 1)
+        self.videoStream.skip = speedup - 1
+        videoFrame = self.videoStream.read()
+        self.hasImage = videoFrame is not None
+        if not self.hasImage:
+            return None
+        rect = self.cropRect()
+        if rect is not None:
+            videoFrame = videoFrame.crop(rect)
+        if self.firstFrame:
+            self.start = videoFrame.timeStamp
+        timestamp = videoFrame.timeStamp - self.start
+        self.chessBoardImageSet = self.imageSet(videoFrame, timestamp)
+        ringBuffer = self.videoStream.buffer
+        self.chessBoardImageSet.droppedFrames = ringBuffer.dropped
+        self.chessBoardImageSet.bufferedFrames = len(ringBuffer)
         self.firstFrame = False
         self.timestamps.append(timestamp)
         return self.chessBoardImageSet
 
+    def imageSet(self, videoFrame, timestamp):
+        """get a chessboard image set for the given - possibly cropped - video frame"""
+        captured = videoFrame.captured
+        cbImageSet = ChessBoardImageSet(
+            self, captured.image, videoFrame.index // self.speedup, timestamp
+        )
+        cbImageSet.capture(captured.offset)
+        if videoFrame is not captured:
+            cbImageSet.setRegion(videoFrame.image, videoFrame.offset)
+        return cbImageSet
+
+    def cropRect(self):
+        """get the x,y,w,h rectangle of the board region plus the crop margin - None if cropping is not active"""
+        if self.cropMargin is None or self.args.nowarp or self.prewarped:
+            return None
+        if not self.warp.warping or self.warp.points is None:
+            return None
+        margin = self.cropMargin
+        x, y, w, h = cv2.boundingRect(np.asarray(self.warp.points, np.int32))
+        return (x - margin, y - margin, w + 2 * margin, h + 2 * margin)
+
     def close(self):
+        self.stopVideoStream()
+        self.pipeline = None
         self.video.close()
 
     def __getstate__(self):
@@ -112,6 +262,8 @@ class ChessBoardImageSet:
         self.frameIndex = frameIndex
         # see https://stackoverflow.com/questions/47743246/getting-timestamp-of-each-frame-in-a-video
         self.timeStamp = timeStamp
+        # the image as captured - my chessboard image might be a region of it
+        self.capturedImage = image
         self.cbImage = ChessBoardImage(image, "chessboard")
         self.cbGUI = self.cbImage
         self.cbWarped = None
@@ -119,6 +271,23 @@ class ChessBoardImageSet:
         self.cbPreMove = None
         self.cbDiff = None
         self.cbDebug = None
+        # capture statistics - only available for threaded capture
+        self.droppedFrames = 0
+        self.bufferedFrames = 0
+        # x,y offset of the image e.g. if only the board region has been captured
+        self.offset = (0, 0)
+        self.capturedOffset = (0, 0)
+
+    def capture(self, offset):
+        """set the offset of the captured region of the frame"""
+        self.offset = offset
+        self.capturedOffset = offset
+
+    def setRegion(self, image, offset):
+        """restrict my image to the given region of the captured image at the given offset e.g. the board region - the region is a view of the captured image"""
+        self.cbImage = ChessBoardImage(image, "chessboard")
+        self.cbGUI = self.cbImage
+        self.offset = offset
 
     def placeHolder(self, cbImage):
         """return an empty image if the image is not available"""
@@ -152,17 +321,27 @@ class ChessBoardImageSet:
         """warp and rotate the image as necessary - add timestamp if in debug mode"""
         video = self.vision.video
         warp = self.vision.warp
-        if warp.warping or nowarp:
-            if nowarp:
-                warped = self.cbImage.image.copy()
-            else:
-                warped = video.warp(self.cbImage.image, warp.points)
+        if self.vision.prewarped:
+            warped = self.cbImage.image.copy()
+        elif nowarp:
+            warped = self.cbImage.image.copy()
             if warp.rotation > 0:
                 warped = video.rotate(warped, warp.rotation)
+        elif warp.warping:
+            warped = video.warpAndRotate(
+                self.cbImage.image, warp.points, warp.rotation, offset=self.offset
+            )
         else:
             warped = self.cbImage.image.copy()
         self.cbWarped = ChessBoardImage(warped, "warped")
 
+    def warpPoints(self):
+        """get the warp points relative to my image's offset"""
+        points = self.vision.warp.points
+        if self.offset != (0, 0):
+            points = points - np.array(self.offset)
+        return points
+
     def prepareGUI(self):
         video = self.vision.video
         warp = self.vision.warp
@@ -3,7 +3,9 @@
 # <uml>
 #   Trapez2Square <|-- ChessTrapezoid
 #   ChessTrapezoid -- ChessTSquare
-#   ChessTSquare -- SquareChange
+#   ChessTrapezoid -- SquareChanges
+#   SquareChanges -- SquareChange
+#   ChessTrapezoid -- SquareSnapshots
 #   ChessTSquare -- FieldState
 # </uml>
 import math
@@ -17,7 +19,8 @@ from zope.interface import implementer
 
 from pcwawc.chessimage import ChessBoardImage
 from pcwawc.chessvision import FieldState, ISquare
-from pcwawc.runningstats import MinMaxStats, MovingAverage
+from pcwawc.histogram import Histogram
+from pcwawc.runningstats import MinMaxStats, MovingAverage, RunningStatsArray
 from pcwawc.video import Video
 
 
@@ -66,16 +69,15 @@ class Trapez2Square:
         x, y = xy[0], xy[1]
         return x, y
 
+    def relativeToTrapezXYs(self, rxys):
+        """convert an array of relative 0-1 based coordinates to coordinates in the trapez with a single transform"""
+        rxys = np.asarray(rxys, dtype=np.float32).reshape(-1, 1, 2)
+        xys = cv2.perspectiveTransform(rxys, self.transform)
+        return xys.reshape(-1, 2)
+
     def relativeTrapezToTrapezXY(self, rx1, ry1, rx2, ry2):
-        return np.asarray(
-            [
-                self.relativeToTrapezXY(rx1, ry1),
-                self.relativeToTrapezXY(rx2, ry1),
-                self.relativeToTrapezXY(rx2, ry2),
-                self.relativeToTrapezXY(rx1, ry2),
-            ],
-            dtype=np.int32,
-        )
+        xys = self.relativeToTrapezXYs([(rx1, ry1), (rx2, ry1), (rx2, ry2), (rx1, ry2)])
+        return xys.astype(np.int32)
 
 
 class ChessTrapezoid(Trapez2Square):
@@ -89,6 +91,19 @@ class ChessTrapezoid(Trapez2Square):
     # default radius of pieces
     PieceRadiusFactor = 3
     DiffSumMovingAverageLength = 5
+    # memoized geometries by trapezoid points and ideal size
+    geometryCache = {}
+    geometryCacheSize = 32
+    # range factors of the color check to optimize the selectivity with
+    rangeFactors = [x * 0.05 for x in range(20, 41)]
+    # label of the pixels not belonging to any square in the label map
+    unlabeled = 64
+    # quantization step of the average colors the cached ideal board is drawn with
+    idealColorStep = 4
+    # number of pre and post move images kept per square, their scale and if they are kept in grayscale
+    snapshotDepth = 2
+    snapshotScale = 1.0
+    snapshotGray = False
 
     def __init__(self, trapezPoints, idealSize=640, rotation=0, video=None):
         self.rotation = rotation
@@ -117,6 +132,34 @@ class ChessTrapezoid(Trapez2Square):
         # dict for average Colors
         self.averageColors = {}
         self.diffSumAverage = MovingAverage(ChessTrapezoid.DiffSumMovingAverageLength)
+        # running statistics of the change values of all squares
+        self.changeStats = RunningStatsArray(len(chess.SQUARES))
+        self.changes = None
+        # images of the squares in the last stable frames before a move and the squares still referring to them
+        self.preMoveSnapshots = SquareSnapshots(
+            ChessTrapezoid.snapshotDepth,
+            ChessTrapezoid.snapshotScale,
+            ChessTrapezoid.snapshotGray,
+        )
+        self.hasPreMove = np.zeros(len(chess.SQUARES), bool)
+        # images of the squares after they have been moved
+        self.postMoveSnapshots = SquareSnapshots(
+            ChessTrapezoid.snapshotDepth,
+            ChessTrapezoid.snapshotScale,
+            ChessTrapezoid.snapshotGray,
+        )
+        self.geometry = self.getGeometry()
+        self.board = None
+        # cached reference boards with the keys they have been drawn for - see idealColoredBoard and preMoveBoard
+        self.idealBoard = None
+        self.idealBoardKey = None
+        self.idealColors = None
+        self.preMoveRef = None
+        self.preMoveRefKey = None
+        # label image of the squares - depends on the geometry and the piece positions
+        self.labels = None
+        # label image of the field states covering each pixel - see fieldStateMap
+        self.fieldStateLabels = None
         # trapezoid representation of squares
         self.tsquares = {}
         for square in chess.SQUARES:
@@ -125,6 +168,17 @@ class ChessTrapezoid(Trapez2Square):
                 print(vars(tsquare))
             self.tsquares[tsquare.square] = tsquare
 
+    def getGeometry(self):
+        """get the geometry of my squares - the same trapezoid points and ideal size share the geometry - the rotation is part of the order of the points"""
+        key = (self.pts_dst.tobytes(), self.idealSize)
+        geometry = ChessTrapezoid.geometryCache.get(key)
+        if geometry is None:
+            geometry = TrapezoidGeometry(self)
+            if len(ChessTrapezoid.geometryCache) >= ChessTrapezoid.geometryCacheSize:
+                ChessTrapezoid.geometryCache.clear()
+            ChessTrapezoid.geometryCache[key] = geometry
+        return geometry
+
     def relativeToIdealXY(self, rx, ry):
         x = int(rx * self.idealSize)
         y = int(ry * self.idealSize)
@@ -175,10 +229,17 @@ class ChessTrapezoid(Trapez2Square):
     def updatePieces(self, fen):
         """update the piece positions according to the given FEN"""
         self.board = chess.Board(fen)
+        changed = []
         for tsquare in self.genSquares():
             piece = self.board.piece_at(tsquare.square)
+            if piece != tsquare.piece:
+                changed.append(tsquare)
             tsquare.piece = piece
             tsquare.fieldState = tsquare.getFieldState()
+        self.labels = None
+        self.fieldStateLabels = None
+        if self.idealBoard is not None and changed:
+            self.updateIdealBoard(changed)
 
     def drawFieldStates(
         self, image, fieldStates, transformation=Transformation.ORIGINAL, channels=3
@@ -216,18 +277,86 @@ class ChessTrapezoid(Trapez2Square):
         return diffSumValue
 
     def idealColoredBoard(self, w, h, transformation=Transformation.IDEAL):
-        """draw an 'ideal' colored board according to a given set of parameters e.g. fieldColor, pieceColor, pieceRadius"""
-        idealImage = self.video.getEmptyImage4WidthAndHeight(w, h, 3)
-        for tsquare in self.genSquares():
-            tsquare.drawState(idealImage, transformation, 3)
-        return ChessBoardImage(idealImage, "ideal")
+        """draw an 'ideal' colored board according to a given set of parameters e.g. fieldColor, pieceColor, pieceRadius
+
+        the board in the ideal transformation is cached and only redrawn if the pieces, the quantized average colors or the size change
+        - the cached image is read only
+        """
+        if transformation != Transformation.IDEAL:
+            idealImage = self.video.getEmptyImage4WidthAndHeight(w, h, 3)
+            for tsquare in self.genSquares():
+                tsquare.drawState(idealImage, transformation, 3)
+            return ChessBoardImage(idealImage, "ideal")
+        colors = self.quantizedColors()
+        key = self.idealKey(colors, w, h)
+        if key != self.idealBoardKey:
+            idealImage = self.video.getEmptyImage4WidthAndHeight(w, h, 3)
+            for tsquare in self.genSquares():
+                tsquare.drawState(idealImage, transformation, 3, colors)
+            idealImage.flags.writeable = False
+            self.idealBoard = ChessBoardImage(idealImage, "ideal")
+            self.idealBoardKey = key
+            self.idealColors = colors
+        return self.idealBoard
+
+    def idealKey(self, colors, w, h):
+        """get the key of the ideal board for the given colors and size"""
+        placement = None if self.board is None else self.board.board_fen()
+        colorKey = tuple(colors.get(fieldState) for fieldState in FieldState)
+        return (placement, colorKey, w, h)
+
+    def quantizedColors(self):
+        """get the average colors of my field states quantized by the idealColorStep"""
+        step = ChessTrapezoid.idealColorStep
+        colors = {}
+        for fieldState, averageColor in self.averageColors.items():
+            colors[fieldState] = tuple(
+                min(int(round(value / step)) * step, 255)
+                for value in averageColor.color
+            )
+        return colors
+
+    def updateIdealBoard(self, changedSquares):
+        """redraw the given squares of the cached ideal board e.g. after a move - a copy is updated since the cached image might still be in use"""
+        idealImage = self.idealBoard.image.copy()
+        for tsquare in changedSquares:
+            tsquare.redrawState(idealImage, self.idealColors)
+        idealImage.flags.writeable = False
+        self.idealBoard = ChessBoardImage(idealImage, "ideal")
+        h, w = idealImage.shape[:2]
+        self.idealBoardKey = self.idealKey(self.idealColors, w, h)
 
     def preMoveBoard(self, w, h):
-        """get an image of the board as it was before any move"""
+        """get an image of the board as it was before any move
+
+        the image is cached for the pre move snapshots and the squares referring to them - squares that are cleared are blanked in a copy
+        """
+        key = (self.hasPreMove.tobytes(), w, h)
+        version = self.preMoveSnapshots.version
+        if self.preMoveRef is not None and self.preMoveRefKey[0] == version:
+            if self.preMoveRefKey[1:] == key:
+                return self.preMoveRef
+            hadPreMove = np.frombuffer(self.preMoveRefKey[1], bool)
+            if (
+                self.preMoveRefKey[2:] == key[1:]
+                and not (self.hasPreMove & ~hadPreMove).any()
+            ):
+                refImage = self.preMoveRef.image.copy()
+                for square in np.flatnonzero(hadPreMove & ~self.hasPreMove):
+                    h, w, x, y, dh, dw = self.tsquares[int(square)].rxy2xy(refImage)
+                    refImage[y : y + dh, x : x + dw] = 0
+                return self.cachePreMoveBoard(refImage, key)
         refImage = self.video.getEmptyImage4WidthAndHeight(w, h, 3)
         for tsquare in self.genSquares():
             tsquare.addPreMoveImage(refImage)
-        return ChessBoardImage(refImage, "preMove ref")
+        return self.cachePreMoveBoard(refImage, key)
+
+    def cachePreMoveBoard(self, refImage, key):
+        """cache the given pre move image for the given key"""
+        refImage.flags.writeable = False
+        self.preMoveRef = ChessBoardImage(refImage, "preMove ref")
+        self.preMoveRefKey = (self.preMoveSnapshots.version,) + key
+        return self.preMoveRef
 
     def drawDebug(self, image, color=(255, 255, 255)):
         """draw debug information e.g. piecel symbol and an onto the given image"""
@@ -244,17 +373,78 @@ class ChessTrapezoid(Trapez2Square):
             sortedTSquares[tsquare.fieldState].append(tsquare)
         return sortedTSquares
 
+    def labelMap(self, w, h):
+        """get the label image of my squares for the given size - empty squares are labeled completely, occupied squares by their piece disc"""
+        if self.labels is None or self.labels.shape != (h, w):
+            labels = np.full((h, w), ChessTrapezoid.unlabeled, np.uint8)
+            for tsquare in self.genSquares():
+                tsquare.drawLabel(labels)
+            self.labels = labels
+            # offsets of the pixels into a joint histogram of label and color value
+            self.labelOffsets = labels.ravel().astype(np.intp) * 256
+        return self.labels
+
+    def squareStats(self, image):
+        """get the pixel counts, the color sums and the squared color sums per square label of the given image
+
+        the sums are derived from the per label histograms of Histogram.labelHistograms
+        """
+        h, w = image.shape[:2]
+        self.labelMap(w, h)
+        labelCount = ChessTrapezoid.unlabeled + 1
+        hists = Histogram.labelHistograms(
+            image, self.labels, labelCount, self.labelOffsets
+        )
+        channels = len(hists)
+        levels = np.arange(256.0)
+        sums = np.empty((labelCount, channels))
+        sqsums = np.empty((labelCount, channels))
+        for channel, histogram in enumerate(hists):
+            sums[:, channel] = histogram @ levels
+            sqsums[:, channel] = histogram @ (levels * levels)
+        counts = histogram.sum(axis=1)
+        return counts, sums, sqsums
+
+    def fieldStateMap(self, w, h):
+        """get the field state label image for the given size - each pixel is labeled with the bits 1<<fieldState of all field state masks covering it
+
+        the masks are drawn with drawFieldStates so that the masks of neighbouring squares overlap at their borders
+        """
+        if self.fieldStateLabels is None or self.fieldStateLabels.shape != (h, w):
+            fieldStateLabels = np.zeros((h, w), np.uint8)
+            mask = np.empty((h, w), np.uint8)
+            for fieldState in FieldState:
+                mask.fill(0)
+                self.drawFieldStates(mask, [fieldState], Transformation.IDEAL, 1)
+                fieldStateLabels[mask > 0] |= 1 << fieldState
+            self.fieldStateLabels = fieldStateLabels
+            self.fieldStateOffsets = fieldStateLabels.ravel().astype(np.intp) * 256
+        return self.fieldStateLabels
+
     def analyzeColors(self, cbImage):
-        """get the average colors per fieldState"""
+        """get the average colors per fieldState
+
+        the histograms of all field state masks are counted in one pass over the field state label image
+        """
+        image = cbImage.image
+        h, w = image.shape[:2]
+        self.fieldStateMap(w, h)
+        labelCount = 1 << len(FieldState)
+        hists = Histogram.labelHistograms(
+            image, self.fieldStateLabels, labelCount, self.fieldStateOffsets
+        )
+        labels = np.arange(labelCount)
         byFieldState = self.byFieldState()
         for fieldState in byFieldState.keys():
-            mask = self.video.getEmptyImage(cbImage.image)
-            self.drawFieldStates(mask, [fieldState], Transformation.IDEAL, 1)
-            masked = self.video.maskImage(cbImage.image, mask)
+            covered = (labels & (1 << fieldState)) != 0
             countedFields = len(byFieldState[fieldState])
-            averageColor = Color(masked)
+            averageColor = Color.fromHistograms(
+                [hist[covered].sum(axis=0) for hist in hists], h * w
+            )
             self.averageColors[fieldState] = averageColor
             if ChessTrapezoid.showDebugImage:
+                mask = (self.fieldStateLabels & (1 << fieldState)).astype(np.uint8)
+                masked = self.video.maskImage(image, mask)
                 self.video.showImage(masked, fieldState.title())
             if ChessTrapezoid.colorDebug:
                 print(
@@ -263,14 +453,17 @@ class ChessTrapezoid(Trapez2Square):
         return self.averageColors
 
     def optimizeColorCheck(self, cbImage, averageColors, debug=False):
+        """optimize the range factor for the color check - all factors are checked in one pass"""
         optimalSelectivity = -100
         colorStats = None
-        for factor in [x * 0.05 for x in range(20, 41)]:
-            """optimize the factor for the color check"""
-            startc = timer()
-            fieldColorStatsCandidate = self.checkColors(cbImage, averageColors, factor)
-            endc = timer()
-            fieldColorStatsCandidate.analyzeStats(factor, endc - startc)
+        rangeFactors = ChessTrapezoid.rangeFactors
+        startc = timer()
+        candidates = self.checkColorsForFactors(cbImage, averageColors, rangeFactors)
+        endc = timer()
+        for factor, fieldColorStatsCandidate in zip(rangeFactors, candidates):
+            fieldColorStatsCandidate.analyzeStats(
+                factor, (endc - startc) / len(candidates)
+            )
             if fieldColorStatsCandidate.minSelectivity > optimalSelectivity:
                 optimalSelectivity = fieldColorStatsCandidate.minSelectivity
                 colorStats = fieldColorStatsCandidate
@@ -278,70 +471,112 @@ class ChessTrapezoid(Trapez2Square):
                     print(
                         "selectivity %5.1f white: %5.1f black: %5.1f "
                         % (
-                            self.minSelectivity,
-                            self.whiteSelectivity,
-                            self.blackSelectivity,
+                            colorStats.minSelectivity,
+                            colorStats.whiteSelectivity,
+                            colorStats.blackSelectivity,
                         )
                     )
         return colorStats
 
     def checkColors(self, cbImage, averageColors, rangeFactor=1.0):
         """check the colors against the expectation"""
+        return self.checkColorsForFactors(cbImage, averageColors, [rangeFactor])[0]
+
+    def checkColorsForFactors(self, cbImage, averageColors, rangeFactors):
+        """check the colors against the expectation for all of the given ascending range factors
+
+        each pixel is mapped to the index of the smallest factor for which it is in range so that
+        the cumulated histogram of these indices gives the in range count of a square for every factor
+        """
         byFieldState = self.byFieldState()
-        colorStats = FieldColorStats()
+        colorStatsList = [FieldColorStats() for rangeFactor in rangeFactors]
+        rangeIndexLUTs = {}
         for fieldState in byFieldState.keys():
-            # https://stackoverflow.com/questions/54019108/how-to-count-the-pixels-of-a-certain-color-with-opencv
             if fieldState in [
                 FieldState.WHITE_BLACK,
                 FieldState.WHITE_EMPTY,
                 FieldState.WHITE_WHITE,
             ]:
-                averageColor = averageColors[FieldState.WHITE_EMPTY]
+                emptyState = FieldState.WHITE_EMPTY
             else:
-                averageColor = averageColors[FieldState.BLACK_EMPTY]
+                emptyState = FieldState.BLACK_EMPTY
+            averageColor = averageColors[emptyState]
+            if emptyState not in rangeIndexLUTs:
+                rangeIndexLUTs[emptyState] = averageColor.rangeIndexLUT(rangeFactors)
+            lut = rangeIndexLUTs[emptyState]
             fields = byFieldState[fieldState]
-            lower, upper = averageColor.colorRange(rangeFactor)
             if ChessTrapezoid.colorDebug:
-                print(
-                    "%25s (%2d): %s -> %s - %s"
-                    % (fieldState.title(), len(fields), averageColor, lower, upper)
-                )
-            for tsquare in fields:
+                for rangeFactor in rangeFactors:
+                    lower, upper = averageColor.colorRange(rangeFactor)
+                    print(
+                        "%25s (%2d): %s -> %s - %s"
+                        % (fieldState.title(), len(fields), averageColor, lower, upper)
+                    )
+            # in range percentages by square and range factor
+            percents = np.empty((len(fields), len(rangeFactors) + 1))
+            for index, tsquare in enumerate(fields):
                 squareImage = tsquare.getSquareImage(cbImage)
-                asExpected = cv2.inRange(squareImage, lower, upper)
-                h, w = squareImage.shape[:2]
-                pixels = h * w
-                nonzero = cv2.countNonZero(asExpected)
-                colorStats.push(fieldState, tsquare.an, nonzero / pixels * 100)
-                # self.video.showImage(asExpected,tsquare.an)
-        return colorStats
+                b, g, r = cv2.split(cv2.LUT(squareImage, lut))
+                rangeIndex = cv2.max(cv2.max(b, g), r)
+                inRange = np.cumsum(
+                    np.bincount(rangeIndex.ravel(), minlength=len(rangeFactors) + 1)
+                )
+                percents[index] = inRange / rangeIndex.size * 100
+            ans = [tsquare.an for tsquare in fields]
+            for index, colorStats in enumerate(colorStatsList):
+                colorStats.pushAll(fieldState, ans, percents[:, index])
+        return colorStatsList
+
+    def squareSums(self, image):
+        """get the sums of the given image within the rectangles of all squares as an array indexed by square
+
+        the rectangles are those of ChessTSquare.rxy2xy and summed as boxes of the integral image
+        """
+        rows, cols = ChessTrapezoid.rows, ChessTrapezoid.cols
+        h, w = image.shape[:2]
+        dh, dw = h // rows, w // cols
+        ys = (np.arange(rows) * ChessTSquare.rh * h).astype(np.intp)
+        xs = (np.arange(cols) * ChessTSquare.rw * w).astype(np.intp)
+        # 32 bit integer sums might overflow for 4K images
+        integral = cv2.integral(image, sdepth=cv2.CV_64F).reshape(h + 1, w + 1, -1)
+        boxSums = (
+            integral[np.ix_(ys + dh, xs + dw)]
+            - integral[np.ix_(ys, xs + dw)]
+            - integral[np.ix_(ys + dh, xs)]
+            + integral[np.ix_(ys, xs)]
+        )
+        sums = boxSums.sum(axis=2).astype(np.int64)
+        # rows are ranks from 8 to 1 and squares are numbered from a1 to h8
+        return sums[::-1].ravel()
 
     def detectChanges(self, cbImageSet, detectState):
         """detect the changes of the given imageset using the given detect state machine"""
         detectState.nextFrame()
-        changes = {}
-        validChanges = 0
-        diffSum = 0
-        cbImage = cbImageSet.cbImage
+        cbWarped = cbImageSet.cbWarped
         cbDiff = cbImageSet.cbDiff
-        for tsquare in self.genSquares():
-            squareChange = tsquare.squareChange(cbImage.image, cbDiff.image)
-            changes[tsquare.an] = squareChange
-            diffSum += abs(squareChange.diff)
-            if squareChange.valid:
-                validChanges += 1
-            # if self.frames==1:
-            #    tsquare.preMoveImage=np.copy(tsquare.squareImage)
+        h, w = cbDiff.image.shape[:2]
+        # the value is 64 times lower then the per pixel value
+        values = self.squareSums(cbDiff.image) / (h * w)
+        mean = self.changeStats.mean()
+        variance = self.changeStats.variance()
+        diff = values - mean
+        # the first values of a square calibrate its statistics
+        calibrating = self.changeStats.n < SquareChange.meanFrameCount
+        self.changeStats.push(values, calibrating)
+        diff[calibrating] = 0
+        valid = ~calibrating & (np.abs(diff) < SquareChange.treshold)
+        self.changes = SquareChanges(values, mean, diff, variance, valid)
+        validChanges = int(np.count_nonzero(valid))
+        diffSum = float(np.abs(diff).sum())
 
         self.diffSumAverage.push(diffSum)
         diffSumDelta = self.diffSumAverage.mean() - diffSum
         detectState.check(
-            validChanges, diffSum, diffSumDelta, squareChange.meanFrameCount
+            validChanges, diffSum, diffSumDelta, SquareChange.meanFrameCount
         )
-        for tsquare in self.genSquares():
-            squareChange = changes[tsquare.an]
-            tsquare.checkMoved(detectState)
+        self.checkMoved(cbWarped, detectState, valid)
 
+        changes = self.changes
         changes["validBoard"] = detectState.validBoard
         changes["valid"] = validChanges
         changes["diffSum"] = diffSum
@@ -350,6 +585,37 @@ class ChessTrapezoid(Trapez2Square):
         changes["invalidFrames"] = detectState.invalidFrames
         return changes
 
+    def clearChanges(self):
+        """forget the change statistics and pre move images of all squares e.g. after a move has been made"""
+        self.changeStats.clear()
+        self.hasPreMove[:] = False
+
+    def checkMoved(self, cbImage, detectState, valid):
+        """check which figures have been moved, so that the state of their squares has changed"""
+        # if the whole board is valid
+        if detectState.validBoard:
+            # if we come from an stable invalid period then the squares that are not valid have likely been moved
+            if detectState.invalidStable:
+                moved = self.hasPreMove & ~valid
+                self.postMoveSnapshots.store(cbImage.image, moved)
+                for square in np.flatnonzero(moved):
+                    tsquare = self.tsquares[int(square)]
+                    if detectState.onPieceMoveDetected is not None:
+                        detectState.onPieceMoveDetected(tsquare)
+                self.changeStats.clear(moved)
+                self.hasPreMove[moved] = False
+            detectState.invalidEnd()
+            # add the current change values to the statistics
+            self.changeStats.push(self.changes.value, valid)
+            # if we have been valid for a long enough period of time
+            if detectState.validStable:
+                # remember the images of the squares - we are ready to detect a move
+                self.preMoveSnapshots.store(cbImage.image)
+                self.hasPreMove[:] = True
+        else:
+            if detectState.invalidStarted:
+                detectState.validEnd()
+
 
 class FieldColorStats(object):
     """Color statistics for Fields"""
@@ -364,6 +630,11 @@ class FieldColorStats(object):
         self.colorPercent[an] = percent
         self.stats[fieldState].push(percent)
 
+    def pushAll(self, fieldState, ans, percents):
+        """push the percentages of the squares with the given algebraic notations at once"""
+        self.colorPercent.update(zip(ans, percents.tolist()))
+        self.stats[fieldState].pushAll(percents)
+
     def analyzeStats(self, factor, time, debug=False):
         self.factor = factor
         self.whiteEmptyMin = self.stats[FieldState.WHITE_EMPTY].min
@@ -423,7 +694,7 @@ class Color:
     def __init__(self, image):
         """pick the average color from the given image"""
         # https://stackoverflow.com/a/43112217/1497139
-        (means, stds) = cv2.meanStdDev(image)
+        means, stds = cv2.meanStdDev(image)
         pixels, nonzero = Color.countNonZero(image)
         # exotic case of a totally black picture
         if nonzero == 0:
@@ -432,6 +703,39 @@ class Color:
         else:
             self.color, self.stds = self.fixMeans(means, stds, pixels, nonzero)
 
+    @staticmethod
+    def fromHistograms(hists, pixels):
+        """get the average color for the per channel histograms of a masked image with the given number of pixels
+
+        the masked out and black pixels are excluded as with the constructor
+        """
+        color = Color.__new__(Color)
+        levels = np.arange(256.0)
+        nonzero = max(int(hist[1:].sum()) for hist in hists)
+        if nonzero == 0:
+            color.color = (0, 0, 0)
+            color.stds = (0, 0, 0)
+        else:
+            means = np.array([[hist @ levels / pixels] for hist in hists])
+            sqmeans = np.array([[hist @ (levels * levels) / pixels] for hist in hists])
+            stds = np.sqrt(np.maximum(sqmeans - means * means, 0))
+            color.color, color.stds = color.fixMeans(means, stds, pixels, nonzero)
+        return color
+
+    @staticmethod
+    def fromStats(pixels, sums, sqsums):
+        """get the average color for the given number of pixels with the given color sums and squared color sums"""
+        color = Color.__new__(Color)
+        if pixels == 0:
+            color.color = (0, 0, 0)
+            color.stds = (0, 0, 0)
+        else:
+            means = sums / pixels
+            stds = np.sqrt(np.maximum(sqsums / pixels - means * means, 0))
+            color.color = tuple(means)
+            color.stds = tuple(stds)
+        return color
+
     @staticmethod
     def countNonZero(image):
         # https://stackoverflow.com/a/55163686/1497139
@@ -467,6 +771,17 @@ class Color:
         )
         return lower, upper
 
+    def rangeIndexLUT(self, rangeFactors):
+        """get a lookup table for cv2.LUT with the index of the smallest of the given ascending range factors whose color range contains a value per channel - len(rangeFactors) if none does"""
+        values = np.arange(256)
+        ranges = [self.colorRange(rangeFactor) for rangeFactor in rangeFactors]
+        lower = np.array([lower for lower, upper in ranges])
+        upper = np.array([upper for lower, upper in ranges])
+        inRange = (lower[:, :, None] <= values) & (values <= upper[:, :, None])
+        # the ranges grow with the factor so the first one containing a value is the smallest
+        lut = np.where(inRange.any(axis=0), inRange.argmax(axis=0), len(rangeFactors))
+        return np.ascontiguousarray(lut.T, np.uint8).reshape(256, 1, 3)
+
     def fixMeans(self, means, stds, pixels, nonzero):
         """fix the zero based means to nonzero based see https://stackoverflow.com/a/58891531/1497139"""
         gmean, bmean, rmean = means.flatten()
@@ -496,27 +811,181 @@ class Color:
 
 
 class SquareChange:
-    """keep track of changes of a square over time"""
+    """the change of a square in a frame compared to the running statistics of its earlier values"""
 
     meanFrameCount = 10
     treshold = 0.2
 
-    def __init__(self, value, stats):
-        """construct me from the given value with the given running stats"""
+    def __init__(self, value, mean, diff, variance, valid):
+        """construct me from the given value, mean, difference to the mean, variance and validity"""
         self.value = value
-        self.mean = stats.mean()
-        self.diff = value - self.mean
-        self.variance = stats.variance()
-        if stats.n < SquareChange.meanFrameCount:
-            stats.push(value)
-            self.valid = False
-            self.diff = 0
-        else:
-            self.valid = abs(self.diff) < SquareChange.treshold
+        self.mean = mean
+        self.diff = diff
+        self.variance = variance
+        self.valid = valid
+
+
+class SquareChanges(dict):
+    """the changes of all squares in a frame as arrays indexed by square
+
+    the SquareChange of a single square is only created when it is looked up by its algebraic notation
+    """
+
+    def __init__(self, value, mean, diff, variance, valid):
+        super().__init__()
+        self.value = value
+        self.mean = mean
+        self.diff = diff
+        self.variance = variance
+        self.valid = valid
+
+    def __missing__(self, an):
+        if an not in chess.SQUARE_NAMES:
+            raise KeyError(an)
+        square = chess.parse_square(an)
+        squareChange = SquareChange(
+            self.value[square],
+            self.mean[square],
+            self.diff[square],
+            self.variance[square],
+            bool(self.valid[square]),
+        )
+        self[an] = squareChange
+        return squareChange
+
+
+class SquareSnapshots:
+    """a bounded store of copies of the images of all squares
+
+    the images are kept in a preallocated array with a ring of the given depth per square, optionally downscaled and in grayscale
+    so that no frame is kept alive by a view on it and the memory needed stays the same however long a game takes
+    """
+
+    def __init__(self, depth=2, scale=1.0, gray=False):
+        """construct me with the given number of images per square, scale and grayscale option"""
+        self.depth = depth
+        self.scale = scale
+        self.gray = gray
+        self.images = None
+        # number of images stored for each square so far
+        self.counts = np.zeros(len(chess.SQUARES), np.int64)
+        # incremented with each store e.g. to invalidate images derived from the snapshots
+        self.version = 0
+
+    def allocate(self, image):
+        """allocate the images for squares of the given board image"""
+        h, w = image.shape[:2]
+        dh, dw = h // ChessTrapezoid.rows, w // ChessTrapezoid.cols
+        if self.scale != 1.0:
+            dh, dw = max(int(dh * self.scale), 1), max(int(dw * self.scale), 1)
+        shape = (len(chess.SQUARES), self.depth, dh, dw)
+        if not self.gray and image.ndim == 3:
+            shape = shape + (image.shape[2],)
+        self.images = np.zeros(shape, np.uint8)
+        self.counts[:] = 0
+        self.frameShape = image.shape
+
+    def squareImages(self, image):
+        """get the images of all squares of the given board image as an array indexed by row and column"""
+        if self.gray and image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        dh, dw = self.images.shape[2:4]
+        rows, cols = ChessTrapezoid.rows, ChessTrapezoid.cols
+        h, w = image.shape[:2]
+        if self.scale != 1.0:
+            image = cv2.resize(
+                image, (dw * cols, dh * rows), interpolation=cv2.INTER_AREA
+            )
+        elif h != dh * rows or w != dw * cols:
+            # the squares do not tile the image - pick them like ChessTSquare.rxy2xy
+            tiles = np.empty((rows, cols) + self.images.shape[2:], np.uint8)
+            for row in range(rows):
+                y = int(row * h / rows)
+                for col in range(cols):
+                    x = int(col * w / cols)
+                    tiles[row, col] = image[y : y + dh, x : x + dw]
+            return tiles
+        return image.reshape((rows, dh, cols, dw) + image.shape[2:]).swapaxes(1, 2)
+
+    def store(self, image, mask=None):
+        """store copies of the images of the squares selected by the given mask - all squares if no mask is given"""
+        if self.images is None or self.frameShape != image.shape:
+            self.allocate(image)
+        squares = np.arange(len(chess.SQUARES))
+        if mask is not None:
+            squares = squares[mask]
+        if len(squares) == 0:
+            return
+        tiles = self.squareImages(image)
+        # the first row of the image is the eighth rank
+        rows = ChessTrapezoid.rows - 1 - squares // ChessTrapezoid.cols
+        cols = squares % ChessTrapezoid.cols
+        slots = self.counts[squares] % self.depth
+        for slot in np.unique(slots):
+            inSlot = slots == slot
+            if inSlot.all() and len(squares) == len(chess.SQUARES):
+                # copy all squares at once
+                board = self.images[:, slot].reshape(tiles.shape)[::-1]
+                np.copyto(board, tiles)
+            else:
+                self.images[squares[inSlot], slot] = tiles[rows[inSlot], cols[inSlot]]
+        self.counts[squares] += 1
+        self.version += 1
+
+    def latest(self, square, age=0):
+        """get the image of the given square stored age stores before the latest one - None if there is no such image"""
+        if self.images is None or age >= min(self.counts[square], self.depth):
+            return None
+        slot = (self.counts[square] - 1 - age) % self.depth
+        return self.images[square, slot]
+
+    def history(self, square):
+        """get the images of the given square latest first"""
+        count = min(self.counts[square], self.depth)
+        return [self.latest(square, age) for age in range(count)]
+
+    def paste(self, snapshot, region):
+        """paste the given snapshot into the given region of a color image"""
+        if snapshot.ndim == 2 and region.ndim == 3:
+            snapshot = cv2.cvtColor(snapshot, cv2.COLOR_GRAY2BGR)
+        h, w = region.shape[:2]
+        if snapshot.shape[:2] != (h, w):
+            snapshot = cv2.resize(snapshot, (w, h))
+        np.copyto(region, snapshot)
+
+
+class TrapezoidGeometry:
+    """the corners, centers and polygons of all squares of a chess trapezoid computed with a single perspective transform
+
+    the arrays are indexed by row and column and are read only since they are shared by all trapezoids with the same points
+    """
+
+    def __init__(self, trapez):
+        """construct me for the given chess trapezoid"""
+        rows, cols = ChessTrapezoid.rows, ChessTrapezoid.cols
+        # relative coordinates of the grid of square corners - rgrid[row,col]=(col/cols,row/rows)
+        rxs, rys = np.meshgrid(np.arange(cols + 1) / cols, np.arange(rows + 1) / rows)
+        rgrid = np.stack((rxs, rys), axis=-1)
+        rcenters = (rgrid[:-1, :-1] + rgrid[1:, 1:]) / 2
+        corners = (rows + 1) * (cols + 1)
+        xys = trapez.relativeToTrapezXYs(
+            np.concatenate((rgrid.reshape(-1, 2), rcenters.reshape(-1, 2)))
+        )
+        self.grid = xys[:corners].reshape(rows + 1, cols + 1, 2)
+        self.centers = xys[corners:].reshape(rows, cols, 2)
+        self.rpolygons = TrapezoidGeometry.squarePolygons(rgrid)
+        self.idealPolygons = (self.rpolygons * trapez.idealSize).astype(np.int32)
+        self.polygons = TrapezoidGeometry.squarePolygons(self.grid)
+        self.ipolygons = self.polygons.astype(np.int32)
+        for array in vars(self).values():
+            array.flags.writeable = False
 
-    def push(self, stats, value):
-        if self.valid:
-            stats.push(value)
+    @staticmethod
+    def squarePolygons(grid):
+        """get the polygons of all squares from top left via top right, bottom right to bottom left for the given grid of corners"""
+        return np.stack(
+            (grid[:-1, :-1], grid[:-1, 1:], grid[1:, 1:], grid[1:, :-1]), axis=2
+        )
 
 
 @implementer(ISquare)
@@ -532,7 +1001,6 @@ class ChessTSquare:
     def __init__(self, trapez, square):
         """construct me from the given trapez  and square"""
         self.trapez = trapez
-        self.changeStats = MinMaxStats()
         self.square = square
         self.an = chess.SQUARE_NAMES[square]
         # rank are rows in Algebraic Notation from 1 to 8
@@ -543,41 +1011,18 @@ class ChessTSquare:
         self.fieldColor = chess.WHITE if (self.col + self.row) % 2 == 1 else chess.BLACK
         self.fieldState = None
         self.piece = None
-        self.preMoveImage = None
-        self.postMoveImage = None
 
         self.rPieceRadius = ChessTSquare.rw / ChessTrapezoid.PieceRadiusFactor
 
         self.rx, self.ry = self.col * ChessTSquare.rw, self.row * ChessTSquare.rh
         self.rcx = self.rx + ChessTSquare.rw * 0.5
         self.rcy = self.ry + ChessTSquare.rh * 0.5
-        self.x, self.y = trapez.relativeToTrapezXY(self.rx, self.ry)
-        self.setPolygons(
-            trapez,
-            self.rx,
-            self.ry,
-            self.rx + ChessTSquare.rw,
-            self.ry,
-            self.rx + ChessTSquare.rw,
-            self.ry + ChessTSquare.rh,
-            self.rx,
-            self.ry + ChessTSquare.rh,
-        )
-
-    def setPolygons(
-        self, trapez, rtl_x, rtl_y, rtr_x, rtr_y, rbr_x, rbr_y, rbl_x, rbl_y
-    ):
-        """set my relative and warped polygons from the given relative corner coordinates from top left via top right, bottom right to bottom left"""
-        self.rpolygon = np.array(
-            [(rtl_x, rtl_y), (rtr_x, rtr_y), (rbr_x, rbr_y), (rbl_x, rbl_y)]
-        )
-        self.idealPolygon = (self.rpolygon * trapez.idealSize).astype(np.int32)
-        # function to use to calculate polygon
-        r2t = trapez.relativeToTrapezXY
-        self.polygon = np.array(
-            [r2t(rtl_x, rtl_y), r2t(rtr_x, rtr_y), r2t(rbr_x, rbr_y), r2t(rbl_x, rbl_y)]
-        )
-        self.ipolygon = self.polygon.astype(np.int32)
+        geometry = trapez.geometry
+        self.x, self.y = geometry.grid[self.row, self.col]
+        self.rpolygon = geometry.rpolygons[self.row, self.col]
+        self.idealPolygon = geometry.idealPolygons[self.row, self.col]
+        self.polygon = geometry.polygons[self.row, self.col]
+        self.ipolygon = geometry.ipolygons[self.row, self.col]
 
     def getPolygon(self, transformation):
         if transformation == Transformation.ORIGINAL:
@@ -609,24 +1054,28 @@ class ChessTSquare:
         # this can't happen
         return None
 
-    def drawState(self, image, transformation, channels):
-        """draw my state onto the given image with the given transformation and number of channels"""
+    def drawState(self, image, transformation, channels, colors=None):
+        """draw my state onto the given image with the given transformation and number of channels
+
+        the colors of the field states default to the average colors of my trapezoid
+        """
+        if colors is None:
+            colors = {
+                fieldState: averageColor.color
+                for fieldState, averageColor in self.trapez.averageColors.items()
+            }
         # default is drawing a single channel mask
         squareImageColor = 64
         pieceImageColor = squareImageColor
         if channels == 3:
             if self.fieldColor == chess.WHITE:
-                if FieldState.WHITE_EMPTY in self.trapez.averageColors:
-                    squareImageColor = self.trapez.averageColors[
-                        FieldState.WHITE_EMPTY
-                    ].color
+                if FieldState.WHITE_EMPTY in colors:
+                    squareImageColor = colors[FieldState.WHITE_EMPTY]
                 else:
                     squareImageColor = Color.white
             else:
-                if FieldState.BLACK_EMPTY in self.trapez.averageColors:
-                    squareImageColor = self.trapez.averageColors[
-                        FieldState.BLACK_EMPTY
-                    ].color
+                if FieldState.BLACK_EMPTY in colors:
+                    squareImageColor = colors[FieldState.BLACK_EMPTY]
                 else:
                     squareImageColor = Color.black
 
@@ -637,8 +1086,8 @@ class ChessTSquare:
 
         if self.piece is not None:
             if channels == 3:
-                if self.fieldState in self.trapez.averageColors:
-                    pieceImageColor = self.trapez.averageColors[self.fieldState].color
+                if self.fieldState in colors:
+                    pieceImageColor = colors[self.fieldState]
                 else:
                     pieceImageColor = (
                         Color.darkgrey
@@ -648,6 +1097,24 @@ class ChessTSquare:
             rcenter = self.rcenter()
             self.trapez.drawRCircle(image, rcenter, self.rPieceRadius, pieceImageColor)
 
+    def redrawState(self, image, colors):
+        """redraw my state onto the given ideal board image - my border pixels are shared with my neighbours and do not depend on the pieces so they are kept"""
+        x1, y1 = self.idealPolygon.min(axis=0)
+        x2, y2 = self.idealPolygon.max(axis=0)
+        region = image[y1 : y2 + 1, x1 : x2 + 1]
+        border = region.copy()
+        self.drawState(image, Transformation.IDEAL, 3, colors)
+        np.copyto(border[1:-1, 1:-1], region[1:-1, 1:-1])
+        np.copyto(region, border)
+
+    def drawLabel(self, labels):
+        """draw my square index onto the given label image - only the piece disc if i am occupied"""
+        if self.piece is None:
+            self.trapez.video.drawPolygon(labels, self.idealPolygon, self.square)
+        else:
+            rcenter = self.rcenter()
+            self.trapez.drawRCircle(labels, rcenter, self.rPieceRadius, self.square)
+
     def rcenter(self):
         rcx = self.rx + ChessTSquare.rw / 2
         rcy = self.ry + ChessTSquare.rh / 2
@@ -662,9 +1129,12 @@ class ChessTSquare:
         return h, w, x, y, dh, dw
 
     def addPreMoveImage(self, image):
-        if self.preMoveImage is not None:
+        preMoveImage = self.preMoveImage
+        if preMoveImage is not None:
             h, w, x, y, dh, dw = self.rxy2xy(image)
-            np.copyto(image[y : y + dh, x : x + dw], self.preMoveImage)
+            self.trapez.preMoveSnapshots.paste(
+                preMoveImage, image[y : y + dh, x : x + dw]
+            )
 
     def drawDebug(self, image, color=(255, 255, 255)):
         """draw debug information onto the given image using the given color"""
@@ -677,45 +1147,27 @@ class ChessTSquare:
         rcx, rcy = self.rcenter()
         self.trapez.drawRCenteredText(image, squareHint, rcx, rcy, color=color)
 
+    @property
+    def currentChange(self):
+        """my change in the frame last checked by my trapezoid"""
+        if self.trapez.changes is None:
+            return None
+        return self.trapez.changes[self.an]
+
+    @property
+    def preMoveImage(self):
+        """my image in the last stable frame before a move - None if i have been moved since"""
+        if not self.trapez.hasPreMove[self.square]:
+            return None
+        return self.trapez.preMoveSnapshots.latest(self.square)
+
+    @property
+    def postMoveImage(self):
+        """my image in the frame my piece has been detected to be moved in - None if it has not been moved yet"""
+        return self.trapez.postMoveSnapshots.latest(self.square)
+
     def getSquareImage(self, cbImage):
         """get the image of me within the given image"""
         h, w, x, y, dh, dw = self.rxy2xy(cbImage.image)
         squareImage = cbImage.image[y : y + dh, x : x + dw]
         return squareImage
-
-    def squareChange(self, image, diffImage):
-        """check the changes analyzing the difference image of this square"""
-        h, w, x, y, dh, dw = self.rxy2xy(image)
-
-        self.squareImage = image[y : y + dh, x : x + dw]
-        self.diffImage = diffImage[y : y + dh, x : x + dw]
-        diffSum = np.sum(self.diffImage)
-        # the value is 64 times lower then the per pixel value
-        self.currentChange = SquareChange(diffSum / (h * w), self.changeStats)
-        return self.currentChange
-
-    def checkMoved(self, detectState):
-        """check a figure has been moved, so that the state of this square has changed"""
-        squareChange = self.currentChange
-        # if the whole board is valid
-        if detectState.validBoard:
-            # if we come from an stable invalid period then this is likely a move
-            if detectState.invalidStable and self.preMoveImage is not None:
-                if not squareChange.valid:
-                    self.postMoveImage = self.squareImage
-                    if detectState.onPieceMoveDetected is not None:
-                        detectState.onPieceMoveDetected(self)
-                    self.changeStats.clear()
-                    self.preMoveImage = None
-
-            detectState.invalidEnd()
-            # add the current change statistics to my statistics
-            squareChange.push(self.changeStats, squareChange.value)
-            # if we have been valid for a long enough period of time
-            if detectState.validStable:
-                # remember my image - we are ready to detect a move
-                self.preMoveImage = self.squareImage
-                pass
-        else:
-            if detectState.invalidStarted:
-                detectState.validEnd()
@@ -6,21 +6,23 @@ Created on 2019-12-14
 
 from pcwawc.boarddetector import BoardDetector
 from pcwawc.simpledetector import Simple8x8Detector, SimpleDetector
+from pcwawc.trapezoiddetector import TrapezoidDetector
 
 
 class MoveDetectorFactory:
     detectors = {}
 
     @staticmethod
-    def register(detectorName, detector):
-        MoveDetectorFactory.detectors[detectorName] = detector
+    def register(detectorName, detectorClass):
+        MoveDetectorFactory.detectors[detectorName] = detectorClass
 
     """ factory for move detectors"""
 
     @staticmethod
     def create(detectorname, vision):
+        """create a new move detector instance with the given name for the given vision - each vision e.g. of a different board needs its own detector"""
         if detectorname in MoveDetectorFactory.detectors:
-            moveDetector = MoveDetectorFactory.detectors[detectorname]
+            moveDetector = MoveDetectorFactory.detectors[detectorname]()
             moveDetector.setup(detectorname, vision)
         else:
             raise Exception(
@@ -29,6 +31,7 @@ class MoveDetectorFactory:
         return moveDetector
 
 
-# MoveDetectorFactory.register("simple", SimpleDetector())
-MoveDetectorFactory.register("simple8x8", Simple8x8Detector())
-MoveDetectorFactory.register("luminance", BoardDetector())
+# MoveDetectorFactory.register("simple", SimpleDetector)
+MoveDetectorFactory.register("simple8x8", Simple8x8Detector)
+MoveDetectorFactory.register("luminance", BoardDetector)
+MoveDetectorFactory.register("trapezoid", TrapezoidDetector)
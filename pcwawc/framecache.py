@@ -0,0 +1,220 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import hashlib
+import json
+import os
+
+import cv2
+import numpy as np
+
+from pcwawc.environment import Environment
+from pcwawc.video import Video
+
+
+class FrameCache(object):
+    """decode once cache of the optionally warped and rotated frames of a video file
+
+    the frames are stored as a raw memory mapped file keyed by the hash of the video file, the warp points, the rotation and the lens calibration
+    so that repeated analysis runs e.g. while tuning detectors do not have to decode and warp again
+    """
+
+    debug = False
+    defaultPath = Environment.debugImagePath + "framecache"
+    # maximum number of bytes to cache for unwarped frames - full size frames of a long recording would fill the disk
+    maxUnwarpedBytes = 4 << 30
+
+    def __init__(self, cachePath=None):
+        """construct me for the given cache directory"""
+        self.cachePath = cachePath if cachePath else FrameCache.defaultPath
+        os.makedirs(self.cachePath, exist_ok=True)
+
+    @staticmethod
+    def fileHash(filePath, headerSize=1 << 20):
+        """get a hash of the given file from its header, size and modification time
+
+        hashing the whole content would take minutes for recordings of several GB
+        """
+        stat = os.stat(filePath)
+        sha1 = hashlib.sha1()
+        with open(filePath, "rb") as file:
+            sha1.update(file.read(headerSize))
+        sha1.update(("%d %d" % (stat.st_size, stat.st_mtime_ns)).encode())
+        return sha1.hexdigest()
+
+    @staticmethod
+    def calibrationInfo(calibration):
+        """get the intrinsics of the given camera calibration as lists - None if there is no calibration"""
+        if calibration is None:
+            return None
+        return {
+            "cameraMatrix": np.asarray(calibration.cameraMatrix).tolist(),
+            "distCoeffs": np.asarray(calibration.distCoeffs).tolist(),
+        }
+
+    @staticmethod
+    def key(filePath, points=None, rotation=0, calibration=None):
+        """get the cache key for the given video file, warp points, rotation and camera calibration"""
+        pointList = None if points is None else np.asarray(points).tolist()
+        keyInfo = "%s %s %d %s" % (
+            FrameCache.fileHash(filePath),
+            pointList,
+            rotation,
+            FrameCache.calibrationInfo(calibration),
+        )
+        return hashlib.sha1(keyInfo.encode()).hexdigest()[:16]
+
+    def framesPath(self, key):
+        return os.path.join(self.cachePath, key + ".frames")
+
+    def infoPath(self, key):
+        return os.path.join(self.cachePath, key + ".json")
+
+    def has(self, key):
+        """check whether the frames for the given key are cached - the info file is written last"""
+        return os.path.isfile(self.infoPath(key)) and os.path.isfile(
+            self.framesPath(key)
+        )
+
+    def build(self, key, filePath, points=None, rotation=0, calibration=None):
+        """decode all frames of the given video file - warp and rotate them if points are given correcting the lens distortion with the optional camera calibration - and store them for the given key
+
+        the frames are counted while decoding since many containers report no or a wrong frame count
+        """
+        video = Video()
+        video.calibration = calibration
+        video.open(filePath)
+        tmpPath = self.framesPath(key) + ".tmp"
+        shape, dtype = None, None
+        index = 0
+        try:
+            with open(tmpPath, "wb") as framesFile:
+                while True:
+                    ret, image = video.cap.read()
+                    if not ret:
+                        break
+                    if points is not None:
+                        image = video.warpAndRotate(image, points, rotation)
+                    elif (index + 1) * image.nbytes > FrameCache.maxUnwarpedBytes:
+                        raise Exception(
+                            "unwarped frames of %s exceed the frame cache limit of %d bytes - use warp points"
+                            % (filePath, FrameCache.maxUnwarpedBytes)
+                        )
+                    if shape is None:
+                        shape, dtype = image.shape, image.dtype
+                    elif image.shape != shape:
+                        raise Exception(
+                            "frame %d of %s has the shape %s instead of %s"
+                            % (index, filePath, image.shape, shape)
+                        )
+                    framesFile.write(np.ascontiguousarray(image, dtype=dtype).data)
+                    index += 1
+        except Exception:
+            os.remove(tmpPath)
+            raise
+        finally:
+            video.close()
+        if index == 0:
+            os.remove(tmpPath)
+            raise Exception("no frames to cache in %s" % (filePath))
+        os.replace(tmpPath, self.framesPath(key))
+        info = {
+            "source": filePath,
+            "frames": index,
+            "shape": list(shape),
+            "dtype": dtype.str,
+            "fps": video.fps,
+            "points": None if points is None else np.asarray(points).tolist(),
+            "rotation": rotation,
+            "calibration": FrameCache.calibrationInfo(calibration),
+        }
+        with open(self.infoPath(key), "w") as infoFile:
+            json.dump(info, infoFile, indent=2)
+        if FrameCache.debug:
+            print("cached %d frames of %s as %s" % (index, filePath, key))
+        return info
+
+    def open(self, filePath, points=None, rotation=0, calibration=None):
+        """get a capture for the cached frames of the given video file - the cache is built on first use"""
+        if points is None:
+            # the lens distortion is only corrected while warping
+            calibration = None
+        key = FrameCache.key(filePath, points, rotation, calibration)
+        if not self.has(key):
+            self.build(key, filePath, points, rotation, calibration)
+        with open(self.infoPath(key)) as infoFile:
+            info = json.load(infoFile)
+        frames = np.memmap(
+            self.framesPath(key),
+            dtype=np.dtype(info["dtype"]),
+            mode="r",
+            shape=(info["frames"],) + tuple(info["shape"]),
+        )
+        return CachedFrameCapture(frames, info["fps"])
+
+
+class CachedFrameCapture(object):
+    """capture frames from a memory mapped array of frames without copying them
+
+    implements the part of the cv2.VideoCapture interface used by Video so that it can be used via Video.setup
+    the frames returned are read only views of the cache
+    """
+
+    def __init__(self, frames, fps):
+        self.frames = frames
+        self.fps = fps
+        self.index = 0
+        self.grabbed = None
+        self.opened = True
+
+    def grab(self):
+        if not self.opened or self.index >= len(self.frames):
+            return False
+        self.grabbed = self.index
+        self.index += 1
+        return True
+
+    def retrieve(self, image=None):
+        """get a view of the grabbed frame - the given image is ignored since the frame does not need to be decoded"""
+        if self.grabbed is None:
+            return False, None
+        return True, self.frames[self.grabbed]
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, propId):
+        if propId == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.frames.shape[2]
+        if propId == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.frames.shape[1]
+        if propId == cv2.CAP_PROP_FPS:
+            return self.fps
+        if propId == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.frames)
+        if propId == cv2.CAP_PROP_POS_FRAMES:
+            return self.index
+        if propId == cv2.CAP_PROP_POS_MSEC:
+            return self.index * 1000 / self.fps if self.fps > 0 else 0
+        return 0
+
+    def set(self, propId, value):
+        if propId == cv2.CAP_PROP_POS_FRAMES:
+            self.index = min(max(int(value), 0), len(self.frames))
+            return True
+        if propId == cv2.CAP_PROP_POS_MSEC and self.fps > 0:
+            return self.set(cv2.CAP_PROP_POS_FRAMES, round(value * self.fps / 1000))
+        return False
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
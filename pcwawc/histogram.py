@@ -4,7 +4,6 @@ Created on 2019-11-29
 @author: wf
 """
 
-import math
 import sys
 from timeit import default_timer as timer
 
@@ -18,28 +17,33 @@ class Stats:
     """Calculate Histogram statistics see https://math.stackexchange.com/questions/857566/how-to-get-the-standard-deviation-of-a-given-histogram-image"""
 
     def __init__(self, histindexed):
-        self.n = len(histindexed)
-        self.max = -sys.maxsize
-        self.min = sys.maxsize
-        self.sum = 0
-        self.prod = 0
-        self.sqsum = 0
-        for x, y in histindexed:
-            self.sum += y
-            self.prod += x * y
-        self.mean = 0 if self.sum == 0 else self.prod / self.sum
-        for x, y in histindexed:
-            if y > 0:
-                self.min = min(self.min, x)
-                self.max = max(self.max, x)
-            dx = x - self.mean
-            self.sqsum += y * dx * dx
-        # σ²
-        self.variance = 0 if self.sqsum == 0 else self.sqsum / self.sum
-        self.stdv = math.sqrt(self.variance)
+        """construct me from the given (x,y) pairs of bin values and counts or a plain array of counts"""
+        if isinstance(histindexed, np.ndarray):
+            statsArray = StatsArray(histindexed.reshape(1, -1))
+        else:
+            values, counts = zip(*histindexed) if len(histindexed) > 0 else ((), ())
+            statsArray = StatsArray([counts], values)
+        self.setStats(statsArray, 0)
+
+    @staticmethod
+    def fromStatsArray(statsArray, index):
+        """get the statistics of the histogram with the given index of the given StatsArray"""
+        stats = Stats.__new__(Stats)
+        stats.setStats(statsArray, index)
+        return stats
+
+    def setStats(self, statsArray, index):
+        """set my attributes from the entries with the given index of the given StatsArray"""
+        self.n = statsArray.n
+        for name in ("sum", "prod", "mean", "sqsum", "variance", "stdv", "factor"):
+            setattr(self, name, getattr(statsArray, name)[index].item())
+        if statsArray.counted[index]:
+            self.min = statsArray.min[index].item()
+            self.max = statsArray.max[index].item()
+        else:
+            self.min = sys.maxsize
+            self.max = -sys.maxsize
         self.maxdelta = max(self.mean - self.min, self.max - self.mean)
-        self.factor = 0 if self.stdv == 0 else self.maxdelta / self.stdv
-        pass
 
     def range(self, relFactor=1.0, minValue=0, maxValue=255):
         """return a range relative to my min max range to widen e.g. by 10% use factor 1.1"""
@@ -52,25 +56,83 @@ class Stats:
         return lower, upper
 
 
+class StatsArray:
+    """Calculate the statistics of many histograms at once - each attribute is an array with one entry per histogram"""
+
+    def __init__(self, hists, values=None):
+        """construct me from the given histograms with one row of counts per histogram and the optional values of the bins"""
+        hists = np.atleast_2d(np.asarray(hists, dtype=np.float64))
+        self.n = hists.shape[1]
+        values = (
+            np.arange(self.n, dtype=np.float64)
+            if values is None
+            else np.asarray(values, dtype=np.float64)
+        )
+        self.sum = hists.sum(axis=1)
+        self.prod = hists @ values
+        counted = self.sum != 0
+        self.mean = np.divide(
+            self.prod, self.sum, out=np.zeros_like(self.prod), where=counted
+        )
+        nonzero = hists > 0
+        self.counted = nonzero.any(axis=1)
+        self.min = np.where(nonzero, values, np.inf).min(axis=1, initial=np.inf)
+        self.max = np.where(nonzero, values, -np.inf).max(axis=1, initial=-np.inf)
+        dx = values - self.mean[:, np.newaxis]
+        self.sqsum = (hists * dx * dx).sum(axis=1)
+        # σ²
+        self.variance = np.divide(
+            self.sqsum, self.sum, out=np.zeros_like(self.sqsum), where=counted
+        )
+        self.stdv = np.sqrt(self.variance)
+        self.maxdelta = np.maximum(self.mean - self.min, self.max - self.mean)
+        self.factor = np.divide(
+            self.maxdelta,
+            self.stdv,
+            out=np.zeros_like(self.stdv),
+            where=self.stdv != 0,
+        )
+
+    def __len__(self):
+        return len(self.sum)
+
+    def __getitem__(self, index):
+        """get the statistics of the histogram with the given index"""
+        return Stats.fromStatsArray(self, index)
+
+    def range(self, relFactor=1.0, minValue=0, maxValue=255):
+        """return the lower and upper arrays of the ranges relative to the min max ranges - see Stats.range"""
+        delta = self.stdv * self.factor * relFactor
+        lower = np.clip(self.mean - delta, minValue, None)
+        upper = np.clip(self.mean + delta, None, maxValue)
+        return lower, upper
+
+
 class Histogram:
     """Image Histogram"""
 
     colors = ("blue", "green", "red")
 
-    def __init__(self, image, histSize=256, histRange=(0, 256)):
-        """construct me from the given image hist Size and histRange"""
-        self.hist = {}
-        self.stats = {}
-        self.image = image
-
+    def __init__(self, image, histSize=256, histRange=(0, 256), mask=None):
+        """construct me from the given image hist Size and histRange - only the pixels selected by the optional mask are counted"""
         start = timer()
         # the upper boundary is exclusive
-        for channel in range(len(Histogram.colors)):
-            self.hist[channel] = cv2.calcHist(
-                [image], [channel], None, [histSize], histRange, accumulate=False
-            )
-            histindexed = list(enumerate(np.reshape(self.hist[channel], histSize)))
-            self.stats[channel] = Stats(histindexed)
+        hists = [
+            cv2.calcHist([image], [channel], mask, [histSize], histRange)
+            for channel in range(len(Histogram.colors))
+        ]
+        # the statistics of all channels in one go
+        statsArray = StatsArray(np.reshape(hists, (len(hists), histSize)))
+        self.setHists(
+            image, hists, [statsArray[channel] for channel in range(len(hists))]
+        )
+        self.time = timer() - start
+
+    def setHists(self, image, hists, stats):
+        """set my histograms and statistics per channel and derive my colors from them"""
+        self.image = image
+        self.hist = dict(enumerate(hists))
+        self.stats = dict(enumerate(stats))
         bstats, gstats, rstats = self.stats[0], self.stats[1], self.stats[2]
         self.color = (bstats.mean, gstats.mean, rstats.mean)
         self.mincolor = (bstats.min, gstats.min, rstats.min)
@@ -79,8 +141,72 @@ class Histogram:
         # here we are using the color information! This should make the difference!
         self.factor = (bstats.factor, gstats.factor, rstats.factor)
         self.stdv = (bstats.stdv, gstats.stdv, rstats.stdv)
-        end = timer()
-        self.time = end - start
+
+    @staticmethod
+    def fromHists(image, hists, time=0.0):
+        """get the histograms for the given per channel arrays of shape (regions,histSize) - the statistics of all regions are calculated in one call per channel"""
+        statsArrays = [StatsArray(hist) for hist in hists]
+        histograms = []
+        for region in range(len(hists[0])):
+            histogram = Histogram.__new__(Histogram)
+            histogram.setHists(
+                image,
+                [hist[region].reshape(-1, 1) for hist in hists],
+                [statsArray[region] for statsArray in statsArrays],
+            )
+            histogram.time = time
+            histograms.append(histogram)
+        return histograms
+
+    @staticmethod
+    def forMasks(image, masks, histSize=256, histRange=(0, 256)):
+        """get a histogram of the given image for each of the given - possibly overlapping - masks"""
+        start = timer()
+        hists = [
+            np.array(
+                [
+                    cv2.calcHist([image], [channel], mask, [histSize], histRange)
+                    for mask in masks
+                ]
+            ).reshape(len(masks), histSize)
+            for channel in range(len(Histogram.colors))
+        ]
+        return Histogram.fromHists(image, hists, timer() - start)
+
+    @staticmethod
+    def forLabels(image, labels, labelCount):
+        """get a histogram of the given 8 bit image for each of the labels 0..labelCount-1 of the given label image e.g. the 64 squares of a board
+
+        pixels with a label >= labelCount are ignored
+        """
+        start = timer()
+        hists = [
+            hist.astype(np.float32)
+            for hist in Histogram.labelHistograms(image, labels, labelCount)
+        ]
+        return Histogram.fromHists(image, hists, timer() - start)
+
+    @staticmethod
+    def labelHistograms(image, labels, labelCount, offsets=None):
+        """get the integer counts of the values of the given 8 bit image per label as one (labelCount,256) array per channel
+
+        one bincount of label and value per channel counts the pixels of all labels - the offsets label*256 of the
+        pixels may be given e.g. if they are cached for a fixed label image and all labels are below labelCount
+        """
+        values = image.reshape(-1, image.shape[2] if image.ndim == 3 else 1)
+        if offsets is None:
+            labels = labels.ravel()
+            if labels.max(initial=0) >= labelCount:
+                selected = labels < labelCount
+                labels = labels[selected]
+                values = values[selected]
+            offsets = labels.astype(np.intp) * 256
+        return [
+            np.bincount(
+                offsets + values[:, channel], minlength=labelCount * 256
+            ).reshape(labelCount, 256)
+            for channel in range(values.shape[1])
+        ]
 
     def fix(self, value):
         return 0 if value < 0 else 255 if value > 255 else value
@@ -0,0 +1,169 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+
+class ImageSequenceCapture(object):
+    """capture frames from a sequence of still images e.g. a directory of photos or timelapse captures
+
+    the images are decoded ahead of time in a thread pool - cv2.imread releases the GIL while decoding
+    images that can not be decoded are skipped and remembered in skipped
+    implements the part of the cv2.VideoCapture interface used by Video so that it can be used via Video.setup
+    """
+
+    extensions = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff", ".webp")
+    # imread flags to downscale while decoding
+    reduceFlags = {
+        1: cv2.IMREAD_COLOR,
+        2: cv2.IMREAD_REDUCED_COLOR_2,
+        4: cv2.IMREAD_REDUCED_COLOR_4,
+        8: cv2.IMREAD_REDUCED_COLOR_8,
+    }
+
+    def __init__(self, paths, prefetch=8, reduce=1, fps=1, workers=None):
+        """construct me for the given image paths, number of images to decode ahead, downscale factor and frames per second"""
+        if reduce not in ImageSequenceCapture.reduceFlags:
+            raise Exception(
+                "invalid reduce factor %d - must be one of %s"
+                % (reduce, list(ImageSequenceCapture.reduceFlags.keys()))
+            )
+        self.paths = paths
+        self.prefetch = max(prefetch, 1)
+        self.flags = ImageSequenceCapture.reduceFlags[reduce]
+        self.fps = fps
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers if workers is not None else self.prefetch,
+            thread_name_prefix="imagesequence",
+        )
+        # paths and futures of the images being decoded in order
+        self.pending = deque()
+        # index of the next image to be returned
+        self.index = 0
+        # index of the next image to be submitted for decoding
+        self.nextIndex = 0
+        self.image = None
+        # paths of the images that could not be decoded
+        self.skipped = []
+        self.opened = True
+        self.width, self.height = 0, 0
+        self.fill()
+        for path, future in self.pending:
+            first = future.result()
+            if first is not None:
+                self.height, self.width = first.shape[:2]
+                break
+
+    @staticmethod
+    def isImageSequence(device):
+        """check whether the given device is a directory of images"""
+        return isinstance(device, str) and os.path.isdir(device)
+
+    @staticmethod
+    def fromDirectory(directory, **kwargs):
+        """get an image sequence capture for the images of the given directory in the order of their names"""
+        paths = [
+            os.path.join(directory, fileName)
+            for fileName in sorted(os.listdir(directory))
+            if fileName.lower().endswith(ImageSequenceCapture.extensions)
+        ]
+        return ImageSequenceCapture(paths, **kwargs)
+
+    def decode(self, path):
+        return cv2.imread(path, self.flags)
+
+    def fill(self):
+        """keep the prefetch window filled"""
+        while len(self.pending) < self.prefetch and self.nextIndex < len(self.paths):
+            path = self.paths[self.nextIndex]
+            self.pending.append((path, self.executor.submit(self.decode, path)))
+            self.nextIndex += 1
+
+    def restart(self, index):
+        """restart decoding at the given index"""
+        for _path, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.index = index
+        self.nextIndex = index
+        self.fill()
+
+    def grab(self):
+        """advance to the next image - skipped images are not waited for"""
+        if not self.opened or not self.pending:
+            return False
+        self.image = self.pending.popleft()
+        self.index += 1
+        self.fill()
+        return True
+
+    def retrieve(self, image=None):
+        """get the decoded image that has been grabbed - copied into the given image if its size fits
+
+        an image that can not be decoded is skipped and the next one is retrieved instead
+        """
+        while True:
+            if self.image is None:
+                return False, None
+            path, future = self.image
+            decoded = future.result()
+            self.image = None
+            if decoded is not None:
+                break
+            self.skipped.append(path)
+            if not self.grab():
+                return False, None
+        if image is not None and image.shape == decoded.shape:
+            image[:] = decoded
+            return True, image
+        return True, decoded
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, propId):
+        if propId == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.width
+        if propId == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.height
+        if propId == cv2.CAP_PROP_FPS:
+            return self.fps
+        if propId == cv2.CAP_PROP_FRAME_COUNT:
+            return len(self.paths)
+        if propId == cv2.CAP_PROP_POS_FRAMES:
+            return self.index
+        if propId == cv2.CAP_PROP_POS_MSEC:
+            return self.index * 1000 / self.fps if self.fps > 0 else 0
+        return 0
+
+    def set(self, propId, value):
+        if propId == cv2.CAP_PROP_POS_FRAMES:
+            self.restart(min(max(int(value), 0), len(self.paths)))
+            return True
+        if propId == cv2.CAP_PROP_POS_MSEC and self.fps > 0:
+            return self.set(cv2.CAP_PROP_POS_FRAMES, round(value * self.fps / 1000))
+        if propId == cv2.CAP_PROP_FPS:
+            self.fps = value
+            return True
+        return False
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+        for _path, future in self.pending:
+            future.cancel()
+        self.pending.clear()
+        self.executor.shutdown(wait=False)
@@ -111,6 +111,24 @@ class RunningStats:
             self.old_m = self.new_m
             self.old_s = self.new_s
 
+    def pushAll(self, values):
+        """push all of the given values at once by merging their mean and sum of squared differences"""
+        values = np.asarray(values, np.float64)
+        count = len(values)
+        if count == 0:
+            return
+        mean = values.mean()
+        s = ((values - mean) ** 2).sum()
+        n = self.n + count
+        if self.n == 0:
+            self.new_m, self.new_s = mean, s
+        else:
+            delta = mean - self.new_m
+            self.new_m = self.new_m + delta * count / n
+            self.new_s = self.new_s + s + delta * delta * self.n * count / n
+        self.old_m, self.old_s = self.new_m, self.new_s
+        self.n = n
+
     def mean(self):
         return self.new_m if self.n else 0.0
 
@@ -141,6 +159,12 @@ class MinMaxStats(RunningStats, MinMaxMixin):
         super().push(value)
         super().pushMinMax(value)
 
+    def pushAll(self, values):
+        super().pushAll(values)
+        if len(values) > 0:
+            super().pushMinMax(float(np.min(values)))
+            super().pushMinMax(float(np.max(values)))
+
     def clear(self):
         super().clear()
         super().initMinMax()
@@ -152,6 +176,45 @@ class MinMaxStats(RunningStats, MinMaxMixin):
         return text
 
 
+@implementer(IStats)
+class RunningStatsArray:
+    """RunningStats for many values at once e.g. one per chess square - the values are pushed as arrays and may be selected by a mask"""
+
+    def __init__(self, size):
+        self.n = np.zeros(size, np.int64)
+        self.m = np.zeros(size)
+        self.s = np.zeros(size)
+
+    def clear(self, mask=None):
+        """clear the statistics selected by the given mask - all if no mask is given"""
+        if mask is None:
+            self.n[:] = 0
+        else:
+            self.n[mask] = 0
+
+    def push(self, values, mask=None):
+        """push the given values to the statistics selected by the given mask - all if no mask is given"""
+        if mask is None:
+            mask = np.ones(len(self.n), bool)
+        self.n += mask
+        x = np.asarray(values, np.float64)
+        first = mask & (self.n == 1)
+        old_m = self.m
+        self.m = np.where(mask, old_m + (x - old_m) / np.maximum(self.n, 1), old_m)
+        self.s = np.where(mask, self.s + (x - old_m) * (x - self.m), self.s)
+        self.m[first] = x[first]
+        self.s[first] = 0
+
+    def mean(self):
+        return np.where(self.n > 0, self.m, 0.0)
+
+    def variance(self):
+        return np.where(self.n > 1, self.s / np.maximum(self.n - 1, 1), 0.0)
+
+    def standard_deviation(self):
+        return np.sqrt(self.variance())
+
+
 @implementer(IStats)
 class ColorStats:
     """calculate the RunningStats for 3 color channels like RGB or HSV simultaneously"""
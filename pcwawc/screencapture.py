@@ -0,0 +1,133 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+import threading
+import time
+
+import cv2
+import numpy as np
+from mss import mss
+
+
+class ScreenCapture(object):
+    """capture frames from the screen - only the bounding rectangle of the warp points is grabbed
+
+    implements the part of the cv2.VideoCapture interface used by Video so that it can be used via Video.setup
+    see https://stackoverflow.com/a/54246290/1497139
+    """
+
+    prefix = "screen"
+
+    def __init__(self, warp=None, monitor=1, fps=30):
+        """construct me for the given warp, monitor index (1 is the first monitor) and maximum frames per second"""
+        self.warp = warp
+        self.monitorIndex = monitor
+        self.fps = fps
+        self.local = threading.local()
+        with mss() as sct:
+            self.monitor = sct.monitors[monitor]
+        self.offset = (0, 0)
+        self.lastGrab = None
+        self.shot = None
+        self.opened = True
+
+    @staticmethod
+    def isScreenDevice(device):
+        """check whether the given device e.g. screen or screen:2 denotes a screen"""
+        return isinstance(device, str) and device.split(":")[0] == ScreenCapture.prefix
+
+    @staticmethod
+    def monitorOf(device):
+        """get the monitor index of the given screen device"""
+        parts = device.split(":")
+        return int(parts[1]) if len(parts) > 1 else 1
+
+    @staticmethod
+    def regionFor(points, monitor):
+        """get the region to grab for the given warp points within the given monitor - the full monitor if there are no points"""
+        left, top = monitor["left"], monitor["top"]
+        width, height = monitor["width"], monitor["height"]
+        if points is None:
+            return {"left": left, "top": top, "width": width, "height": height}
+        x, y, w, h = cv2.boundingRect(np.asarray(points, dtype=np.int32))
+        # clip to the monitor - points are relative to the monitor's top left corner
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, width), min(y + h, height)
+        return {"left": left + x1, "top": top + y1, "width": x2 - x1, "height": y2 - y1}
+
+    def sct(self):
+        """get the screen shot instance of the current thread - mss instances may not be shared between threads"""
+        sct = getattr(self.local, "sct", None)
+        if sct is None:
+            sct = mss()
+            self.local.sct = sct
+        return sct
+
+    def currentRegion(self):
+        points = None
+        if self.warp is not None and self.warp.warping:
+            points = self.warp.points
+        return ScreenCapture.regionFor(points, self.monitor)
+
+    def grab(self):
+        """grab the current region of the screen honoring the maximum frames per second"""
+        if not self.opened:
+            return False
+        if self.lastGrab is not None and self.fps > 0:
+            wait = 1 / self.fps - (time.perf_counter() - self.lastGrab)
+            if wait > 0:
+                time.sleep(wait)
+        self.lastGrab = time.perf_counter()
+        region = self.currentRegion()
+        self.shot = self.sct().grab(region)
+        self.offset = (
+            region["left"] - self.monitor["left"],
+            region["top"] - self.monitor["top"],
+        )
+        return True
+
+    def retrieve(self, image=None):
+        """convert the grabbed BGRA screen shot to a BGR image - into the given image if its size fits"""
+        if self.shot is None:
+            return False, None
+        bgra = np.asarray(self.shot)
+        if image is not None and image.shape[:2] != bgra.shape[:2]:
+            image = None
+        image = cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=image)
+        return True, image
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        return self.retrieve(image)
+
+    def get(self, propId):
+        if propId == cv2.CAP_PROP_FRAME_WIDTH:
+            return self.monitor["width"]
+        if propId == cv2.CAP_PROP_FRAME_HEIGHT:
+            return self.monitor["height"]
+        if propId == cv2.CAP_PROP_FPS:
+            return self.fps
+        # the screen is a live source
+        return 0
+
+    def set(self, propId, value):
+        if propId == cv2.CAP_PROP_FPS:
+            self.fps = value
+            return True
+        return False
+
+    def isOpened(self):
+        return self.opened
+
+    def release(self):
+        self.opened = False
+        sct = getattr(self.local, "sct", None)
+        if sct is not None:
+            sct.close()
+            self.local.sct = None
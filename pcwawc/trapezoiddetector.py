@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+from timeit import default_timer as timer
+
+import cv2
+from zope.interface import implementer
+
+from pcwawc.chessimage import ChessBoardImage
+from pcwawc.chesstrapezoid import ChessTrapezoid
+from pcwawc.chessvision import IMoveDetector
+from pcwawc.detectstate import DetectColorState, DetectState
+from pcwawc.eventhandling import Observable
+from pcwawc.runningstats import MinMaxStats
+
+
+@implementer(IMoveDetector)
+class TrapezoidDetector(Observable):
+    """detect moves from the changes of the squares of a chess trapezoid laid over the warped board image
+
+    the squares are compared to an ideal board drawn from the current piece positions and the change
+    statistics of all squares are kept as arrays - see ChessTrapezoid.detectChanges
+    """
+
+    frameDebug = False
+    # tresholds of the detect state
+    validDiffSumTreshold = 1.4
+    invalidDiffSumTreshold = 4.8
+    diffSumDeltaTreshold = 0.2
+    # steps of a frame that are timed
+    steps = ["colors", "diff", "changes", "colorCheck"]
+
+    def __init__(self):
+        """construct me"""
+        # make me observable
+        super(TrapezoidDetector, self).__init__()
+        self.debug = False
+
+    def setup(self, name, vision):
+        self.name = name
+        self.vision = vision
+        self.board = vision.board
+        self.trapez = None
+        self.fen = None
+        self.detectState = DetectState(
+            TrapezoidDetector.validDiffSumTreshold,
+            TrapezoidDetector.invalidDiffSumTreshold,
+            TrapezoidDetector.diffSumDeltaTreshold,
+            onPieceMoveDetected=self.onPieceMoveDetected,
+        )
+        self.detectColorState = None
+        self.movedSquares = []
+        # the seconds needed for each step of the last frame and the milliseconds of all frames so far
+        self.timings = {}
+        self.timingStats = {step: MinMaxStats() for step in TrapezoidDetector.steps}
+
+    def updateTrapezoid(self, width):
+        """make sure my trapezoid fits the warped board image of the given width and the current piece positions"""
+        if self.trapez is None or self.trapez.idealSize != width:
+            corners = [(0, 0), (width, 0), (width, width), (0, width)]
+            self.trapez = ChessTrapezoid(corners, idealSize=width)
+            self.detectColorState = DetectColorState(self.trapez)
+            self.fen = None
+        if self.fen != self.board.fen:
+            self.fen = self.board.fen
+            self.trapez.updatePieces(self.fen)
+
+    def time(self, step, startt):
+        """record the time of the given step started at the given time - returns the current time"""
+        endt = timer()
+        self.timings[step] = endt - startt
+        self.timingStats[step].push((endt - startt) * 1000)
+        return endt
+
+    def formatTimings(self):
+        """get the timings of the last frame and the average timings of all frames"""
+        text = " ".join(
+            "%s: %.1f/%.1f ms"
+            % (step, self.timings[step] * 1000, self.timingStats[step].mean())
+            for step in self.timings
+        )
+        return text
+
+    def onChessBoardImage(self, imageEvent):
+        cbImageSet = imageEvent.cbImageSet
+        vision = cbImageSet.vision
+        if vision.warp.warping:
+            cbWarped = cbImageSet.cbWarped
+            if cbWarped.width != cbWarped.height:
+                # the ideal board is square
+                size = max(cbWarped.width, cbWarped.height)
+                image = cv2.resize(cbWarped.image, (size, size))
+                cbWarped = ChessBoardImage(image, "warped")
+                cbImageSet.cbWarped = cbWarped
+            self.updateTrapezoid(cbWarped.width)
+            startt = timer()
+            averageColors = self.trapez.analyzeColors(cbWarped)
+            startt = self.time("colors", startt)
+            cbImageSet.cbIdeal = self.trapez.idealColoredBoard(
+                cbWarped.width, cbWarped.height
+            )
+            cbImageSet.cbDiff = cbWarped.diffBoardImage(cbImageSet.cbIdeal)
+            startt = self.time("diff", startt)
+            changes = self.trapez.detectChanges(cbImageSet, self.detectState)
+            startt = self.time("changes", startt)
+            self.detectColorState.check(cbWarped, averageColors)
+            self.time("colorCheck", startt)
+            if vision.debug:
+                cbImageSet.cbPreMove = self.trapez.preMoveBoard(
+                    cbWarped.width, cbWarped.height
+                )
+            if self.frameDebug:
+                print(
+                    "Frame %5d %2d ✅ %5.1f Δ %5.1f %s"
+                    % (
+                        cbImageSet.frameIndex,
+                        changes["valid"],
+                        changes["diffSum"],
+                        changes["diffSumDelta"],
+                        self.formatTimings(),
+                    )
+                )
+            if len(self.movedSquares) >= 2:
+                self.onMoveDetected(cbImageSet)
+            self.movedSquares = []
+
+    def onPieceMoveDetected(self, tsquare):
+        """remember the square of a piece that has been moved"""
+        self.movedSquares.append(tsquare)
+
+    def onMoveDetected(self, cbImageSet):
+        """try to find a legal move for the squares that have been moved - the squares that changed most first"""
+        ans = [
+            tsquare.an
+            for tsquare in sorted(
+                self.movedSquares,
+                key=lambda tsquare: abs(tsquare.currentChange.diff),
+                reverse=True,
+            )
+        ]
+        move = None
+        for index, an in enumerate(ans):
+            for other in ans[index + 1 :]:
+                move = self.board.changeToMove((an, other))
+                if move is not None:
+                    break
+            if move is not None:
+                break
+        if move is None:
+            if self.vision.debug:
+                print(
+                    "frame %4d: squares %s changed without a valid move"
+                    % (cbImageSet.frameIndex, str(ans))
+                )
+        else:
+            if self.vision.debug:
+                print("frame %4d: move %s" % (cbImageSet.frameIndex, str(move)))
+            self.trapez.clearChanges()
+            self.fire(move=move)
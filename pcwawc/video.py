@@ -1,12 +1,16 @@
 #!/usr/bin/python3
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 import argparse
+import logging
 import math
 import os
 import sys
 import threading
+from collections import deque
+from enum import IntEnum
 from threading import Thread
 from time import strftime
+from timeit import default_timer as timer
 
 import cv2
 import numpy as np
@@ -14,11 +18,17 @@ from imutils import perspective
 
 from pcwawc.environment import Environment
 from pcwawc.fpscheck import FPSCheck
+from pcwawc.imagesequence import ImageSequenceCapture
+
+logger = logging.getLogger(__name__)
 
 
 class Video:
     """Video handling e.g. recording/writing"""
 
+    # maximum number of warp maps to keep e.g. while the warp points are being changed
+    warpMapCacheSize = 8
+
     @staticmethod
     def getVideo():
         video = Video()
@@ -40,6 +50,16 @@ class Video:
         self.fpsCheck = None
         self.debug = False
         self.headless = False
+        # number of recycled frame buffers - 0 means no frame pool
+        self.framePoolSize = 0
+        self.framePool = None
+        # number of images to decode ahead and downscale factor for image sequences
+        self.prefetch = 8
+        self.imageReduction = 1
+        # precomputed remap tables by warp points and rotation
+        self.warpMaps = {}
+        # camera calibration to correct the lens distortion while warping
+        self.calibration = None
         pass
 
     # check whether s is an int
@@ -69,6 +89,13 @@ class Video:
 
     # capture from the given device
     def capture(self, device):
+        if ImageSequenceCapture.isImageSequence(device):
+            self.device = device
+            cap = ImageSequenceCapture.fromDirectory(
+                device, prefetch=self.prefetch, reduce=self.imageReduction
+            )
+            self.setup(cap)
+            return
         if Video.is_int(device):
             self.device = int(device)
         else:
@@ -85,9 +112,17 @@ class Video:
         self.height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         self.fps = int(cap.get(cv2.CAP_PROP_FPS))
         self.cap = cap
+        # the frame pool is sized from the first frame read - sources like the screen capture report a different size
+        self.framePool = None
         self.fpsCheck = FPSCheck()
         self.fpsCheck.start()
 
+    def isLive(self):
+        """check whether my capture is a live source e.g. a camera - files have a known frame count"""
+        self.checkCap()
+        frameCount = self.cap.get(cv2.CAP_PROP_FRAME_COUNT)
+        return frameCount <= 0
+
     def checkFilePath(self, filePath, raiseException=True):
         ok = os.path.exists(filePath)
         if raiseException and not ok:
@@ -133,7 +168,7 @@ class Video:
     # encode the image
     def imencode(self, frame, imgformat=".jpg"):
         # encode the frame in JPEG format
-        (flag, encodedImage) = cv2.imencode(imgformat, frame)
+        flag, encodedImage = cv2.imencode(imgformat, frame)
         return flag, encodedImage
 
     # return a video frame as a jpg image
@@ -142,7 +177,7 @@ class Video:
         encodedImage = None
         # ensure the frame was read
         if ret:
-            (flag, encodedImage) = self.imencode(frame)
+            flag, encodedImage = self.imencode(frame)
             # ensure the frame was successfully encoded
             if not flag:
                 ret = False
@@ -155,7 +190,7 @@ class Video:
             # simply return the current frame again
             ret = self.frame is not None
         else:
-            ret, self.frame = self.cap.read()
+            ret, self.frame = self.readCap()
         quitWanted = False
         if ret == True:
             if not self.ispaused:
@@ -166,9 +201,8 @@ class Video:
             if not postProcess is None:
                 try:
                     self.processedFrame = postProcess(self.frame)
-                except BaseException as e:
-                    # @TODO log exception
-                    print("processing error " + str(e))
+                except Exception:
+                    logger.exception("processing error")
                     self.processedFrame = self.frame
             else:
                 self.processedFrame = self.frame
@@ -176,18 +210,99 @@ class Video:
                 quitWanted = not self.showImage(self.frame, self.title)
         return ret, self.processedFrame, quitWanted
 
+    def genFrames(self, skip=0):
+        """generate the frames of my capture as VideoFrames - the given number of frames is skipped before each frame by grabbing them - a paused video repeats the current frame"""
+        self.checkCap()
+        videoFrame = None
+        while True:
+            if self.ispaused:
+                if videoFrame is None:
+                    # repeat the current frame of a previous read
+                    if self.frame is None:
+                        break
+                    videoFrame = VideoFrame(
+                        self.frames, timer(), self.frame, self.captureOffset()
+                    )
+                yield videoFrame
+                continue
+            if self.frames >= self.maxFrames:
+                break
+            if skip > 0:
+                self.skipFrames(skip)
+            ret, image = self.readCap()
+            if not ret:
+                break
+            self.frame = image
+            self.frames += 1
+            if self.frames >= self.maxFrames and self.autoPause:
+                self.ispaused = True
+            self.fpsCheck.update()
+            videoFrame = VideoFrame(self.frames, timer(), image, self.captureOffset())
+            yield videoFrame
+
+    def skipFrames(self, count):
+        """skip the given number of frames by grabbing them without decoding - returns the number of frames skipped"""
+        skipped = 0
+        for i in range(count):
+            if not self.cap.grab():
+                break
+            skipped += 1
+        self.frames += skipped
+        return skipped
+
+    def seekFrame(self, frame):
+        """position my capture so that the next frame read is the given (zero based) frame - if the container can't seek the frames are skipped by grabbing"""
+        self.checkCap()
+        if not self.isLive() and self.cap.set(cv2.CAP_PROP_POS_FRAMES, frame):
+            if int(self.cap.get(cv2.CAP_PROP_POS_FRAMES)) == frame:
+                self.frames = frame
+                return self.frames
+        if frame > self.frames:
+            self.skipFrames(frame - self.frames)
+        return self.frames
+
+    def seekTime(self, seconds):
+        """position my capture at the given time in seconds"""
+        self.checkCap()
+        if not self.isLive() and self.cap.set(cv2.CAP_PROP_POS_MSEC, seconds * 1000):
+            frame = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+            if frame >= 0:
+                self.frames = frame
+                return self.frames
+        if self.fps > 0:
+            return self.seekFrame(round(seconds * self.fps))
+        return self.frames
+
+    def readCap(self):
+        """read from my capture - into a recycled buffer if the frame pool is active"""
+        if self.framePoolSize <= 0:
+            return self.cap.read()
+        if self.framePool is None:
+            ret, frame = self.cap.read()
+            if ret:
+                self.framePool = FramePool(
+                    frame.shape, size=self.framePoolSize, dtype=frame.dtype
+                )
+            return ret, frame
+        buffer = self.framePool.acquire()
+        ret, frame = self.cap.read(buffer)
+        if ret and frame is not buffer:
+            # the capture had to allocate a new array e.g. due to a size change
+            self.framePool.misses += 1
+            if frame.shape != self.framePool.shape:
+                self.framePool = FramePool(
+                    frame.shape, size=self.framePoolSize, dtype=frame.dtype
+                )
+        return ret, frame
+
+    def captureOffset(self):
+        """get the x,y offset of the region of the last frame read - sources like the screen capture only a part of their full area"""
+        return getattr(self.cap, "offset", (0, 0))
+
     # play the given capture
     def play(self):
-        while self.cap.isOpened():
-            ret, frame, quitWanted = self.readFrame(True)
-            if ret == True:
-                if quitWanted:
-                    break
-                if frame is None:
-                    # TODO decide whether to log a warning here
-                    pass
-            else:
-                break
+        for videoFrame in FramePipeline.genShow(self.genFrames(), self):
+            pass
         self.close()
 
     def fileTimeStamp(self):
@@ -241,8 +356,15 @@ class Video:
         ret = False
         frame = None
         if self.cap.isOpened():
-            ret, frame, quitWanted = self.readFrame(show, postProcess)
-            if ret == True:
+            frames = self.genFrames()
+            if show:
+                frames = FramePipeline.genShow(frames, self)
+            if postProcess is not None:
+                frames = FramePipeline.genProcess(frames, postProcess)
+            videoFrame = next(frames, None)
+            ret = videoFrame is not None
+            if ret:
+                frame = videoFrame.image
                 if printHints:
                     print("capture %s with %dx%d" % (filename, self.width, self.height))
                 self.writeImage(frame, filename)
@@ -259,19 +381,22 @@ class Video:
     def writeImage(self, image, filepath):
         cv2.imwrite(filepath, image)
 
-    def prepareRecording(self, filename, width, height, fps=None):
+    def prepareRecording(
+        self, filename, width, height, fps=None, codec="XVID", policy=None
+    ):
+        """prepare a recorder for the given file that writes frames in a separate thread - by default frames are dropped for live sources when the writer can't keep up and files block instead"""
         self.checkCap()
         if fps is None:
             fps = self.fps
-        # Define the codec and create VideoWriter object
-        fourcc = cv2.VideoWriter_fourcc(*"XVID")
-        out = cv2.VideoWriter(filename, fourcc, fps, (width, height))
+        if policy is None:
+            policy = BufferPolicy.DROP_OLDEST if self.isLive() else BufferPolicy.BLOCK
+        out = VideoRecorder(filename, width, height, fps, codec=codec, policy=policy)
         return out
 
     # record the capture to a file with the given prefix using a timestamp
-    def record(self, prefix, printHints=True, fps=None):
-        filename = "%s%s.avi" % (prefix, self.timeStamp())
-        out = self.prepareRecording(filename, self.width, self.height, fps)
+    def record(self, prefix, printHints=True, fps=None, codec="XVID", container="avi"):
+        filename = "%s%s.%s" % (prefix, self.timeStamp(), container)
+        out = self.prepareRecording(filename, self.width, self.height, fps, codec)
 
         if printHints:
             print(
@@ -279,17 +404,9 @@ class Video:
                 % (filename, self.width, self.height, self.fps)
             )
 
-        while self.cap.isOpened():
-            ret, frame, quitWanted = self.readFrame(True)
-            if ret == True:
-                # flip the frame
-                # frame = cv2.flip(frame,0)
-                if quitWanted:
-                    break
-                # write the  frame
-                out.write(frame)
-            else:
-                break
+        frames = FramePipeline.genShow(self.genFrames(), self)
+        for videoFrame in FramePipeline.genTee(frames, out):
+            pass
 
         # Release everything if job is finished
         self.close()
@@ -297,6 +414,8 @@ class Video:
         cv2.destroyAllWindows()
         if printHints:
             print("finished")
+        if self.debug:
+            print(out)
 
     # https://stackoverflow.com/a/22921648/1497139
     def createBlank(self, width, height, rgb_color=(0, 0, 0)):
@@ -391,7 +510,7 @@ class Video:
 
     def rotate(self, image, angle, center=None, scale=1.0):
         # grab the dimensions of the image
-        (h, w) = image.shape[:2]
+        h, w = image.shape[:2]
 
         # if the center is None, initialize it as the center of
         # the image
@@ -407,12 +526,23 @@ class Video:
 
     def warp(self, image, pts, squared=True):
         """apply the four point transform to obtain a birds eye view of the given image"""
-        warped = perspective.four_point_transform(image, pts)
-        if squared:
-            height, width = warped.shape[:2]
-            side = min(width, height)
-            warped = cv2.resize(warped, (side, side))
-        return warped
+        return self.warpAndRotate(image, pts, 0, squared)
+
+    def warpAndRotate(self, image, pts, rotation=0, squared=True, offset=(0, 0)):
+        """warp the given image with the four point transform, square and rotate it in a single pass - the image may be a region of the frame at the given offset"""
+        return self.warpMap(pts, rotation, squared, offset).apply(image)
+
+    def warpMap(self, pts, rotation=0, squared=True, offset=(0, 0)):
+        """get the cached warp map for the given trapezoid points, rotation and image offset - including the lens distortion correction if i have a calibration"""
+        key = (np.asarray(pts, np.float32).tobytes(), rotation, squared)
+        key = key + (tuple(offset), self.calibration)
+        warpMap = self.warpMaps.get(key)
+        if warpMap is None:
+            warpMap = WarpMap(pts, rotation, squared, self.calibration, offset)
+            if len(self.warpMaps) >= Video.warpMapCacheSize:
+                self.warpMaps.clear()
+            self.warpMaps[key] = warpMap
+        return warpMap
 
     def as2x2(self, row1col1, row1col2, row2col1, row2col2, downScale=2):
         height, width = row1col1.shape[:2]
@@ -523,51 +653,402 @@ class Video:
         )
 
 
+class WarpMap:
+    """the perspective warp of a trapezoid to a birds eye view, the squaring and the rotation fused into one matrix
+
+    applied as a single remap with precomputed fixed point tables instead of three separate resamplings
+    the lens distortion of a calibrated camera is corrected by the same remap
+    """
+
+    def __init__(self, pts, rotation=0, squared=True, calibration=None, offset=(0, 0)):
+        """construct me for the given trapezoid points, rotation angle (clockwise), squaring and optional camera calibration
+
+        the trapezoid points are frame coordinates - the map applies to images of the region of the frame at the given offset
+        """
+        rect = perspective.order_points(np.asarray(pts))
+        if calibration is not None:
+            # the homography works on the undistorted image
+            rect = calibration.undistortPoints(rect).astype(np.float32)
+        tl, tr, br, bl = rect
+        # same target size as perspective.four_point_transform
+        width = max(int(np.linalg.norm(br - bl)), int(np.linalg.norm(tr - tl)))
+        height = max(int(np.linalg.norm(tr - br)), int(np.linalg.norm(tl - bl)))
+        dst = np.array(
+            [[0, 0], [width - 1, 0], [width - 1, height - 1], [0, height - 1]],
+            dtype="float32",
+        )
+        matrix = cv2.getPerspectiveTransform(rect, dst)
+        if squared:
+            # scale like cv2.resize with pixel centers aligned
+            side = min(width, height)
+            sx, sy = width / side, height / side
+            scale = np.array(
+                [[1 / sx, 0, 0.5 / sx - 0.5], [0, 1 / sy, 0.5 / sy - 0.5], [0, 0, 1]]
+            )
+            matrix = scale @ matrix
+            width, height = side, side
+        if rotation % 360 != 0:
+            # same rotation as Video.rotate
+            rotate = cv2.getRotationMatrix2D((width // 2, height // 2), -rotation, 1.0)
+            matrix = np.vstack([rotate, [0, 0, 1]]) @ matrix
+        self.matrix = matrix
+        self.size = (width, height)
+        # source coordinates for each target pixel
+        xs, ys = np.meshgrid(
+            np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32)
+        )
+        grid = np.stack((xs, ys), axis=-1).reshape(-1, 1, 2)
+        src = cv2.perspectiveTransform(grid, np.linalg.inv(matrix))
+        if calibration is not None:
+            src = calibration.distortPoints(src).astype(np.float32)
+        src = src.reshape(height, width, 2)
+        if offset != (0, 0):
+            src = src - np.array(offset, np.float32)
+        self.map1, self.map2 = cv2.convertMaps(src[..., 0], src[..., 1], cv2.CV_16SC2)
+
+    def apply(self, image):
+        """warp the given image"""
+        return cv2.remap(image, self.map1, self.map2, cv2.INTER_LINEAR)
+
+
+class FramePool:
+    """pool of preallocated frame buffers to be recycled when capturing
+
+    a buffer is only recycled when nothing but the pool refers to it - neither an image set, a detector or the GUI nor a
+    view of it e.g. the cropped board region - so the frames in use never need to be given back explicitly
+    """
+
+    def __init__(self, shape, size=8, dtype=np.uint8):
+        """construct me for frames of the given shape e.g. (height,width,channels)"""
+        self.shape = shape
+        self.size = size
+        self.dtype = dtype
+        self.lock = threading.Lock()
+        self.buffers = [np.empty(shape, dtype) for i in range(size)]
+        # reference count of a buffer only the pool refers to
+        self.freeRefCount = self.refCount(0)
+        # statistics
+        self.acquired = 0
+        self.misses = 0
+
+    def refCount(self, index):
+        return sys.getrefcount(self.buffers[index])
+
+    def acquire(self):
+        """get a free buffer - a new one is allocated and counted as a miss if all buffers are in use"""
+        with self.lock:
+            self.acquired += 1
+            for index in range(self.size):
+                if self.refCount(index) <= self.freeRefCount:
+                    return self.buffers[index]
+            self.misses += 1
+        return np.empty(self.shape, self.dtype)
+
+    def inUse(self):
+        """get the number of my buffers that are still referred to"""
+        with self.lock:
+            return sum(
+                1
+                for index in range(self.size)
+                if self.refCount(index) > self.freeRefCount
+            )
+
+
+class BufferPolicy(IntEnum):
+    """what to do when the ring buffer of a VideoStream is full"""
+
+    DROP_OLDEST = 0  # live cameras - always keep the most recent frames
+    BLOCK = 1  # files - let the capture thread wait for the consumer
+
+    @staticmethod
+    def fromName(name):
+        """get the buffer policy for the given command line name drop or block"""
+        if name is None:
+            return None
+        return BufferPolicy.DROP_OLDEST if name == "drop" else BufferPolicy.BLOCK
+
+
+class VideoFrame:
+    """a single captured frame with its index, capture time stamp and offset of the captured region"""
+
+    def __init__(self, index, timeStamp, image, offset=(0, 0), captured=None):
+        self.index = index
+        self.timeStamp = timeStamp
+        self.image = image
+        self.offset = offset
+        # the frame as captured if i am e.g. a region of it - not a reference to myself so that my image is freed without the garbage collector
+        self.capturedFrame = captured
+
+    @property
+    def captured(self):
+        """the frame as captured e.g. if i am a region of it"""
+        return self if self.capturedFrame is None else self.capturedFrame
+
+    def withImage(self, image, offset=None):
+        """get a frame with the same index, time stamp and offset for the given image e.g. the result of a processing stage"""
+        if offset is None:
+            offset = self.offset
+        return VideoFrame(self.index, self.timeStamp, image, offset, self.captured)
+
+    def crop(self, rect):
+        """get the frame for the given x,y,w,h rectangle of the full frame clipped to my region - the image is a view of mine"""
+        height, width = self.image.shape[:2]
+        ox, oy = self.offset
+        x, y, w, h = rect
+        x1, y1 = max(x - ox, 0), max(y - oy, 0)
+        x2, y2 = min(x + w - ox, width), min(y + h - oy, height)
+        if x2 <= x1 or y2 <= y1:
+            return self
+        return self.withImage(self.image[y1:y2, x1:x2], (ox + x1, oy + y1))
+
+
+class FramePipeline:
+    """composable processing stages for generators of VideoFrames e.g. Video.genFrames
+
+    each stage is a generator itself so that frames are processed lazily one at a time without intermediate lists
+    """
+
+    @staticmethod
+    def genSkip(frames, speedup):
+        """only pass every speedup-th frame - prefer Video.genFrames(skip) to avoid decoding the skipped frames"""
+        for videoFrame in frames:
+            if videoFrame.index % speedup == 0:
+                yield videoFrame
+
+    @staticmethod
+    def genCrop(frames, getRect):
+        """crop the frames to the x,y,w,h rectangle returned by the given function e.g. the board region - frames are passed on unchanged if it returns None"""
+        for videoFrame in frames:
+            rect = getRect()
+            yield videoFrame if rect is None else videoFrame.crop(rect)
+
+    @staticmethod
+    def genResize(frames, width, height, interpolation=cv2.INTER_AREA):
+        """resize the frames to the given width and height"""
+        for videoFrame in frames:
+            image = cv2.resize(
+                videoFrame.image, (width, height), interpolation=interpolation
+            )
+            yield videoFrame.withImage(image)
+
+    @staticmethod
+    def genWarp(frames, video, points, rotation=0):
+        """warp the frames with the given trapezoid points and rotate them by the given angle"""
+        for videoFrame in frames:
+            image = video.warpAndRotate(videoFrame.image, points, rotation)
+            yield videoFrame.withImage(image)
+
+    @staticmethod
+    def genProcess(frames, process):
+        """apply the given image processing function to the frames - the original image is passed on if the processing fails"""
+        for videoFrame in frames:
+            try:
+                image = process(videoFrame.image)
+            except Exception:
+                logger.exception("processing error")
+                image = videoFrame.image
+            yield videoFrame.withImage(image)
+
+    @staticmethod
+    def genTee(frames, recorder):
+        """write the frames to the given recorder and pass them on"""
+        for videoFrame in frames:
+            recorder.write(videoFrame.image)
+            yield videoFrame
+
+    @staticmethod
+    def genShow(frames, video, title=None, every=1, onQuit=None):
+        """show every n-th frame - stops and calls the optional onQuit callback when the user wants to quit"""
+        if title is None:
+            title = video.title
+        for count, videoFrame in enumerate(frames):
+            if count % every == 0 and not video.showImage(videoFrame.image, title):
+                if onQuit is not None:
+                    onQuit()
+                break
+            yield videoFrame
+
+
+class FrameRingBuffer:
+    """bounded ring buffer of VideoFrames shared between a capture thread and a consumer"""
+
+    def __init__(self, size=4, policy=BufferPolicy.DROP_OLDEST):
+        self.size = size
+        self.policy = policy
+        self.frames = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        # statistics
+        self.captured = 0
+        self.dropped = 0
+        self.blocked = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def put(self, frame):
+        """add the given frame - returns the frame that had to be dropped to make room or None"""
+        droppedFrame = None
+        with self.condition:
+            if len(self.frames) >= self.size:
+                if self.policy == BufferPolicy.DROP_OLDEST:
+                    droppedFrame = self.frames.popleft()
+                    self.dropped += 1
+                else:
+                    self.blocked += 1
+                    while len(self.frames) >= self.size and not self.closed:
+                        self.condition.wait()
+            if self.closed:
+                return frame
+            self.frames.append(frame)
+            self.captured += 1
+            self.condition.notify_all()
+        return droppedFrame
+
+    def get(self, timeout=None):
+        """get the oldest frame - waits for a frame to be available and returns None if the buffer is closed and empty or the timeout is reached"""
+        with self.condition:
+            while len(self.frames) == 0 and not self.closed:
+                if not self.condition.wait(timeout):
+                    return None
+            if len(self.frames) == 0:
+                return None
+            frame = self.frames.popleft()
+            self.condition.notify_all()
+            return frame
+
+    def close(self):
+        """close the buffer - waiting producers and consumers are released"""
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+
 # see https://www.pyimagesearch.com/2017/02/06/faster-video-file-fps-with-cv2-videocapture-and-opencv/
 class VideoStream(object):
-    """run videograbbing in separate stream"""
+    """run video grabbing in a separate thread that owns the capture and fills a ring buffer"""
 
-    def __init__(self, video, show=False, postProcess=None, name="VideoStream"):
+    def __init__(self, video, bufferSize=4, policy=None, name="VideoStream"):
+        """construct me for the given (opened) video with the given buffer size and policy - if no policy is given live cameras drop the oldest frames and files block"""
         self.video = video
-        self.show = show
-        self.quit = False
+        if policy is None:
+            policy = BufferPolicy.DROP_OLDEST if video.isLive() else BufferPolicy.BLOCK
+        self.buffer = FrameRingBuffer(bufferSize, policy)
+        # number of frames to skip without decoding before each captured frame
+        self.skip = 0
+        # the frame most recently handed out to the consumer
         self.frame = None
         # initialize the thread name
         self.name = name
-        self.postProcess = postProcess
-
+        self.thread = None
         # initialize the variable used to indicate if the thread should
         # be stopped
         self.stopped = False
 
     def start(self):
         # start the thread to read frames from the video stream
-        t = Thread(target=self.update, name=self.name, args=())
-        t.daemon = True
-        t.start()
+        self.thread = Thread(target=self.update, name=self.name, args=())
+        self.thread.daemon = True
+        self.thread.start()
         return self
 
     def update(self):
-        # keep looping infinitely until the thread is stopped
-        while True:
-            # if the thread indicator variable is set, stop the thread
-            if self.stopped:
-                return
-
-            ret, frame, quitWanted = video.readFrame(self.show, self.postProcess)
-            if quitWanted:
-                return
-
-            if ret:
-                self.frame = frame
-
-    def read(self):
-        # return the frame most recently read
-        return self.frame
+        """capture loop - keep reading until the thread is stopped or the video ends"""
+        video = self.video
+        while not self.stopped and video.frames < video.maxFrames:
+            if self.skip > 0 and not video.ispaused:
+                video.skipFrames(self.skip)
+            ret, image = video.readCap()
+            if not ret:
+                break
+            video.frames += 1
+            video.fpsCheck.update()
+            videoFrame = VideoFrame(video.frames, timer(), image, video.captureOffset())
+            self.buffer.put(videoFrame)
+        self.buffer.close()
+
+    def read(self, timeout=None):
+        """return the next captured frame or None if the stream has ended - a paused video repeats the previous frame"""
+        video = self.video
+        if video.ispaused and self.frame is not None:
+            return self.frame
+        frame = self.buffer.get(timeout)
+        if frame is None:
+            # a still image keeps being available after the end of the stream
+            if video.autoPause and self.frame is not None:
+                video.ispaused = True
+                return self.frame
+            return None
+        if frame.index >= video.maxFrames and video.autoPause:
+            video.ispaused = True
+        self.frame = frame
+        video.frame = frame.image
+        return frame
 
     def stop(self):
         # indicate that the thread should be stopped
         self.stopped = True
+        self.buffer.close()
+        if self.thread is not None:
+            self.thread.join()
+
+
+class VideoRecorder(object):
+    """write frames to a video file in a separate thread fed by a bounded ring buffer"""
+
+    def __init__(
+        self,
+        filename,
+        width,
+        height,
+        fps,
+        codec="XVID",
+        bufferSize=32,
+        policy=BufferPolicy.BLOCK,
+        name="VideoRecorder",
+    ):
+        """construct me for the given filename, frame size, frames per second and four character codec"""
+        self.filename = filename
+        fourcc = cv2.VideoWriter_fourcc(*codec)
+        self.writer = cv2.VideoWriter(filename, fourcc, fps, (width, height))
+        self.buffer = FrameRingBuffer(bufferSize, policy)
+        self.frames = 0
+        self.written = 0
+        self.thread = Thread(target=self.run, name=name, args=())
+        self.thread.daemon = True
+        self.thread.start()
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, image):
+        """queue the given image for writing - the image must not be modified afterwards"""
+        self.frames += 1
+        self.buffer.put(VideoFrame(self.frames, timer(), image))
+
+    def run(self):
+        """writer loop - encode the queued frames until the recorder is released"""
+        while True:
+            frame = self.buffer.get()
+            if frame is None:
+                break
+            self.writer.write(frame.image)
+            self.written += 1
+
+    def release(self):
+        """write the pending frames and close the video file"""
+        self.buffer.close()
+        self.thread.join()
+        self.writer.release()
+
+    def __str__(self):
+        text = "%s: %d frames written, %d dropped, %d blocked" % (
+            self.filename,
+            self.written,
+            self.buffer.dropped,
+            self.buffer.blocked,
+        )
+        return text
 
 
 if __name__ == "__main__":
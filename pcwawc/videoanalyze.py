@@ -7,18 +7,28 @@ Created on 2019-12-08
 """
 import sys
 
+import numpy as np
+
 from pcwawc.args import Args
 from pcwawc.boardfinder import BoardFinder, Corners
+from pcwawc.boardtracker import BoardTracker
 from pcwawc.chessimage import ChessBoardVision
 from pcwawc.detectorfactory import MoveDetectorFactory
 from pcwawc.environment import Environment
 from pcwawc.eventhandling import Observable
 from pcwawc.lichessbridge import Lichess
+from pcwawc.video import BufferPolicy
 
 
 class VideoAnalyzer(Observable):
     """analyzer for chessboard videos - may be used from command line or web app"""
 
+    # number of recorded frames after which the recording state is logged
+    recordLogInterval = 100
+    # number of frames to wait before searching a lost chessboard again - doubled after each failed search
+    researchInterval = 4
+    maxResearchInterval = 64
+
     def __init__(self, args, vision=None, logger=None):
         super(VideoAnalyzer, self).__init__()
         if vision is None:
@@ -31,6 +41,12 @@ class VideoAnalyzer(Observable):
         if self.debug:
             self.log("Warp: %s" % (args.warpPointList))
 
+        self.cbImageSet = None
+        # optical flow tracker of the chessboard - see --track
+        self.tracker = None
+        # frame index of the next search for a lost chessboard and the frames to wait after a failed search
+        self.researchFrame = None
+        self.researchWait = VideoAnalyzer.researchInterval
         # not recording
         self.videopath = None
         self.videoout = None
@@ -39,10 +55,11 @@ class VideoAnalyzer(Observable):
         self.vision.open(self.args.input)
         video = self.vision.video
         if self.args.startframe > 0:
-            if self.debug:
-                print("skipping first %d frames" % (self.args.startframe))
-            while video.frames <= self.args.startframe:
-                self.vision.video.readFrame()
+            video.seekFrame(self.args.startframe)
+        elif self.args.starttime > 0:
+            video.seekTime(self.args.starttime)
+        if self.debug and video.frames > 0:
+            print("starting at frame %d" % (video.frames))
 
     def close(self):
         if self.videoout is not None:
@@ -68,6 +85,7 @@ class VideoAnalyzer(Observable):
 
     def stopVideoRecording(self):
         self.videoout.release()
+        self.log("finished recording %s" % (self.videoout))
         self.videopath = None
         self.videoout = None
         return self.videofilename
@@ -92,13 +110,21 @@ class VideoAnalyzer(Observable):
         return pgn
 
     def nextImageSet(self):
+        cbImageSet = self.readImageSet()
+        if cbImageSet is not None:
+            self.processImageSet(cbImageSet)
+        return cbImageSet
+
+    def readImageSet(self):
+        """read the next image set without analyzing it - returns None if there is no image"""
         self.cbImageSet = self.vision.readChessBoardImage()
         if not self.vision.hasImage:
             return None
-        self.processImageSet(self.cbImageSet)
         return self.cbImageSet
 
     def processImageSet(self, cbImageSet):
+        if self.args.track and not self.args.nowarp and not self.vision.prewarped:
+            self.trackChessBoard(cbImageSet)
         cbImageSet.warpAndRotate(self.args.nowarp)
         # analyze the board if warping is active
         self.fire(cbImageSet=cbImageSet)
@@ -111,18 +137,73 @@ class VideoAnalyzer(Observable):
                 # create correctly sized output
                 video = self.vision.video
                 self.videoout = video.prepareRecording(
-                    self.videopath, cbWarped.width, cbWarped.height
+                    self.videopath,
+                    cbWarped.width,
+                    cbWarped.height,
+                    codec=self.args.codec,
+                    policy=BufferPolicy.fromName(self.args.recordpolicy),
                 )
-
+            # the recorder encodes in a separate thread
             self.videoout.write(cbWarped.image)
-            self.log("wrote frame %d to recording " % (self.vision.video.frames))
+            if self.videoout.frames % VideoAnalyzer.recordLogInterval == 0:
+                self.log("recording %s" % (self.videoout))
         return
 
     def findChessBoard(self):
-        return self.findTheChessBoard(self.vision.video.frame, self.vision.video)
+        video = self.vision.video
+        cbImageSet = self.cbImageSet
+        if cbImageSet is None:
+            image, offset = video.frame, (0, 0)
+        else:
+            # look in the full captured image even if the image set has been cropped
+            image, offset = cbImageSet.capturedImage, cbImageSet.capturedOffset
+        corners = self.findTheChessBoard(image, video, offset)
+        if self.args.track:
+            self.seedTracker(image, corners, offset)
+        return corners
+
+    def seedTracker(self, image, corners, offset=(0, 0)):
+        """start tracking the chessboard from the given corners found in the given image"""
+        if self.tracker is None:
+            self.tracker = BoardTracker(self.vision.warp)
+        self.tracker.seed(image, corners, offset)
+        self.researchFrame = None
+
+    def trackChessBoard(self, cbImageSet):
+        """track the chessboard in the captured image of the given image set - search it again if the tracking has been lost
+
+        while the chessboard is lost the search is retried with an increasing number of frames in between
+        """
+        image, offset = cbImageSet.capturedImage, cbImageSet.capturedOffset
+        if self.tracker is None:
+            if not self.vision.warp.warping:
+                return
+            # start tracking from the warp points
+            self.tracker = BoardTracker(self.vision.warp)
+            self.tracker.seed(image, offset=offset)
+            return
+        if self.tracker.track(image, offset):
+            return
+        frameIndex = cbImageSet.frameIndex
+        if self.researchFrame is None:
+            self.log("frame %d: lost track of the chessboard" % (frameIndex))
+            self.researchFrame = frameIndex
+            self.researchWait = VideoAnalyzer.researchInterval
+        if frameIndex < self.researchFrame:
+            return
+        self.log("frame %d: searching the chessboard again" % (frameIndex))
+        try:
+            corners = self.findTheChessBoard(image, self.vision.video, offset)
+            self.seedTracker(image, corners, offset)
+        except Exception as ex:
+            self.log("frame %d: %s" % (frameIndex, str(ex)))
+            self.researchFrame = frameIndex + self.researchWait
+            self.researchWait = min(
+                2 * self.researchWait, VideoAnalyzer.maxResearchInterval
+            )
 
-    def findTheChessBoard(self, image, video):
-        finder = BoardFinder(image, video=video)
+    def findTheChessBoard(self, image, video, offset=(0, 0)):
+        finder = BoardFinder(image, video=video, pyramid=self.args.pyramid)
         corners = finder.findOuterCorners()
         # @FIXME - use property title and frame count instead
         title = "corners_%s.jpg" % (video.fileTimeStamp())
@@ -133,6 +214,8 @@ class VideoAnalyzer(Observable):
             finder.showPolygonDebug(image, title, corners)
             finder.showHistogramDebug(histograms, title, corners)
         trapez = corners.trapez8x8
+        if offset != (0, 0):
+            trapez = trapez + np.array(offset)
         self.vision.warp.pointList = trapez.tolist()
         self.vision.warp.updatePoints()
         return corners
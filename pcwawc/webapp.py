@@ -20,7 +20,6 @@ class WebApp:
     def __init__(self, args, logger=None):
         """construct me"""
         self.args = args
-        self.videoStream = None
         self.videoAnalyzer = VideoAnalyzer(args, logger=logger)
         self.videoAnalyzer.setUpDetector()
         self.board = self.videoAnalyzer.vision.board
@@ -47,7 +46,9 @@ class WebApp:
         )
 
     def home(self):
-        self.videoAnalyzer.vision.video = Video()
+        video = Video()
+        video.framePoolSize = self.args.framepool
+        self.videoAnalyzer.vision.video = video
         return self.index("Home")
 
     def photoDownload(self, path, filename):
@@ -207,7 +208,8 @@ class WebApp:
         if not self.videoAnalyzer.isRecording():
             video = self.videoAnalyzer.vision.video
             filename = self.videoAnalyzer.startVideoRecording(
-                path, "chessgame_%s.avi" % (video.fileTimeStamp())
+                path,
+                "chessgame_%s.%s" % (video.fileTimeStamp(), self.args.container),
             )
             msg = "started recording %s" % (filename)
         else:
@@ -254,23 +256,6 @@ class WebApp:
             # wait for source data to be available, then push it
             yield "data: {}\n\n".format(self.getEvent())
 
-    # streamed video generator
-    # @TODO fix this non working code
-    # def genVideoStreamed(self, video):
-    #    if self.videoStream is None:
-    #        self.videoStream = VideoStream(self.video, show=True, postProcess=self.video.addTimeStamp)
-    #        self.videoStream.start()
-    #    while True:
-    #        frame = self.videoStream.read()
-    #        if frame is not None:
-    #            flag, encodedImage = self.video.imencode(frame)
-    #            # ensure we got a valid image
-    #            if not flag:
-    #                continue
-    #            # yield the output frame in the byte format
-    #            yield(b'--frame\r\n' b'Content-Type: image/jpeg\r\n\r\n' +
-    #                  bytearray(encodedImage) + b'\r\n')
-
     # video generator
     def genVideo(self, analyzer):
         if self.args.autowarp:
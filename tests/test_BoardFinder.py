@@ -1,13 +1,17 @@
 #!/usr/bin/python
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+import threading
 from timeit import default_timer as timer
 
 import chess
+import cv2
+import numpy as np
 
 from pcwawc.boardfinder import BoardFinder, Corners
 from pcwawc.chesstrapezoid import Trapez2Square
 from pcwawc.environment import Environment
 from pcwawc.environment4test import Environment4Test
+from pcwawc.histogram import Histogram
 from pcwawc.video import Video
 
 testEnv = Environment4Test()
@@ -59,6 +63,133 @@ class BoardFinderTest(TestCase):
                 % (len(testEnv.imageInfos), (endt - startt))
             )
 
+    def test_findCornersConcurrently(self):
+        """
+        test that the concurrent pattern search finds the same patterns as searching one pattern after another
+        """
+        maxWorkers = BoardFinder.maxWorkers
+        try:
+            for imageInfo in testEnv.imageInfos:
+                image, video, warp = testEnv.prepareFromImageInfo(imageInfo)
+                finder = BoardFinder(image, video=video)
+                assert not finder.pyramid
+                gray, fullSizeGray = finder.preparefindCorners(image, 360)
+                expected = {}
+                for pattern in Corners.genChessPatterns():
+                    corners = Corners(pattern, video)
+                    if corners.findPattern(gray) and corners.findPattern(fullSizeGray):
+                        expected[pattern] = corners.corners
+                    if len(expected) >= 2:
+                        break
+                for BoardFinder.maxWorkers in [None, 1]:
+                    found = finder.findCorners(image, limit=2, searchWidth=360)
+                    assert list(found.keys()) == list(expected.keys())
+                    for pattern, corners in found.items():
+                        assert (corners.corners == expected[pattern]).all()
+                    for pattern in found:
+                        # fast check, search and full size search
+                        assert len(finder.timings[pattern]) == 3
+                    # no search is still running
+                    assert not [
+                        thread
+                        for thread in threading.enumerate()
+                        if thread.name.startswith("BoardFinder")
+                    ]
+                # patterns wrongly rejected by the fast check keep their preference
+                finder.checkPatterns = lambda gray, patterns: [
+                    pattern for pattern in patterns if pattern not in expected
+                ]
+                found = finder.findCorners(image, limit=2, searchWidth=360)
+                assert list(found.keys()) == list(expected.keys())
+        finally:
+            BoardFinder.maxWorkers = maxWorkers
+
+    def test_findCornersPyramid(self):
+        """
+        test refining the corners found in the downscaled image against searching the full size image
+        """
+        for imageInfo in testEnv.imageInfos:
+            image, video, warp = testEnv.prepareFromImageInfo(imageInfo)
+            finder = BoardFinder(image, video=video, pyramid=True)
+            gray, fullSizeGray = finder.preparefindCorners(image, 640)
+            startt = timer()
+            found = finder.findCorners(image, limit=1)
+            endt = timer()
+            assert len(found) == 1
+            pattern, corners = next(iter(found.items()))
+            assert (corners.w, corners.h) == (finder.width, finder.height)
+            fullSize = Corners(pattern, video)
+            if fullSize.findPattern(fullSizeGray):
+                # compare both to the full size corners refined to sub pixel accuracy
+                refined = cv2.cornerSubPix(
+                    fullSizeGray,
+                    fullSize.corners.copy(),
+                    (5, 5),
+                    (-1, -1),
+                    BoardFinder.subPixCriteria,
+                ).reshape(-1, 1, 2)
+                pyramidError = np.linalg.norm(
+                    corners.corners - refined.reshape(1, -1, 2), axis=2
+                ).min(axis=1)
+                fullSizeError = np.linalg.norm(
+                    fullSize.corners - refined.reshape(1, -1, 2), axis=2
+                ).min(axis=1)
+                print(
+                    "%s %dx%d in %.3f s median error %.2f pixels instead of %.2f"
+                    % (
+                        imageInfo.title,
+                        pattern[0],
+                        pattern[1],
+                        endt - startt,
+                        np.median(pyramidError),
+                        np.median(fullSizeError),
+                    )
+                )
+                assert np.median(pyramidError) <= np.median(fullSizeError)
+            # the corners are only refined in the full size image
+            assert len(finder.timings[pattern]) == 3
+
+    def test_HistogramsInBoardRect(self):
+        """
+        test the histograms calculated within the bounding rectangle of the board against those of the full size masked images
+        """
+        debug = BoardFinder.debug
+        BoardFinder.debug = False
+        try:
+            for imageInfo in testEnv.imageInfos[:4]:
+                image, video, warp = testEnv.prepareFromImageInfo(imageInfo)
+                finder = BoardFinder(image, video=video)
+                corners = finder.findOuterCorners()
+                histograms = finder.getHistograms(image, imageInfo.title, corners)
+                finder.expand(image, imageInfo.title, histograms, corners)
+                # the filtered images are only created for debugging
+                assert finder.colorFiltered == {}
+                # the masks follow the color of the topleft field found
+                for filterColor in (chess.WHITE, chess.BLACK):
+                    masked = finder.maskCornerPolygons(image, corners, filterColor)
+                    expected = Histogram(masked, histRange=(1, 256))
+                    assert histograms[filterColor].color == expected.color
+                    assert histograms[filterColor].stdv == expected.stdv
+                mask8x8 = np.zeros(image.shape[:2], np.uint8)
+                cv2.fillConvexPoly(mask8x8, corners.trapez8x8, 255)
+                colorMasks = []
+                for filterColor in (chess.WHITE, chess.BLACK):
+                    lower, upper = histograms[filterColor].range(1.0)
+                    colorMasks.append(
+                        cv2.inRange(
+                            image,
+                            np.array(lower, np.uint8),
+                            np.array(upper, np.uint8),
+                        )
+                    )
+                background = mask8x8 & ~(colorMasks[0] | colorMasks[1])
+                expected = Histogram(
+                    video.maskImage(image, background), histRange=(1, 256)
+                )
+                assert histograms["background"].color == expected.color
+        finally:
+            BoardFinder.debug = debug
+
     def test_SortPoints(self):
         points = [(0, 0), (0, 1), (1, 1), (1, 0)]
         center = BoardFinder.centerXY(points)
@@ -0,0 +1,129 @@
+#!/usr/bin/python
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from timeit import default_timer as timer
+from types import SimpleNamespace
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from pcwawc.boardfinder import BoardFinder
+from pcwawc.boardtracker import BoardTracker
+from pcwawc.chessimage import Warp
+from pcwawc.environment4test import Environment4Test
+from pcwawc.videoanalyze import VideoAnalyzer
+
+testEnv = Environment4Test()
+
+
+class BoardTrackerTest(TestCase):
+    """
+    test tracking the chessboard with optical flow
+    """
+
+    def genMovingBoard(self, image, frames):
+        """generate the frames of a slowly moving and rotating board with the transformation of each frame"""
+        h, w = image.shape[:2]
+        for frame in range(1, frames + 1):
+            matrix = cv2.getRotationMatrix2D((w / 2, h / 2), 0.3 * frame, 1.0)
+            matrix[:, 2] += (1.5 * frame, -1.0 * frame)
+            yield cv2.warpAffine(image, matrix, (w, h)), matrix
+
+    def test_TrackMovingBoard(self):
+        """
+        test tracking a moving board seeded from the corners found and from warp points
+        """
+        image = cv2.imread(testEnv.testMedia + "chessBoard011.jpg")
+        corners = BoardFinder(image).findOuterCorners()
+        outer = np.array(corners.trapez8x8, np.float32).reshape(-1, 1, 2)
+        for seedCorners in [corners, None]:
+            warp = Warp(corners.trapez8x8.tolist())
+            tracker = BoardTracker(warp)
+            tracker.seed(image, seedCorners)
+            startt = timer()
+            for frame, matrix in self.genMovingBoard(image, 30):
+                assert tracker.track(frame)
+                expected = cv2.transform(outer, matrix).reshape(-1, 2)
+                error = np.linalg.norm(expected - warp.points, axis=1).max()
+                # the warp is only updated if the board drifted far enough
+                assert error < BoardTracker.driftTreshold + 1.5
+            endt = timer()
+            print(
+                "tracked 30 frames in %.1f ms per frame with %d warp updates and confidence %.2f"
+                % ((endt - startt) * 1000 / 30, tracker.warpUpdates, tracker.confidence)
+            )
+            assert tracker.warpUpdates > 0
+            # a still board keeps the warp points
+            pointList = warp.pointList
+            assert tracker.track(frame)
+            assert warp.pointList is pointList
+            # the board is lost in an unrelated image
+            noise = np.random.randint(0, 256, image.shape, np.uint8)
+            assert not tracker.track(noise)
+            assert not tracker.tracking
+            assert not tracker.track(image)
+
+    def test_TrackVideo(self):
+        """
+        test tracking the board of a video after finding it automatically
+        """
+        argv = [
+            "--input",
+            testEnv.testMedia + "emptyBoard001.avi",
+            "--autowarp",
+            "--track",
+            "--pyramid",
+            "--nomoves",
+        ]
+        videoAnalyzer = VideoAnalyzer.fromArgs(argv)
+        videoAnalyzer.open()
+        videoAnalyzer.autoWarp()
+        tracker = videoAnalyzer.tracker
+        assert tracker is not None
+        assert tracker.tracking
+        frames = 0
+        while videoAnalyzer.nextImageSet() is not None:
+            frames += 1
+            assert tracker.tracking
+        videoAnalyzer.close()
+        print(
+            "tracked %d frames with %d warp updates and confidence %.2f"
+            % (frames, tracker.warpUpdates, tracker.confidence)
+        )
+        assert frames > 40
+
+    def test_ResearchLostBoard(self):
+        """
+        test that a lost chessboard is searched again with a backoff and tracked again once it is found
+        """
+        image = cv2.imread(testEnv.testMedia + "chessBoard011.jpg")
+        corners = BoardFinder(image).findOuterCorners()
+        argv = ["--input", testEnv.testMedia + "emptyBoard001.avi", "--track"]
+        videoAnalyzer = VideoAnalyzer.fromArgs(argv)
+        videoAnalyzer.tracker = BoardTracker(videoAnalyzer.vision.warp)
+        searches = []
+
+        def findTheChessBoard(image, video, offset=(0, 0)):
+            searches.append(frameIndex)
+            if not found:
+                raise Exception("no chessboard")
+            return corners
+
+        videoAnalyzer.findTheChessBoard = findTheChessBoard
+        noise = np.random.randint(0, 256, image.shape, np.uint8)
+        found = False
+        for frameIndex in range(1, 41):
+            cbImageSet = SimpleNamespace(
+                capturedImage=noise, capturedOffset=(0, 0), frameIndex=frameIndex
+            )
+            videoAnalyzer.trackChessBoard(cbImageSet)
+        assert searches == [1, 5, 13, 29]
+        found = True
+        for frameIndex in range(41, 62):
+            cbImageSet.frameIndex = frameIndex
+            cbImageSet.capturedImage = image
+            videoAnalyzer.trackChessBoard(cbImageSet)
+        # the tracker is seeded from the chessboard found
+        assert searches == [1, 5, 13, 29, 61]
+        assert videoAnalyzer.tracker.tracking
+        assert videoAnalyzer.researchFrame is None
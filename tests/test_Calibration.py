@@ -0,0 +1,86 @@
+#!/usr/bin/python
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+import tempfile
+from unittest import TestCase
+
+import cv2
+import numpy as np
+
+from pcwawc.calibration import CameraCalibration
+from pcwawc.environment4test import Environment4Test
+from pcwawc.video import Video
+
+testEnv = Environment4Test()
+
+
+class CalibrationTest(TestCase):
+    """
+    test the camera calibration and the lens distortion correction while warping
+    """
+
+    def getCalibration(self, k1=-0.3):
+        """get a calibration with barrel distortion for a 640x480 camera"""
+        calibration = CameraCalibration("test", 640, 480)
+        calibration.cameraMatrix = [[600, 0, 320], [0, 600, 240], [0, 0, 1]]
+        calibration.distCoeffs = [k1, 0, 0, 0, 0]
+        return calibration
+
+    def test_Calibrate(self):
+        """test calibrating from the chessboard patterns of the test images"""
+        calibration = CameraCalibration("test")
+        for imageInfo in testEnv.imageInfos:
+            image = cv2.imread(imageInfo.path)
+            if image.shape[:2] == (960, 1280):
+                assert calibration.addFrame(image) is not None
+        assert calibration.frames == 5
+        rms = calibration.calibrate()
+        print("calibrated from %d frames rms %.3f" % (calibration.frames, rms))
+        assert rms < 5
+        with tempfile.TemporaryDirectory() as path:
+            calibration.save(path)
+            loaded = CameraCalibration.load("test", path)
+            assert loaded.cameraMatrix == calibration.cameraMatrix
+            assert loaded.distCoeffs == calibration.distCoeffs
+            assert loaded.objectPoints == []
+            assert CameraCalibration.load(0, path) is None
+
+    def test_DistortPoints(self):
+        """test distorting and undistorting points"""
+        calibration = self.getCalibration()
+        points = np.array([[10, 20], [320, 240], [600, 450], [100, 400]])
+        undistorted = calibration.undistortPoints(points)
+        # barrel distortion pulls points far from the center inwards
+        assert np.linalg.norm(undistorted[0] - [320, 240]) > np.linalg.norm(
+            points[0] - [320, 240]
+        )
+        distorted = calibration.distortPoints(undistorted)
+        assert np.abs(distorted - points).max() < 0.5
+
+    def test_UndistortedWarp(self):
+        """test warping a distorted image of a board"""
+        calibration = self.getCalibration()
+        # an 8x8 board in the undistorted image
+        board = np.zeros((480, 640, 3), np.uint8)
+        for row in range(8):
+            for col in range(8):
+                if (row + col) % 2 == 0:
+                    x, y = 160 + col * 40, 80 + row * 40
+                    board[y : y + 40, x : x + 40] = 255
+        # distort it as the camera would
+        xs, ys = np.meshgrid(np.arange(640), np.arange(480))
+        pixels = np.stack((xs, ys), axis=-1).reshape(-1, 2)
+        undistorted = calibration.undistortPoints(pixels).reshape(480, 640, 2)
+        distorted = cv2.remap(board, undistorted, None, cv2.INTER_LINEAR)
+        corners = np.array([[160, 80], [480, 80], [480, 400], [160, 400]])
+        distortedCorners = calibration.distortPoints(corners)
+        expected = board[80:400, 160:480]
+        video = Video.getVideo()
+        warped = video.warp(distorted, distortedCorners)
+        video.calibration = calibration
+        corrected = video.warp(distorted, distortedCorners)
+        assert abs(corrected.shape[0] - 320) <= 1
+        corrected = cv2.resize(corrected, (320, 320))
+        errorWarped = cv2.absdiff(cv2.resize(warped, (320, 320)), expected).mean()
+        errorCorrected = cv2.absdiff(corrected, expected).mean()
+        print("warped error %.1f corrected error %.1f" % (errorWarped, errorCorrected))
+        assert errorCorrected < errorWarped / 2
@@ -0,0 +1,73 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+import threading
+from unittest import TestCase
+
+from pcwawc.capturemanager import CaptureManager, CaptureManagerArgs
+from pcwawc.environment4test import Environment4Test
+
+testEnv = Environment4Test()
+
+
+class CaptureManagerTest(TestCase):
+    """
+    test capturing and analyzing multiple boards in parallel
+    """
+
+    def test_CaptureManager(self):
+        inputs = [
+            testEnv.testMedia + "emptyBoard001.avi",
+            testEnv.testMedia + "scholarsmate.avi",
+            testEnv.testMedia + "emptyBoard001.avi",
+        ]
+        args = CaptureManagerArgs().parse(["--inputs"] + inputs + ["--workers", "2"])
+        captureManager = CaptureManager(args, args.inputs, maxWorkers=args.workers)
+        assert captureManager.maxWorkers == 2
+        # the boards do not share their warp points
+        pointLists = [board.args.warpPointList for board in captureManager.boards]
+        assert len(set(map(id, pointLists))) == len(pointLists)
+        assert all(pointList is not args.warpPointList for pointList in pointLists)
+        pgns = captureManager.run()
+        captureManager.showStatus()
+        assert len(pgns) == 3
+        expectedFrames = [52, 334, 52]
+        for index, board in enumerate(captureManager.boards):
+            assert board.error is None
+            assert board.finished
+            assert board.frames == expectedFrames[index]
+            # each board has its own detector
+            assert board.analyzer.moveDetector.vision is board.analyzer.vision
+
+    def test_FailingBoard(self):
+        """
+        test that a board that can not be opened does not stop the other boards and that only the detection runs in the worker pool
+        """
+        inputs = [
+            testEnv.testMedia + "emptyBoard001.avi",
+            testEnv.testMedia + "doesNotExist.avi",
+        ]
+        args = CaptureManagerArgs().parse(["--inputs"] + inputs)
+        captureManager = CaptureManager(args, args.inputs)
+        board, failing = captureManager.boards
+        readThreads, detectThreads = set(), set()
+        read, detect = board.read, board.detect
+
+        def readInThread():
+            readThreads.add(threading.current_thread().name)
+            return read()
+
+        def detectInThread(cbImageSet):
+            detectThreads.add(threading.current_thread().name)
+            detect(cbImageSet)
+
+        board.read, board.detect = readInThread, detectInThread
+        pgns = captureManager.run()
+        assert len(pgns) == 2
+        assert board.error is None
+        assert board.frames == 52
+        assert readThreads == {"BoardCapture0"}
+        assert all(name.startswith("CaptureManager") for name in detectThreads)
+        assert failing.error is not None
+        assert failing.finished
+        assert failing.frames == 0
+        assert "failed" in str(failing)
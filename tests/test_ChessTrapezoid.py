@@ -3,9 +3,11 @@
 import getpass
 import math
 import os
+from types import SimpleNamespace
 from timeit import default_timer as timer
 
 import chess
+import cv2
 import matplotlib.pyplot as plt
 import numpy as np
 import pytest
@@ -13,16 +15,19 @@ from matplotlib.collections import PatchCollection
 from matplotlib.patches import Polygon
 
 from pcwawc.args import Args
-from pcwawc.chessimage import ChessBoardVision
+from pcwawc.chessimage import ChessBoardImage, ChessBoardVision
 from pcwawc.chesstrapezoid import (
     ChessTrapezoid,
     ChessTSquare,
     Color,
     FieldState,
     SquareChange,
+    SquareSnapshots,
+    Transformation,
 )
 from pcwawc.detectstate import DetectColorState, DetectState
 from pcwawc.environment4test import Environment4Test
+from pcwawc.runningstats import RunningStats
 from pcwawc.video import Video
 
 testEnv = Environment4Test()
@@ -167,6 +172,39 @@ class ChessTrapezoidTest(TestCase):
             assert x == pytest.approx(ex, 0.1)
             assert y == pytest.approx(ey, 0.1)
 
+    def test_Geometry(self):
+        """test the batched and memoized square geometry"""
+        points = [(140, 5), (506, 10), (507, 377), (137, 374)]
+        startt = timer()
+        trapez = ChessTrapezoid(list(points), idealSize=800)
+        setupTime = timer() - startt
+        rw, rh = ChessTSquare.rw, ChessTSquare.rh
+        for tsquare in trapez.genSquares():
+            rx, ry = tsquare.rx, tsquare.ry
+            rpolygon = [(rx, ry), (rx + rw, ry), (rx + rw, ry + rh), (rx, ry + rh)]
+            polygon = np.array([trapez.relativeToTrapezXY(*rxy) for rxy in rpolygon])
+            assert np.allclose(tsquare.polygon, polygon, atol=1e-3)
+            assert (tsquare.ipolygon == tsquare.polygon.astype(np.int32)).all()
+            assert np.allclose(tsquare.rpolygon, rpolygon)
+            assert (
+                tsquare.idealPolygon == (np.array(rpolygon) * 800).astype(np.int32)
+            ).all()
+            assert (tsquare.x, tsquare.y) == pytest.approx(polygon[0], abs=1e-3)
+            cx, cy = trapez.geometry.centers[tsquare.row, tsquare.col]
+            ex, ey = trapez.relativeToTrapezXY(tsquare.rcx, tsquare.rcy)
+            assert (cx, cy) == pytest.approx((ex, ey), abs=1e-3)
+        # the same points share the geometry
+        startt = timer()
+        again = ChessTrapezoid(list(points), idealSize=800)
+        memoizedTime = timer() - startt
+        assert again.geometry is trapez.geometry
+        other = ChessTrapezoid(list(points), idealSize=640)
+        assert other.geometry is not trapez.geometry
+        print(
+            "trapezoid setup %.1f ms memoized %.1f ms"
+            % (setupTime * 1000, memoizedTime * 1000)
+        )
+
     def test_SortedTSquares(self):
         trapezoid = ChessTrapezoid([(140, 5), (506, 10), (507, 377), (137, 374)])
         trapezoid.updatePieces(chess.STARTING_FEN)
@@ -195,6 +233,254 @@ class ChessTrapezoidTest(TestCase):
         assert avgcolor.color == (110.00, 55.00, 210.00)
         assert avgcolor.stds == (5.00, 10.00, 10.00)
 
+    def test_SquareStats(self):
+        """test the per field state colors from the field state label map against masking each field state"""
+        for imageInfo in testEnv.imageInfos:
+            if not imageInfo.fen == chess.STARTING_BOARD_FEN:
+                continue
+            image, video, warp = testEnv.prepareFromImageInfo(imageInfo)
+            trapez = ChessTrapezoid(
+                warp.pointList, rotation=warp.rotation, idealSize=800
+            )
+            warped = trapez.warpedBoardImage(image)
+            trapez.updatePieces(imageInfo.fen)
+            startt = timer()
+            averageColors = trapez.analyzeColors(warped)
+            labelTime = timer() - startt
+            fieldStateLabels = trapez.fieldStateLabels
+            trapez.analyzeColors(warped)
+            assert trapez.fieldStateLabels is fieldStateLabels
+            # each square label is exact
+            counts, sums, sqsums = trapez.squareStats(warped.image)
+            labels = trapez.labels
+            for tsquare in trapez.genSquares():
+                mask = (labels == tsquare.square).astype(np.uint8)
+                means, stds = cv2.meanStdDev(warped.image, mask=mask)
+                squareColor = Color.fromStats(
+                    counts[tsquare.square], sums[tsquare.square], sqsums[tsquare.square]
+                )
+                assert squareColor.color == pytest.approx(means.ravel(), abs=0.01)
+                assert squareColor.stds == pytest.approx(stds.ravel(), abs=0.01)
+            # the field state colors are those of the masked images of each field state
+            startt = timer()
+            for fieldState, averageColor in averageColors.items():
+                mask = video.getEmptyImage(warped.image)
+                trapez.drawFieldStates(mask, [fieldState], Transformation.IDEAL, 1)
+                maskedColor = Color(video.maskImage(warped.image, mask))
+                assert averageColor.color == pytest.approx(maskedColor.color, rel=1e-9)
+                assert averageColor.stds == pytest.approx(maskedColor.stds, rel=1e-9)
+            maskTime = timer() - startt
+            print(
+                "%s: field state colors %.1f ms labeled %.1f ms masked"
+                % (imageInfo.title, labelTime * 1000, maskTime * 1000)
+            )
+            # moving pieces changes the labels
+            trapez.updatePieces(chess.Board().fen())
+            assert trapez.labels is None
+            assert trapez.fieldStateLabels is None
+
+    def test_FieldStateColors(self):
+        """test that black pixels are excluded from the field state colors and that pixels on the border of two field states count for both"""
+        trapez = ChessTrapezoid([(0, 0), (100, 0), (100, 100), (0, 100)], idealSize=80)
+        trapez.updatePieces(chess.Board().fen())
+        image = np.full((80, 80, 3), 100, np.uint8)
+        # a black stripe in the empty squares
+        image[38:40] = 0
+        averageColors = trapez.analyzeColors(ChessBoardImage(image, "warped"))
+        for fieldState in [FieldState.WHITE_EMPTY, FieldState.BLACK_EMPTY]:
+            assert averageColors[fieldState].color == pytest.approx((100, 100, 100))
+            assert averageColors[fieldState].stds == pytest.approx((0, 0, 0))
+        labels = trapez.fieldStateLabels
+        assert (labels == 0).sum() > 0
+        emptyBits = (1 << FieldState.WHITE_EMPTY) | (1 << FieldState.BLACK_EMPTY)
+        assert (labels == emptyBits).sum() > 0
+
+    def test_SquareSums(self):
+        """test the sums of all squares against summing the square images"""
+        trapez = ChessTrapezoid([(0, 0), (100, 0), (100, 100), (0, 100)])
+        for size in [800, 805]:
+            image = np.random.randint(0, 256, (size, size, 3), np.uint8)
+            sums = trapez.squareSums(image)
+            for tsquare in trapez.genSquares():
+                squareImage = tsquare.getSquareImage(ChessBoardImage(image, "test"))
+                assert sums[tsquare.square] == np.sum(squareImage, dtype=np.int64)
+
+    def test_DetectChanges(self):
+        """test the change detection of all squares against the running statistics of each square"""
+        trapez = ChessTrapezoid([(0, 0), (100, 0), (100, 100), (0, 100)])
+        detectState = DetectState(0.2, 20, 1)
+        moved = []
+        detectState.onPieceMoveDetected = lambda tsquare: moved.append(tsquare.an)
+        detected = set()
+        stats = [RunningStats() for square in chess.SQUARES]
+        random = np.random.default_rng(42)
+        image = np.zeros((400, 400, 3), np.uint8)
+        for frame in range(40):
+            diff = random.integers(0, 4, (400, 400, 3), dtype=np.uint8)
+            if frame >= 20:
+                # a piece has been moved from e2 to e4
+                diff[300:350, 200:250] = 200
+                diff[200:250, 200:250] = 200
+            imageSet = SimpleNamespace(
+                cbWarped=ChessBoardImage(image, "warped"),
+                cbDiff=ChessBoardImage(diff, "diff"),
+            )
+            changes = trapez.detectChanges(imageSet, detectState)
+            for tsquare in trapez.genSquares():
+                rs = stats[tsquare.square]
+                sdiff = tsquare.getSquareImage(imageSet.cbDiff)
+                value = np.sum(sdiff) / (400 * 400)
+                mean = rs.mean()
+                if rs.n < SquareChange.meanFrameCount:
+                    rs.push(value)
+                    valid, expectedDiff = False, 0
+                else:
+                    expectedDiff = value - mean
+                    valid = abs(expectedDiff) < SquareChange.treshold
+                squareChange = changes[tsquare.an]
+                assert squareChange.value == pytest.approx(value)
+                assert squareChange.mean == pytest.approx(mean)
+                assert squareChange.diff == pytest.approx(expectedDiff)
+                assert squareChange.valid == valid
+                assert tsquare.currentChange is squareChange
+                if changes["validBoard"] and valid:
+                    rs.push(value)
+                if changes["validBoard"] and tsquare.an in moved:
+                    rs.clear()
+                    moved.remove(tsquare.an)
+                    detected.add(tsquare.an)
+                    assert tsquare.postMoveImage is not None
+        assert detected == {"e2", "e4"}
+
+    def test_ReferenceBoards(self):
+        """test the cached ideal and pre move boards against drawing them from scratch"""
+        for size in [400, 405]:
+            corners = [(0, 0), (size, 0), (size, size), (0, size)]
+            trapez = ChessTrapezoid(list(corners), size)
+            image = np.random.randint(0, 256, (size, size, 3), np.uint8)
+            board = chess.Board()
+            trapez.updatePieces(board.fen())
+            trapez.analyzeColors(ChessBoardImage(image, "warped"))
+            cbIdeal = trapez.idealColoredBoard(size, size)
+            assert trapez.idealColoredBoard(size, size) is cbIdeal
+            # moving, capturing and castling
+            for move in [
+                "e2e4",
+                "d7d5",
+                "g1f3",
+                "d5e4",
+                "f1c4",
+                "e4f3",
+                "e1g1",
+                "f3g2",
+            ]:
+                board.push_uci(move)
+                trapez.updatePieces(board.fen())
+                cbUpdated = trapez.idealColoredBoard(size, size)
+                assert cbUpdated is not cbIdeal
+                assert trapez.idealColoredBoard(size, size) is cbUpdated
+                painter = ChessTrapezoid(list(corners), size)
+                painter.updatePieces(board.fen())
+                painter.averageColors = trapez.averageColors
+                cbPainted = painter.idealColoredBoard(size, size)
+                assert np.array_equal(cbUpdated.image, cbPainted.image)
+            # the colors are quantized
+            expected = trapez.idealColoredBoard(size, size).image.copy()
+            trapez.analyzeColors(ChessBoardImage(image // 2, "warped"))
+            assert not np.array_equal(
+                trapez.idealColoredBoard(size, size).image, expected
+            )
+            # the pre move board
+            trapez.preMoveSnapshots.store(image)
+            trapez.hasPreMove[:] = True
+            cbPreMove = trapez.preMoveBoard(size, size)
+            assert trapez.preMoveBoard(size, size) is cbPreMove
+            trapez.hasPreMove[[12, 28]] = False
+            cbCleared = trapez.preMoveBoard(size, size)
+            refImage = np.zeros((size, size, 3), np.uint8)
+            for tsquare in trapez.genSquares():
+                tsquare.addPreMoveImage(refImage)
+            assert np.array_equal(cbCleared.image, refImage)
+            assert not np.array_equal(cbPreMove.image, refImage)
+
+    def test_SquareSnapshots(self):
+        """test storing copies of the square images"""
+        trapez = ChessTrapezoid([(0, 0), (100, 0), (100, 100), (0, 100)])
+        for size in [400, 405]:
+            snapshots = SquareSnapshots(depth=2)
+            frames = [
+                np.random.randint(0, 256, (size, size, 3), np.uint8) for i in range(3)
+            ]
+            for frame in frames:
+                snapshots.store(frame)
+            images = snapshots.images
+            mask = np.zeros(64, bool)
+            mask[[12, 28]] = True
+            snapshots.store(frames[0], mask)
+            # the memory is preallocated
+            assert snapshots.images is images
+            for tsquare in trapez.genSquares():
+                square = tsquare.square
+                expected = [frames[2], frames[1]]
+                if mask[square]:
+                    expected = [frames[0], frames[2]]
+                history = snapshots.history(square)
+                assert len(history) == 2
+                for snapshot, frame in zip(history, expected):
+                    squareImage = tsquare.getSquareImage(ChessBoardImage(frame, "f"))
+                    assert np.array_equal(snapshot, squareImage)
+                    assert not np.shares_memory(snapshot, frame)
+                assert snapshots.latest(square, 2) is None
+        # downscaled grayscale snapshots
+        snapshots = SquareSnapshots(depth=4, scale=0.5, gray=True)
+        snapshots.store(frames[0])
+        assert snapshots.images.shape == (64, 4, 25, 25)
+        assert snapshots.latest(0).shape == (25, 25)
+        assert snapshots.latest(0, 1) is None
+        region = np.zeros((50, 50, 3), np.uint8)
+        snapshots.paste(snapshots.latest(0), region)
+        assert region.any()
+
+    def test_ColorCheckFactors(self):
+        """test checking all range factors at once against counting the pixels in range per factor"""
+        imageInfo = testEnv.imageInfos[0]
+        image, video, warp = testEnv.prepareFromImageInfo(imageInfo)
+        trapez = ChessTrapezoid(warp.pointList, rotation=warp.rotation, idealSize=800)
+        warped = trapez.warpedBoardImage(image)
+        trapez.updatePieces(imageInfo.fen)
+        averageColors = trapez.analyzeColors(warped)
+        rangeFactors = ChessTrapezoid.rangeFactors
+        startt = timer()
+        candidates = trapez.checkColorsForFactors(warped, averageColors, rangeFactors)
+        sweepTime = timer() - startt
+        startt = timer()
+        for rangeFactor, colorStats in zip(rangeFactors, candidates):
+            for fieldState, tsquares in trapez.byFieldState().items():
+                white = fieldState in [
+                    FieldState.WHITE_BLACK,
+                    FieldState.WHITE_EMPTY,
+                    FieldState.WHITE_WHITE,
+                ]
+                emptyState = FieldState.WHITE_EMPTY if white else FieldState.BLACK_EMPTY
+                lower, upper = averageColors[emptyState].colorRange(rangeFactor)
+                for tsquare in tsquares:
+                    squareImage = tsquare.getSquareImage(warped)
+                    nonzero = cv2.countNonZero(cv2.inRange(squareImage, lower, upper))
+                    percent = nonzero / squareImage[:, :, 0].size * 100
+                    assert colorStats.colorPercent[tsquare.an] == pytest.approx(percent)
+        inRangeTime = timer() - startt
+        print(
+            "%d range factors: %.1f ms in one pass %.1f ms with inRange"
+            % (len(rangeFactors), sweepTime * 1000, inRangeTime * 1000)
+        )
+        for rangeFactor, colorStats in zip(rangeFactors, candidates):
+            colorStats.analyzeStats(rangeFactor, sweepTime)
+        fcs = trapez.optimizeColorCheck(warped, averageColors)
+        assert fcs.factor in rangeFactors
+        assert fcs.minSelectivity == max(
+            candidate.minSelectivity for candidate in candidates
+        )
+
     def test_ColorDistribution(self):
         imgPath = "/tmp/"
         for imageInfo in testEnv.imageInfos:
@@ -353,6 +639,7 @@ class ChessTrapezoidTest(TestCase):
         trapezoid = testVideo.setup().trapezoid
         frames = testVideo.frames
         # SquareChange.meanFrameCount=12
+        self.addCleanup(setattr, SquareChange, "treshold", SquareChange.treshold)
         SquareChange.treshold = 0.1
         detectState = DetectState(
             validDiffSumTreshold=1.4,
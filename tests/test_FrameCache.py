@@ -0,0 +1,160 @@
+#!/usr/bin/python
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import numpy as np
+
+from pcwawc.args import Args
+from pcwawc.calibration import CameraCalibration
+from pcwawc.chessimage import ChessBoardVision
+from pcwawc.environment4test import Environment4Test
+from pcwawc.framecache import FrameCache
+from pcwawc.video import Video
+
+testEnv = Environment4Test()
+
+
+class FrameCacheTest(TestCase):
+    """
+    test the decode once frame cache
+    """
+
+    def test_FrameCache(self):
+        """test caching the frames of a video"""
+        path = testEnv.testMedia + "emptyBoard001.avi"
+        video = Video.getVideo()
+        video.open(path)
+        images = []
+        while True:
+            ret, image, quit = video.readFrame()
+            if not ret:
+                break
+            images.append(image.copy())
+        video.close()
+        with tempfile.TemporaryDirectory() as cachePath:
+            cache = FrameCache(cachePath)
+            key = FrameCache.key(path)
+            assert not cache.has(key)
+            cap = cache.open(path)
+            assert cache.has(key)
+            assert FrameCache.key(path, [[0, 0], [10, 0], [10, 10], [0, 10]]) != key
+            cached = Video.getVideo()
+            cached.setup(cap)
+            assert not cached.isLive()
+            for image in images:
+                ret, frame, quit = cached.readFrame()
+                assert ret
+                assert not frame.flags.writeable
+                assert (frame == image).all()
+            ret, frame, quit = cached.readFrame()
+            assert not ret
+            assert cached.seekFrame(20) == 20
+            ret, frame, quit = cached.readFrame()
+            assert (frame == images[20]).all()
+
+    def test_FrameCacheLimit(self):
+        """test that the frames are counted while decoding and that unwarped caching is limited"""
+        path = testEnv.testMedia + "emptyBoard001.avi"
+        video = Video.getVideo()
+        video.open(path)
+        frameCount = 0
+        while video.readFrame()[0]:
+            frameCount += 1
+        video.close()
+        points = testEnv.imageInfos[0].warpPoints
+        with tempfile.TemporaryDirectory() as cachePath:
+            cache = FrameCache(cachePath)
+            # warped frames are not limited
+            info = cache.build(FrameCache.key(path, points), path, points)
+            assert info["frames"] == frameCount
+            self.addCleanup(setattr, FrameCache, "maxUnwarpedBytes", 4 << 30)
+            FrameCache.maxUnwarpedBytes = 640 * 480 * 3 * 10
+            key = FrameCache.key(path)
+            with self.assertRaises(Exception):
+                cache.build(key, path)
+            assert not cache.has(key)
+            # the partial frames of the refused build are removed
+            warpedKey = FrameCache.key(path, points)
+            assert sorted(os.listdir(cachePath)) == [
+                warpedKey + ".frames",
+                warpedKey + ".json",
+            ]
+
+    def test_FileHash(self):
+        """test that the hash of a video file changes with its size and modification time"""
+        with tempfile.TemporaryDirectory() as tmpPath:
+            path = os.path.join(tmpPath, "video.avi")
+            shutil.copyfile(testEnv.testMedia + "emptyBoard001.avi", path)
+            fileHash = FrameCache.fileHash(path)
+            assert FrameCache.fileHash(path) == fileHash
+            stat = os.stat(path)
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert FrameCache.fileHash(path) != fileHash
+            fileHash = FrameCache.fileHash(path)
+            with open(path, "ab") as file:
+                file.write(b"\0")
+            os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+            assert FrameCache.fileHash(path) != fileHash
+
+    def test_PrewarpedVision(self):
+        """test reading warped frames from the frame cache"""
+        imageInfo = testEnv.imageInfos[0]
+        path = testEnv.testMedia + "emptyBoard001.avi"
+        with tempfile.TemporaryDirectory() as cachePath:
+            args = Args("test")
+            args.parse(
+                ["--input", path, "--framecache", cachePath, "--rotation", "90"]
+                + ["--warp", str(imageInfo.warpPoints)]
+            )
+            for run in range(2):
+                vision = ChessBoardVision(args.args)
+                vision.open(path)
+                assert vision.prewarped
+                cbImageSet = vision.readChessBoardImage()
+                cbImageSet.warpAndRotate()
+                video = vision.video
+                original = Video.getVideo()
+                original.open(path)
+                ret, image, quit = original.readFrame()
+                warped = video.warpAndRotate(image, vision.warp.points, 90)
+                assert (cbImageSet.cbWarped.image == warped).all()
+                original.close()
+                vision.close()
+
+    def test_UndistortedPrewarpedVision(self):
+        """test that the prewarped frames of a calibrated vision are undistorted"""
+        imageInfo = testEnv.imageInfos[0]
+        path = testEnv.testMedia + "emptyBoard001.avi"
+        calibration = CameraCalibration("test", 640, 480)
+        calibration.cameraMatrix = [[600, 0, 320], [0, 600, 240], [0, 0, 1]]
+        calibration.distCoeffs = [-0.3, 0, 0, 0, 0]
+        points = imageInfo.warpPoints
+        assert FrameCache.key(path, points) != FrameCache.key(
+            path, points, 0, calibration
+        )
+        with tempfile.TemporaryDirectory() as cachePath:
+            args = Args("test")
+            args.parse(
+                ["--input", path, "--framecache", cachePath]
+                + ["--warp", str(imageInfo.warpPoints)]
+            )
+            vision = ChessBoardVision(args.args)
+            vision.video.calibration = calibration
+            vision.open(path)
+            assert vision.prewarped
+            cbImageSet = vision.readChessBoardImage()
+            cbImageSet.warpAndRotate()
+            original = Video.getVideo()
+            original.open(path)
+            ret, image, quit = original.readFrame()
+            original.calibration = calibration
+            undistorted = original.warpAndRotate(image, vision.warp.points)
+            assert (cbImageSet.cbWarped.image == undistorted).all()
+            original.calibration = None
+            distorted = original.warpAndRotate(image, vision.warp.points)
+            assert not np.array_equal(cbImageSet.cbWarped.image, distorted)
+            original.close()
+            vision.close()
@@ -1,11 +1,19 @@
 #!/usr/bin/python
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+import math
+import sys
+from timeit import default_timer as timer
 from unittest import TestCase
 
+import chess
 import cv2
+import numpy as np
 
+from pcwawc.chesstrapezoid import ChessTrapezoid
+from pcwawc.chessvision import FieldState
 from pcwawc.environment import Environment
 from pcwawc.environment4test import Environment4Test
+from pcwawc.histogram import Histogram, Stats, StatsArray
 from pcwawc.plotlib import PlotLib, PlotType
 
 testEnv = Environment4Test()
@@ -36,3 +44,104 @@ class HistogramTest(TestCase):
         a4wt, a4ht = a4t
         assert round(a4ht, 2) == 8.27
         assert round(a4wt, 2) == 11.69
+
+    def assertSameStats(self, stats, histindexed):
+        """check the given statistics against the ones calculated bin by bin from the given (x,y) pairs"""
+        total = 0.0
+        prod = 0.0
+        for x, y in histindexed:
+            total += y
+            prod += x * y
+        mean = 0 if total == 0 else prod / total
+        sqsum = 0.0
+        lower, upper = sys.maxsize, -sys.maxsize
+        for x, y in histindexed:
+            if y > 0:
+                lower, upper = min(lower, x), max(upper, x)
+            sqsum += y * (x - mean) * (x - mean)
+        stdv = math.sqrt(0 if sqsum == 0 else sqsum / total)
+        maxdelta = max(mean - lower, upper - mean)
+        factor = 0 if stdv == 0 else maxdelta / stdv
+        assert stats.sum == total
+        assert math.isclose(stats.mean, mean, abs_tol=1e-9)
+        assert math.isclose(stats.stdv, stdv, abs_tol=1e-9)
+        assert (stats.min, stats.max) == (lower, upper)
+        assert math.isclose(stats.maxdelta, maxdelta, abs_tol=1e-9)
+        assert math.isclose(stats.factor, factor, abs_tol=1e-9)
+
+    def test_VectorizedStats(self):
+        """
+        test the vectorized statistics against the bin by bin calculation
+        """
+        rng = np.random.default_rng(1)
+        hists = rng.integers(0, 100, (20, 256)) * (rng.random((20, 256)) > 0.7)
+        hists[0] = 0
+        hists[1, :] = 0
+        hists[1, 42] = 5
+        statsArray = StatsArray(hists)
+        assert len(statsArray) == 20
+        lower, upper = statsArray.range(1.2)
+        for index, hist in enumerate(hists):
+            histindexed = list(enumerate(hist.tolist()))
+            for stats in (statsArray[index], Stats(hist), Stats(histindexed)):
+                self.assertSameStats(stats, histindexed)
+                assert stats.n == 256
+            assert np.allclose(
+                statsArray[index].range(1.2), (lower[index], upper[index])
+            )
+        assert statsArray[1].stdv == 0 and statsArray[1].factor == 0
+
+    def test_BatchedHistograms(self):
+        """
+        test the histograms of many masks and labels calculated in one call
+        """
+        imageInfo = testEnv.imageInfos[0]
+        image = testEnv.loadFromImageInfo(imageInfo).image
+        h, w = image.shape[:2]
+        trapez = ChessTrapezoid([(0, 0), (w, 0), (w, h), (0, h)], idealSize=w)
+        trapez.updatePieces(chess.STARTING_BOARD_FEN)
+        squareLabels = trapez.labelMap(w, h)
+        # the label of a square is its square index - map it to the field state of the square
+        fieldStateOf = np.full(256, len(FieldState), np.uint8)
+        for tsquare in trapez.genSquares():
+            fieldStateOf[tsquare.square] = tsquare.fieldState
+        fieldStateLabels = fieldStateOf[squareLabels]
+        # the square statistics of the trapezoid are based on the same per label histograms
+        counts, sums, sqsums = trapez.squareStats(image)
+        for square, histogram in enumerate(
+            Histogram.forLabels(image, squareLabels, 64)
+        ):
+            assert counts[square] == histogram.stats[0].sum
+            assert np.allclose(sums[square] / counts[square], histogram.color)
+        for labels, labelCount in [
+            (squareLabels, 64),
+            (fieldStateLabels, len(FieldState)),
+        ]:
+            masks = [(labels == label).astype(np.uint8) for label in range(labelCount)]
+            startt = timer()
+            expected = [Histogram(image, mask=mask) for mask in masks]
+            singlet = timer() - startt
+            startt = timer()
+            byMasks = Histogram.forMasks(image, masks)
+            maskt = timer() - startt
+            startt = timer()
+            byLabels = Histogram.forLabels(image, labels, labelCount)
+            labelt = timer() - startt
+            print(
+                "%d histograms: %.1f ms single, %.1f ms by masks, %.1f ms by labels"
+                % (labelCount, singlet * 1000, maskt * 1000, labelt * 1000)
+            )
+            for histograms in (byMasks, byLabels):
+                assert len(histograms) == labelCount
+                for histogram, expectedHistogram in zip(histograms, expected):
+                    for channel in range(3):
+                        assert np.array_equal(
+                            histogram.hist[channel], expectedHistogram.hist[channel]
+                        )
+                    assert np.allclose(histogram.color, expectedHistogram.color)
+                    assert np.allclose(histogram.stdv, expectedHistogram.stdv)
+                    assert histogram.mincolor == expectedHistogram.mincolor
+                    assert histogram.maxcolor == expectedHistogram.maxcolor
+                    assert np.allclose(
+                        histogram.range(1.0), expectedHistogram.range(1.0)
+                    )
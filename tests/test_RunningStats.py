@@ -2,9 +2,16 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
 from unittest import TestCase
 
+import numpy as np
 import pytest
 
-from pcwawc.runningstats import ColorStats, MovingAverage, RunningStats
+from pcwawc.runningstats import (
+    ColorStats,
+    MinMaxStats,
+    MovingAverage,
+    RunningStats,
+    RunningStatsArray,
+)
 
 
 class RunningStatsTest(TestCase):
@@ -23,6 +30,39 @@ class RunningStatsTest(TestCase):
         assert variance == 13.0
         assert stdev == pytest.approx(3.605551, 0.00001)
 
+    def test_PushAll(self):
+        values = [17.0, 19.0, 24.0, 11.0, 30.0]
+        rs = MinMaxStats()
+        rs.push(values[0])
+        rs.pushAll(np.array(values[1:]))
+        expected = MinMaxStats()
+        for value in values:
+            expected.push(value)
+        assert rs.n == expected.n
+        assert rs.mean() == pytest.approx(expected.mean())
+        assert rs.variance() == pytest.approx(expected.variance())
+        assert (rs.min, rs.max) == (11.0, 30.0)
+
+    def test_RunningStatsArray(self):
+        values = np.array([[17.0, 1.0, 5.0], [19.0, 2.0, 6.0], [24.0, 3.0, 7.0]])
+        masks = np.array([[True, True, False], [True, False, True], [True, True, True]])
+        rsa = RunningStatsArray(3)
+        rss = [RunningStats() for index in range(3)]
+        for frame, mask in enumerate(masks):
+            if frame == 2:
+                rsa.clear(np.array([False, True, False]))
+                rss[1].clear()
+            rsa.push(values[frame], mask)
+            for index, rs in enumerate(rss):
+                if mask[index]:
+                    rs.push(values[frame, index])
+        assert rsa.mean()[0] == 20.0
+        assert rsa.variance()[0] == 13.0
+        for index, rs in enumerate(rss):
+            assert rsa.n[index] == rs.n
+            assert rsa.mean()[index] == pytest.approx(rs.mean())
+            assert rsa.variance()[index] == pytest.approx(rs.variance())
+
     def test_ColorStats(self):
         colors = [(100, 100, 100), (90, 100, 90), (80, 90, 80), (110, 110, 120)]
         colorStats = ColorStats()
@@ -0,0 +1,57 @@
+#!/usr/bin/python
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+from unittest import TestCase
+
+import numpy as np
+
+from pcwawc.args import Args
+from pcwawc.chessimage import ChessBoardImageSet, ChessBoardVision
+from pcwawc.screencapture import ScreenCapture
+
+
+class ScreenCaptureTest(TestCase):
+    """
+    test the screen capture frame source
+    """
+
+    def test_ScreenDevice(self):
+        """test recognizing screen devices"""
+        assert ScreenCapture.isScreenDevice("screen")
+        assert ScreenCapture.isScreenDevice("screen:2")
+        assert not ScreenCapture.isScreenDevice("0")
+        assert not ScreenCapture.isScreenDevice(0)
+        assert not ScreenCapture.isScreenDevice("testMedia/emptyBoard001.avi")
+        assert ScreenCapture.monitorOf("screen") == 1
+        assert ScreenCapture.monitorOf("screen:2") == 2
+
+    def test_Region(self):
+        """test the region to be grabbed for given warp points"""
+        monitor = {"left": 1920, "top": 0, "width": 1920, "height": 1080}
+        region = ScreenCapture.regionFor(None, monitor)
+        assert region == monitor
+        points = np.array([[100, 50], [500, 60], [520, 400], [90, 410]])
+        region = ScreenCapture.regionFor(points, monitor)
+        assert region == {"left": 2010, "top": 50, "width": 431, "height": 361}
+        # points outside of the monitor are clipped
+        points = np.array([[-10, -20], [2000, -20], [2000, 1200], [-10, 1200]])
+        region = ScreenCapture.regionFor(points, monitor)
+        assert region == monitor
+
+    def test_Offset(self):
+        """test warping an image that has been captured with an offset"""
+        args = Args("test")
+        args.parse(["--input", "screen"])
+        vision = ChessBoardVision(args.args)
+        vision.warp.pointList = [[110, 60], [150, 60], [150, 100], [110, 100]]
+        vision.warp.updatePoints()
+        image = np.zeros((100, 100, 3), np.uint8)
+        # the board region as captured from the screen at offset 100,50
+        image[10:50, 10:50] = 255
+        cbImageSet = ChessBoardImageSet(vision, image, 1, 0)
+        cbImageSet.offset = (100, 50)
+        assert (
+            cbImageSet.warpPoints() == [[10, 10], [50, 10], [50, 50], [10, 50]]
+        ).all()
+        cbImageSet.warpAndRotate(nowarp=False)
+        warped = cbImageSet.cbWarped.image
+        assert warped[2:-2, 2:-2].min() == 255
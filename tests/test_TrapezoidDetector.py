@@ -0,0 +1,93 @@
+#!/usr/bin/python3
+# part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+"""
+Created on 2026-10-18
+
+@author: wf
+"""
+
+from types import SimpleNamespace
+from unittest import TestCase
+
+import chess
+import numpy as np
+
+from pcwawc.board import Board
+from pcwawc.chessimage import ChessBoardImage
+from pcwawc.chesstrapezoid import ChessTrapezoid
+from pcwawc.detectorfactory import MoveDetectorFactory
+from pcwawc.environment4test import Environment4Test
+from pcwawc.trapezoiddetector import TrapezoidDetector
+from pcwawc.videoanalyze import VideoAnalyzer
+
+testEnv = Environment4Test()
+
+
+class TrapezoidDetectorTest(TestCase):
+    """
+    test the trapezoid based move detector
+    """
+
+    def test_TrapezoidDetector(self):
+        """test selecting the trapezoid detector and its timings for a video"""
+        assert "trapezoid" in MoveDetectorFactory.detectors
+        path = testEnv.testMedia + "scholarsmate.avi"
+        argv = ["--input", path, "--nowarp", "--detector", "trapezoid"]
+        analyzer = VideoAnalyzer.fromArgs(argv)
+        analyzer.open()
+        assert isinstance(analyzer.moveDetector, TrapezoidDetector)
+        frames = 0
+        for frame in range(20):
+            cbImageSet = analyzer.nextImageSet()
+            if cbImageSet is None:
+                break
+            frames += 1
+            assert cbImageSet.cbDiff is not None
+        analyzer.close()
+        detector = analyzer.moveDetector
+        print(detector.formatTimings())
+        for step in TrapezoidDetector.steps:
+            assert detector.timingStats[step].n == frames
+
+    def test_MoveDetection(self):
+        """test detecting a move on a synthetic board with the default tresholds"""
+        board = Board()
+        vision = SimpleNamespace(
+            board=board, warp=SimpleNamespace(warping=True), debug=False
+        )
+        detector = MoveDetectorFactory.create("trapezoid", vision)
+        moves = []
+
+        def onMove(event):
+            moves.append(str(event.move))
+            board.move(event.move)
+
+        detector.subscribe(onMove)
+        # paint the board before and after the move
+        painter = ChessTrapezoid([(0, 0), (400, 0), (400, 400), (0, 400)], 400)
+        painter.updatePieces(chess.STARTING_FEN)
+        before = painter.idealColoredBoard(400, 400).image
+        chessboard = chess.Board()
+        chessboard.push_uci("e2e4")
+        painter.updatePieces(chessboard.fen())
+        after = painter.idealColoredBoard(400, 400).image
+        # a camera image has far less contrast than the painted board
+        contrast = 0.25
+        before, after = [
+            (image * contrast + (1 - contrast) * 128).astype(np.uint8)
+            for image in (before, after)
+        ]
+        random = np.random.default_rng(1)
+        for frame in range(60):
+            image = (before if frame < 25 else after).copy()
+            if 25 <= frame < 30:
+                # the hand moving the piece
+                image[200:300, 150:250] = 128
+            image += random.integers(0, 3, image.shape, dtype=np.uint8)
+            cbImageSet = SimpleNamespace(
+                vision=vision,
+                frameIndex=frame + 1,
+                cbWarped=ChessBoardImage(image, "warped"),
+            )
+            detector.onChessBoardImage(SimpleNamespace(cbImageSet=cbImageSet))
+        assert moves == ["e2e4"]
@@ -1,9 +1,25 @@
 # part of https://github.com/WolfgangFahl/play-chess-with-a-webcam
+import math
+from timeit import default_timer as timer
 from unittest import TestCase
 
+import cv2
+import numpy as np
+from imutils import perspective
+
 from pcwawc.environment import Environment
 from pcwawc.environment4test import Environment4Test
-from pcwawc.video import Video
+from pcwawc.imagesequence import ImageSequenceCapture
+from pcwawc.video import (
+    BufferPolicy,
+    FramePipeline,
+    FramePool,
+    FrameRingBuffer,
+    Video,
+    VideoFrame,
+    VideoRecorder,
+    VideoStream,
+)
 
 testenv = Environment4Test()
 
@@ -120,3 +136,306 @@ class VideoTest(TestCase):
         assert hc == 2 * h
         assert wc == 2 * w
         video.showImage(combined, "combined", keyWait=1000)
+
+    def test_FrameRingBuffer(self):
+        """
+        test the drop oldest policy of the ring buffer
+        """
+        ringBuffer = FrameRingBuffer(size=3, policy=BufferPolicy.DROP_OLDEST)
+        for index in range(1, 6):
+            ringBuffer.put(VideoFrame(index, index * 0.1, None))
+        assert len(ringBuffer) == 3
+        assert ringBuffer.dropped == 2
+        assert ringBuffer.get().index == 3
+        ringBuffer.close()
+        assert ringBuffer.get().index == 4
+        assert ringBuffer.get().index == 5
+        assert ringBuffer.get() is None
+
+    def test_VideoStream(self):
+        """
+        test reading a video file in a separate capture thread
+        """
+        video = Video.getVideo()
+        video.open(testenv.testMedia + "emptyBoard001.avi")
+        assert not video.isLive()
+        videoStream = VideoStream(video, bufferSize=2).start()
+        assert videoStream.buffer.policy == BufferPolicy.BLOCK
+        frames = 0
+        while True:
+            videoFrame = videoStream.read()
+            if videoFrame is None:
+                break
+            frames += 1
+            assert videoFrame.index == frames
+            assert videoFrame.image.shape[:2] == (480, 640)
+        videoStream.stop()
+        video.close()
+        assert frames == 52
+        assert videoStream.buffer.dropped == 0
+
+    def test_FramePool(self):
+        """
+        test reading frames into recycled buffers
+        """
+        video = Video.getVideo()
+        video.framePoolSize = 3
+        video.open(testenv.testMedia + "emptyBoard001.avi")
+        buffers = set()
+        kept = []
+        for frame in range(0, 52):
+            ret, image, quit = video.readFrame()
+            assert ret
+            buffers.add(id(image))
+            if frame == 10:
+                # a view of a frame in use keeps its buffer from being recycled
+                kept.append(image[10:20, 10:20])
+                keptImage = image.copy()
+        # the pool is created from the first frame - the frames not referred to any more are recycled
+        assert isinstance(video.framePool, FramePool)
+        assert len(buffers) == 4
+        assert video.framePool.misses == 0
+        assert video.framePool.acquired == 51
+        assert (kept[0] == keptImage[10:20, 10:20]).all()
+        video.close()
+
+    def test_FramePoolSize(self):
+        """
+        test that the frame pool is sized from the frames read and not from the size reported by the capture
+        """
+
+        class RegionCapture:
+            """a capture that reports a larger size than the frames it reads e.g. the screen capture"""
+
+            def read(self, image=None):
+                if image is None:
+                    image = np.empty((60, 80, 3), np.uint8)
+                image[:] = 128
+                return True, image
+
+            def get(self, propId):
+                return {
+                    cv2.CAP_PROP_FRAME_WIDTH: 1920,
+                    cv2.CAP_PROP_FRAME_HEIGHT: 1080,
+                }.get(propId, 0)
+
+        video = Video.getVideo()
+        video.framePoolSize = 2
+        video.setup(RegionCapture())
+        for frame in range(10):
+            ret, image = video.readCap()
+            assert image.shape == (60, 80, 3)
+        assert video.framePool.shape == (60, 80, 3)
+        assert video.framePool.misses == 0
+        # only the last frame is still in use
+        assert video.framePool.inUse() == 1
+        del image
+        assert video.framePool.inUse() == 0
+
+    def test_Seek(self):
+        """
+        test seeking to a frame and to a time in a video
+        """
+        path = testenv.testMedia + "emptyBoard001.avi"
+        video = Video.getVideo()
+        video.open(path)
+        images = []
+        for frame in range(0, 45):
+            ret, image, quit = video.readFrame()
+            images.append(image.copy())
+        video.close()
+        video.open(path)
+        assert video.seekFrame(40) == 40
+        ret, image, quit = video.readFrame()
+        assert ret
+        assert (image == images[40]).all()
+        assert video.frames == 41
+        # emptyBoard001.avi has 20 fps
+        assert video.seekTime(1.0) == 20
+        ret, image, quit = video.readFrame()
+        assert (image == images[20]).all()
+        # skip by grabbing
+        video.seekFrame(0)
+        assert video.skipFrames(10) == 10
+        ret, image, quit = video.readFrame()
+        assert (image == images[10]).all()
+        video.close()
+
+    def test_Recorder(self):
+        """
+        test recording a video in a separate writer thread
+        """
+        video = Video.getVideo()
+        video.open(testenv.testMedia + "emptyBoard001.avi")
+        filename = "/tmp/emptyBoard001-recorded.avi"
+        recorder = video.prepareRecording(filename, video.width, video.height)
+        assert isinstance(recorder, VideoRecorder)
+        assert recorder.buffer.policy == BufferPolicy.BLOCK
+        while True:
+            ret, image, quit = video.readFrame()
+            if not ret:
+                break
+            recorder.write(image)
+        video.close()
+        recorder.release()
+        print(recorder)
+        assert recorder.written == 52
+        assert recorder.buffer.dropped == 0
+        recorded = Video.getVideo()
+        recorded.open(filename)
+        recorded.play()
+        assert recorded.frames == 52
+
+    def test_ImageSequence(self):
+        """
+        test reading a directory of still images as a video
+        """
+        paths = ImageSequenceCapture.fromDirectory(testenv.testMedia).paths
+        assert len(paths) >= 13
+        for reduce in [1, 2]:
+            video = Video.getVideo()
+            video.prefetch = 4
+            video.imageReduction = reduce
+            video.capture(testenv.testMedia)
+            assert not video.isLive()
+            for path in paths:
+                ret, image, quit = video.readFrame()
+                assert ret
+                expected = cv2.imread(path)
+                height, width = expected.shape[:2]
+                assert image.shape[:2] == (
+                    math.ceil(height / reduce),
+                    math.ceil(width / reduce),
+                )
+                if reduce == 1:
+                    assert (image == expected).all()
+            ret, image, quit = video.readFrame()
+            assert not ret
+            assert video.seekFrame(2) == 2
+            ret, image, quit = video.readFrame()
+            assert image.shape[:2] == cv2.imread(paths[2], video.cap.flags).shape[:2]
+            video.close()
+
+    def test_ImageSequenceSkipsUnreadable(self):
+        """
+        test that an image that can not be decoded does not end the sequence
+        """
+        paths = ImageSequenceCapture.fromDirectory(testenv.testMedia).paths[:3]
+        Environment.checkDir(Environment.debugImagePath)
+        corrupt = Environment.debugImagePath + "corrupt.jpg"
+        with open(corrupt, "w") as corruptFile:
+            corruptFile.write("no image")
+        cap = ImageSequenceCapture([corrupt] + paths + [corrupt], prefetch=2)
+        for path in paths:
+            ret, image = cap.read()
+            assert ret
+            assert (image == cv2.imread(path)).all()
+        ret, image = cap.read()
+        assert not ret
+        assert cap.skipped == [corrupt, corrupt]
+        cap.release()
+
+    def test_FramePipeline(self):
+        """
+        test generating frames and chaining processing stages
+        """
+        path = testenv.testMedia + "emptyBoard001.avi"
+        video = Video.getVideo()
+        video.open(path)
+        indices = [videoFrame.index for videoFrame in video.genFrames()]
+        assert indices == list(range(1, 53))
+        video.close()
+        video.open(path)
+        video.frames = 0
+        # skip 3 frames by grabbing before each frame
+        indices = [videoFrame.index for videoFrame in video.genFrames(skip=3)]
+        assert indices == list(range(4, 53, 4))
+        video.close()
+        video.frames = 0
+        video.open(path)
+        recorder = video.prepareRecording("/tmp/emptyBoard001-pipeline.avi", 64, 64)
+        points = [[100, 100], [300, 100], [300, 300], [100, 300]]
+        frames = FramePipeline.genSkip(video.genFrames(), 2)
+        frames = FramePipeline.genWarp(frames, video, np.array(points), 90)
+        frames = FramePipeline.genResize(frames, 64, 64)
+        frames = FramePipeline.genTee(frames, recorder)
+        frames = FramePipeline.genShow(frames, video, every=10)
+        count = 0
+        for videoFrame in frames:
+            assert videoFrame.index % 2 == 0
+            assert videoFrame.image.shape == (64, 64, 3)
+            count += 1
+        recorder.release()
+        video.close()
+        assert count == 26
+        assert recorder.written == 26
+        # a still image is repeated while paused
+        video = Video.getVideo()
+        video.capture(testenv.testMedia + "chessBoard001.jpg")
+        frames = video.genFrames()
+        first = next(frames)
+        assert next(frames) is first
+        # a fresh generator of a paused video repeats the current frame
+        assert next(video.genFrames()).image is first.image
+        video.close()
+
+    def test_Still(self):
+        """
+        test taking a still image with the frame pipeline
+        """
+        path = testenv.testMedia + "emptyBoard001.avi"
+        video = Video.getVideo()
+        video.open(path)
+        filename = "/tmp/emptyBoard001-still.jpg"
+        ret, frame = video.still2File(
+            filename, printHints=False, postProcess=lambda image: image[:10, :20]
+        )
+        assert ret
+        assert frame.shape[:2] == (10, 20)
+        assert cv2.imread(filename).shape[:2] == (10, 20)
+        video.open(path)
+        # a failing post processing passes on the original image and is logged
+        with self.assertLogs("pcwawc.video", level="ERROR") as logs:
+            ret, frame = video.still2File(
+                filename, printHints=False, postProcess=lambda image: 1 / 0
+            )
+        assert "ZeroDivisionError" in logs.output[0]
+        assert ret
+        assert frame.shape[:2] == (video.height, video.width)
+
+    def test_WarpMap(self):
+        """
+        test the fused warp, square and rotate transformation against the separate steps
+        """
+        video = Video.getVideo()
+        for imageInfo in testenv.imageInfos:
+            image = video.readImage(imageInfo.path)
+            points = np.array(imageInfo.warpPoints)
+            for rotation in [0, 90, 180, 270]:
+                startt = timer()
+                warped = perspective.four_point_transform(image, points)
+                height, width = warped.shape[:2]
+                side = min(width, height)
+                warped = cv2.resize(warped, (side, side))
+                if rotation > 0:
+                    warped = video.rotate(warped, rotation)
+                separate = timer() - startt
+                fused = video.warpAndRotate(image, points, rotation)
+                startt = timer()
+                fused = video.warpAndRotate(image, points, rotation)
+                cached = timer() - startt
+                assert fused.shape == warped.shape
+                diff = cv2.absdiff(fused, warped)
+                print(
+                    "%s %3d°: %.1f ms separate, %.1f ms fused mean diff %.1f"
+                    % (
+                        imageInfo.title,
+                        rotation,
+                        separate * 1000,
+                        cached * 1000,
+                        diff.mean(),
+                    )
+                )
+                # borders may differ by the resampling
+                assert diff[2:-2, 2:-2].mean() < 3
+        assert len(video.warpMaps) <= Video.warpMapCacheSize
@@ -34,10 +34,15 @@ class ChessVisionTest(TestCase):
             vision.showDebug = debug
             vision.open(args.args.input)
             frameIndex = 0
+            pipeline = None
             while True:
                 cbImageSet = vision.readChessBoardImage()
                 if not vision.hasImage:
                     break
+                # the frame pipeline is built once for the opened video
+                if pipeline is None:
+                    pipeline = vision.pipeline
+                assert vision.pipeline is pipeline
                 frameIndex += 1
                 cbImage = cbImageSet.cbImage
                 if debug:
@@ -48,3 +53,135 @@ class ChessVisionTest(TestCase):
                     print("%3d %.2fs" % (cbImageSet.frameIndex, cbImageSet.timeStamp))
             assert frameIndex == expectedFrames[index]
             vision.save()
+
+    def test_ReadAviThreaded(self):
+        """
+        test reading a video via the threaded capture
+        """
+        args = Args("test")
+        device = testEnv.testMedia + "emptyBoard001.avi"
+        args.parse(["--input", device, "--threaded", "--buffersize", "2"])
+        vision = ChessBoardVision(args.args)
+        vision.open(args.args.input)
+        frameIndex = 0
+        previousTimeStamp = -1
+        while True:
+            cbImageSet = vision.readChessBoardImage()
+            if not vision.hasImage:
+                break
+            frameIndex += 1
+            assert cbImageSet.frameIndex == frameIndex
+            assert cbImageSet.timeStamp >= previousTimeStamp
+            assert cbImageSet.droppedFrames == 0
+            previousTimeStamp = cbImageSet.timeStamp
+        vision.close()
+        assert frameIndex == 52
+
+    def test_Speedup(self):
+        """
+        test skipping frames for the speedup with and without threaded capture
+        """
+        device = testEnv.testMedia + "emptyBoard001.avi"
+        for threaded in [False, True]:
+            args = Args("test")
+            argv = ["--input", device, "--speedup", "4"]
+            if threaded:
+                argv.append("--threaded")
+            args.parse(argv)
+            vision = ChessBoardVision(args.args)
+            vision.open(args.args.input)
+            frameIndex = 0
+            while True:
+                cbImageSet = vision.readChessBoardImage()
+                if not vision.hasImage:
+                    break
+                frameIndex += 1
+                assert cbImageSet.frameIndex == frameIndex
+            vision.close()
+            # 52 frames with a speedup of 4
+            assert frameIndex == 13
+
+    def test_AutoSpeedup(self):
+        """
+        test adapting the speedup to the processing latency
+        """
+        args = Args("test")
+        device = testEnv.testMedia + "emptyBoard001.avi"
+        args.parse(["--input", device, "--autospeedup"])
+        vision = ChessBoardVision(args.args)
+        vision.open(args.args.input)
+        assert vision.currentSpeedup() == 1
+        # simulate a processing time of 0.2 s per frame for the 20 fps video
+        vision.latency.push(0.2)
+        assert vision.currentSpeedup() == 4
+        cbImageSet = vision.readChessBoardImage()
+        assert vision.video.frames == 4
+        vision.close()
+
+    def test_Crop(self):
+        """
+        test cropping the captured images to the board region
+        """
+        device = testEnv.testMedia + "emptyBoard001.avi"
+        warp = "[[140, 60], [500, 80], [520, 420], [120, 400]]"
+        warpedImages = {}
+        for crop in [False, True]:
+            args = Args("test")
+            argv = ["--input", device, "--warp", warp, "--rotation", "90"]
+            if crop:
+                argv.append("--crop")
+            args.parse(argv)
+            vision = ChessBoardVision(args.args)
+            vision.open(args.args.input)
+            warpedImages[crop] = []
+            for frame in range(5):
+                cbImageSet = vision.readChessBoardImage()
+                if crop:
+                    # the cropped image is a view of the captured image
+                    assert cbImageSet.cbImage.image.base is cbImageSet.capturedImage
+                    assert cbImageSet.offset == (120 - 16, 60 - 16)
+                    assert cbImageSet.cbImage.image.shape[:2] == (360 + 33, 400 + 33)
+                cbImageSet.warpAndRotate()
+                warpedImages[crop].append(cbImageSet.cbWarped.image)
+            if crop:
+                # the crop follows the warp points
+                vision.warp.pointList = [[200, 100], [400, 100], [400, 300], [200, 300]]
+                vision.warp.updatePoints()
+                cbImageSet = vision.readChessBoardImage()
+                assert cbImageSet.offset == (200 - 16, 100 - 16)
+                # the debug display already shows the cropped region
+                shown = []
+                vision.showDebug = True
+                vision.video.showImage = lambda image, title: not shown.append(image)
+                cbImageSet = vision.readChessBoardImage()
+                assert len(shown) == 1 and shown[0] is cbImageSet.cbImage.image
+                assert shown[0].shape[:2] == (200 + 33, 200 + 33)
+            vision.close()
+        for uncropped, cropped in zip(warpedImages[False], warpedImages[True]):
+            assert (uncropped == cropped).all()
+
+    def test_FramePool(self):
+        """
+        test that the frames of image sets still in use are not recycled by the frame pool
+        """
+        device = testEnv.testMedia + "emptyBoard001.avi"
+        warp = "[[140, 60], [500, 80], [520, 420], [120, 400]]"
+        args = Args("test")
+        args.parse(["--input", device, "--warp", warp, "--crop", "--framepool", "8"])
+        vision = ChessBoardVision(args.args)
+        vision.open(args.args.input)
+        kept = []
+        while True:
+            cbImageSet = vision.readChessBoardImage()
+            if not vision.hasImage:
+                break
+            if cbImageSet.frameIndex % 10 == 0:
+                # keep the cropped view of the captured image e.g. as the GUI does
+                kept.append((cbImageSet.cbImage.image, cbImageSet.cbImage.image.copy()))
+        pool = vision.video.framePool
+        vision.close()
+        assert len(kept) == 5
+        for image, copy in kept:
+            assert (image == copy).all()
+        # the kept frames use up some of the buffers but the others are still recycled
+        assert pool.misses == 0